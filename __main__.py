@@ -6,7 +6,7 @@
 
 """__main__.py: main entry point for the package"""
 
-from game import Game
+from game.game import Game
 
 g = Game()
 g.run()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python2
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""chunked_map_memory.py: memory used by paths on a chunked map
+
+Writes a chunked map with randomly scattered blocked tiles, loads it with
+a small chunk budget and prints how much the resident memory of the
+process grew by loading it and by the first path searches across it (and
+the peak during those). Run it once per path mode, the memory a mode
+used is not given back to the system reliably."""
+
+import argparse
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import numpy as np
+
+from game import mapfile
+from game.map import Map
+from game.pathfinding import PATH_MODES
+
+
+def _rss():
+    """Resident set size of the process in bytes (Linux)."""
+    fh = open('/proc/self/statm')
+    try:
+        return int(fh.read().split()[1]) * resource.getpagesize()
+    finally:
+        fh.close()
+
+
+def _max_rss():
+    """Maximum resident set size of the process in bytes (Linux)."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _write_map(path, size, chunk_size, seed):
+    tiles = (np.random.RandomState(seed).rand(size, size) < 0.05) \
+        .astype(np.uint16)
+    tiles[:, [0, -1]] = 0
+    tiles[[0, -1], :] = 0
+    mapfile.write_map(path, tiles, chunk_size)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-s', '--size', type=int, default=2048,
+                        help="width and height of the map in tiles "
+                             "(default 2048)")
+    parser.add_argument('-c', '--chunk-size', type=int, default=64,
+                        help="chunk size in tiles (default 64)")
+    parser.add_argument('-b', '--budget', type=int, default=1,
+                        help="chunk budget in MB (default 1)")
+    parser.add_argument('-m', '--mode', choices=sorted(PATH_MODES),
+                        help="path mode (default by map size)")
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    map_dir = tempfile.mkdtemp()
+    try:
+        _write_map(os.path.join(map_dir, 'chunked' + mapfile.EXTENSION),
+                   args.size, args.chunk_size, args.seed)
+        start = _rss()
+        game_map = Map(path_mode=args.mode,
+                       chunk_budget=args.budget * 1024 * 1024)
+        game_map.load('chunked', map_dir + os.sep)
+        loaded = _rss()
+
+        far = args.size * 16 - 8
+        search_start = time.time()
+        for to_pos in ((far, far), (far, 8), (8, far)):
+            game_map.find_path((8, 8), to_pos)
+        search_time = time.time() - search_start
+        searched = _rss()
+    finally:
+        shutil.rmtree(map_dir)
+
+    megabyte = 1024.0 * 1024
+    print("%s, %d x %d tiles (%.1f MB of tiles)"
+          % (type(game_map.pathfinder).__name__, args.size, args.size,
+             args.size * args.size * 2 / megabyte))
+    print("load:     %7.1f MB" % ((loaded - start) / megabyte))
+    print("searches: %7.1f MB more, %.0f ms"
+          % ((searched - loaded) / megabyte, search_time * 1000))
+    print("peak:     %7.1f MB above the start"
+          % ((_max_rss() - start) / megabyte))
+
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
@@ -0,0 +1,91 @@
+#!/usr/bin/env python2
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""cross_map_paths.py: time cross-map path searches of every path mode
+
+Builds an open map, a map tiled with the default map and maps with
+randomly scattered blocked tiles, then searches routes between opposite
+corners and edges with every pathfinding mode. Prints the time of the
+first search, which includes building tables or the abstract graph, and
+of the slowest search once every route was searched before."""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import numpy as np
+
+from game import mapfile
+from game.map import Map
+from game.pathfinding import create_pathfinder, PATH_MODES
+
+
+def _maps(size, seed):
+    tile = mapfile.read_text_map(os.path.join(
+        os.path.dirname(__file__), '..', 'content', 'maps', 'default.map'))
+    tile = np.in1d(tile, list(Map.BLOCKING_TILES)).reshape(tile.shape)
+    reps_y = -(-size // tile.shape[0])
+    reps_x = -(-size // tile.shape[1])
+    rng = np.random.RandomState(seed)
+    return [
+        ('open', np.zeros((size, size), dtype=bool)),
+        ('tiled', np.tile(tile, (reps_y, reps_x))[:size, :size]),
+        ('random 1%', rng.rand(size, size) < 0.01),
+        ('random 5%', rng.rand(size, size) < 0.05),
+    ]
+
+
+def bench(mode, blocked, pairs):
+    size_y, size_x = blocked.shape
+    blocked = blocked.copy()
+    for from_tile, to_tile in pairs:
+        blocked[from_tile[1], from_tile[0]] = False
+        blocked[to_tile[1], to_tile[0]] = False
+    pathfinder = create_pathfinder(size_x, size_y, mode)
+    pathfinder.set_all_blocked(blocked.astype(np.uint8).tobytes())
+
+    start = time.time()
+    pathfinder.find_route(*pairs[0])
+    first = time.time() - start
+    for from_tile, to_tile in pairs[1:]:
+        pathfinder.find_route(from_tile, to_tile)
+
+    slowest = 0
+    for from_tile, to_tile in pairs:
+        start = time.time()
+        pathfinder.find_route(from_tile, to_tile)
+        slowest = max(slowest, time.time() - start)
+    return first, slowest
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-s', '--size', type=int, default=1024,
+                        help="width and height of the maps in tiles "
+                             "(default 1024)")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('modes', nargs='*', default=sorted(PATH_MODES),
+                        help="path modes to compare (default all)")
+    args = parser.parse_args()
+
+    last = args.size - 1
+    pairs = [((0, 0), (last, last)), ((0, last), (last, 0)),
+             ((0, last // 2), (last, last // 2)),
+             ((last // 2, 0), (last // 2, last))]
+
+    print("%-10s %-12s %10s %10s" % ('map', 'mode', 'first', 'slowest'))
+    for name, blocked in _maps(args.size, args.seed):
+        for mode in args.modes:
+            first, slowest = bench(mode, blocked, pairs)
+            print("%-10s %-12s %8.1fms %8.1fms"
+                  % (name, mode, first * 1000, slowest * 1000))
+
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
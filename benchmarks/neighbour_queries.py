@@ -0,0 +1,82 @@
+#!/usr/bin/env python2
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""neighbour_queries.py: time nearest unit and radius queries
+
+Creates units and asks for the k nearest other units and the units within
+a radius around some of them, one query at a time through the spatial
+index and batched through ObjectManager.nearest_many/query_radius_many."""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from pygame import Rect
+
+from game.gameobjects.gameobjects import Unit
+from game.gameobjects.management import ObjectManager, SPATIAL_INDEXES
+
+
+def bench(index, count, queries, k, radius, size, seed):
+    rng = random.Random(seed)
+    manager = ObjectManager(Rect(0, 0, size, size), index=index)
+    units = [manager.create(Unit, Rect(rng.randrange(size - 16),
+                                       rng.randrange(size - 16), 16, 16))
+             for _ in range(count)]
+    askers = rng.sample(units, queries)
+    points = [unit.bbox.center for unit in askers]
+
+    results = []
+    start = time.time()
+    for unit, point in zip(askers, points):
+        manager.nearest(point, k, exclude=unit)
+    results.append(time.time() - start)
+    start = time.time()
+    manager.nearest_many(points, k, exclude=askers)
+    results.append(time.time() - start)
+
+    start = time.time()
+    for point in points:
+        manager.query_radius(point, radius)
+    results.append(time.time() - start)
+    start = time.time()
+    manager.query_radius_many(points, radius)
+    results.append(time.time() - start)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-n', '--units', type=int, default=20000,
+                        help="number of units (default 20000)")
+    parser.add_argument('-q', '--queries', type=int, default=2000,
+                        help="number of queries (default 2000)")
+    parser.add_argument('-k', type=int, default=8,
+                        help="number of nearest units (default 8)")
+    parser.add_argument('-r', '--radius', type=int, default=48,
+                        help="radius of the radius queries (default 48)")
+    parser.add_argument('-s', '--size', type=int, default=4096,
+                        help="width and height of the area (default 4096)")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('indexes', nargs='*', default=sorted(SPATIAL_INDEXES),
+                        help="indexes to compare (default all)")
+    args = parser.parse_args()
+
+    print("%-10s %10s %10s %10s %10s"
+          % ('index', 'nearest', 'batched', 'radius', 'batched'))
+    for name in args.indexes:
+        print("%-10s %9.3fs %9.3fs %9.3fs %9.3fs"
+              % ((name,) + tuple(bench(name, args.units, args.queries,
+                                       args.k, args.radius, args.size,
+                                       args.seed))))
+
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
@@ -0,0 +1,114 @@
+#!/usr/bin/env python2
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""path_workers.py: time route searches in PathWorkerPools of every size
+
+Tiles a map with the default map and searches routes between random
+walkable tiles in the main process and in pools of 1, 2, 4, ... worker
+processes up to one per cpu. Prints the searches per second and the
+speedup over searching in the main process."""
+
+import argparse
+import multiprocessing
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import numpy as np
+
+from game import mapfile
+from game.map import Map
+from game.pathfinding import create_pathfinder, PATH_MODES
+from game.pathworkers import PathWorkerPool
+
+
+def _blocked(size):
+    tile = mapfile.read_text_map(os.path.join(
+        os.path.dirname(__file__), '..', 'content', 'maps', 'default.map'))
+    tile = np.in1d(tile, list(Map.BLOCKING_TILES)).reshape(tile.shape)
+    reps_y = -(-size // tile.shape[0])
+    reps_x = -(-size // tile.shape[1])
+    return np.tile(tile, (reps_y, reps_x))[:size, :size]
+
+
+def _pairs(blocked, count, seed):
+    rng = random.Random(seed)
+    free_y, free_x = np.nonzero(~blocked)
+    free = zip(free_x.tolist(), free_y.tolist())
+    return [(rng.choice(free), rng.choice(free)) for _ in range(count)]
+
+
+def bench_local(mode, blocked, pairs):
+    size_y, size_x = blocked.shape
+    pathfinder = create_pathfinder(size_x, size_y, mode)
+    pathfinder.set_all_blocked(blocked.astype(np.uint8).tobytes())
+    # build tables and abstract graphs before timing
+    pathfinder.find_route(*pairs[0])
+    start = time.time()
+    for from_tile, to_tile in pairs:
+        pathfinder.find_route(from_tile, to_tile)
+    return time.time() - start
+
+
+def bench_pool(mode, blocked, pairs, processes):
+    size_y, size_x = blocked.shape
+    blocked_y, blocked_x = np.nonzero(blocked)
+    pool = PathWorkerPool(size_x, size_y,
+                          zip(blocked_x.tolist(), blocked_y.tolist()),
+                          mode, processes=processes)
+    try:
+        # every worker builds its pathfinder before timing
+        for _ in range(processes):
+            pool.submit(*pairs[0])
+            pool.flush()
+        while len(pool):
+            pool.wait()
+
+        start = time.time()
+        for from_tile, to_tile in pairs:
+            pool.submit(from_tile, to_tile)
+        pool.flush()
+        while len(pool):
+            pool.wait()
+        return time.time() - start
+    finally:
+        pool.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-s', '--size', type=int, default=256,
+                        help="width and height of the map in tiles "
+                             "(default 256)")
+    parser.add_argument('-n', '--searches', type=int, default=1000,
+                        help="number of routes to search (default 1000)")
+    parser.add_argument('-m', '--mode', default='astar',
+                        choices=sorted(PATH_MODES),
+                        help="path mode (default astar)")
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    blocked = _blocked(args.size)
+    pairs = _pairs(blocked, args.searches, args.seed)
+
+    local = bench_local(args.mode, blocked, pairs)
+    print("%-12s %12s %8s" % ('processes', 'searches/s', 'speedup'))
+    print("%-12s %12.0f %8.2f" % ('main', len(pairs) / local, 1.0))
+    processes = 1
+    while True:
+        elapsed = bench_pool(args.mode, blocked, pairs, processes)
+        print("%-12d %12.0f %8.2f"
+              % (processes, len(pairs) / elapsed, local / elapsed))
+        if processes >= multiprocessing.cpu_count():
+            break
+        processes = min(processes * 2, multiprocessing.cpu_count())
+
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
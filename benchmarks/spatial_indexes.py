@@ -0,0 +1,114 @@
+#!/usr/bin/env python2
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""spatial_indexes.py: compare the spatial indexes of ObjectManager
+
+Inserts objects spread over the area and packed into a cluster, then runs
+mixes of small moves and area/point queries on every index and prints
+the time taken per phase. The last phase queries screen sized views into
+one reused set, like a frame does."""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from pygame import Rect
+
+from game.gameobjects.management import SPATIAL_INDEXES
+
+
+class _Object(object):
+    def __init__(self, bbox):
+        self.bbox = bbox
+
+
+def _random_objects(rng, area, count, cluster):
+    objs = []
+    for _ in range(count - cluster):
+        size = rng.choice((8, 16, 16, 32))
+        objs.append(_Object(Rect(rng.randrange(area.width - size),
+                                 rng.randrange(area.height - size),
+                                 size, size)))
+    for _ in range(cluster):
+        objs.append(_Object(Rect(area.centerx + rng.randrange(64),
+                                 area.centery + rng.randrange(64), 16, 16)))
+    return objs
+
+
+def _run_mix(index, rng, area, objs, ops, query_share):
+    """Run ops operations, query_share of them queries, the rest moves."""
+    for _ in range(ops):
+        if rng.random() < query_share:
+            if rng.random() < 0.5:
+                index.query_intersect(Rect(rng.randrange(area.width),
+                                           rng.randrange(area.height),
+                                           rng.randrange(16, 256),
+                                           rng.randrange(16, 256)))
+            else:
+                index.query_at((rng.randrange(area.width),
+                                rng.randrange(area.height)))
+        else:
+            obj = rng.choice(objs)
+            new_bbox = obj.bbox.move(rng.randint(-4, 4), rng.randint(-4, 4))
+            if area.contains(new_bbox):
+                index.move_to(obj, new_bbox)
+
+
+def bench(name, area, count, ops, seed):
+    rng = random.Random(seed)
+    objs = _random_objects(rng, area, count, count // 5)
+    index = SPATIAL_INDEXES[name](area)
+    results = []
+
+    start = time.time()
+    for obj in objs:
+        index.insert(obj)
+    results.append(time.time() - start)
+
+    for query_share in (0.0, 0.5, 1.0):
+        start = time.time()
+        _run_mix(index, rng, area, objs, ops, query_share)
+        results.append(time.time() - start)
+
+    visible = set()
+    start = time.time()
+    for _ in range(ops // 100):
+        visible.clear()
+        index.query_intersect(Rect(rng.randrange(area.width - 1024),
+                                   rng.randrange(area.height - 768),
+                                   1024, 768), visible)
+    results.append(time.time() - start)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-n', '--objects', type=int, default=5000,
+                        help="number of objects (default 5000)")
+    parser.add_argument('-o', '--ops', type=int, default=20000,
+                        help="operations per mix (default 20000)")
+    parser.add_argument('-s', '--size', type=int, default=2000,
+                        help="width and height of the area (default 2000)")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('indexes', nargs='*', default=sorted(SPATIAL_INDEXES),
+                        help="indexes to compare (default all)")
+    args = parser.parse_args()
+
+    area = Rect(0, 0, args.size, args.size)
+    print("%-10s %10s %10s %10s %10s %10s"
+          % ('index', 'insert', 'moves', 'mixed', 'queries', 'views'))
+    for name in args.indexes:
+        print("%-10s %9.3fs %9.3fs %9.3fs %9.3fs %9.3fs"
+              % ((name,) + tuple(bench(name, area, args.objects, args.ops,
+                                       args.seed))))
+
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
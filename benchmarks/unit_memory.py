@@ -0,0 +1,96 @@
+#!/usr/bin/env python2
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""unit_memory.py: memory per unit and allocations per tick
+
+Creates units, sends them to random destinations and prints the bytes
+used per unit (the objects themselves and the process as a whole), then
+runs ticks and prints how many bboxes were replaced by new Rects and how
+many objects the garbage collector tracks afterwards."""
+
+import argparse
+import gc
+import os
+import random
+import resource
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from pygame import Rect
+
+from game.gameobjects.gameobjects import Unit
+from game.gameobjects.management import ObjectManager, SPATIAL_INDEXES
+
+
+def _max_rss():
+    """Maximum resident set size of the process in bytes (Linux)."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _object_bytes(unit):
+    size = sys.getsizeof(unit) + sys.getsizeof(unit.bbox) + \
+        sys.getsizeof(unit._paths)
+    if hasattr(unit, '__dict__'):
+        size += sys.getsizeof(unit.__dict__)
+    return size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-n', '--units', type=int, default=100000,
+                        help="number of units (default 100000)")
+    parser.add_argument('-t', '--ticks', type=int, default=20,
+                        help="number of ticks (default 20)")
+    parser.add_argument('-s', '--size', type=int, default=8192,
+                        help="width and height of the area (default 8192)")
+    parser.add_argument('-i', '--index', default='grid',
+                        choices=sorted(SPATIAL_INDEXES),
+                        help="spatial index (default 'grid')")
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    size = args.size
+    manager = ObjectManager(Rect(0, 0, size, size), index=args.index)
+    rss_start = _max_rss()
+    units = []
+    for _ in range(args.units):
+        units.append(manager.create(Unit, Rect(rng.randrange(size - 16),
+                                               rng.randrange(size - 16),
+                                               16, 16)))
+    rss_units = _max_rss()
+    store = manager.units
+    store_bytes = sum(getattr(store, name).itemsize
+                      for name in store.FIELDS)
+    print("bytes per unit: %d object + bbox + order list, %d arrays, "
+          "%d process" % (_object_bytes(units[0]), store_bytes,
+                          (rss_units - rss_start) // args.units))
+
+    for unit in units:
+        unit.send_to((rng.randrange(8, size - 8), rng.randrange(8, size - 8)))
+    gametime = 0
+    manager.update(gametime)
+
+    bboxes = [id(unit.bbox) for unit in units]
+    gc.collect()
+    tracked = len(gc.get_objects())
+    rss_ticks = _max_rss()
+    for _ in range(args.ticks):
+        gametime += 10
+        manager.update(gametime)
+    replaced = sum(1 for unit, bbox in zip(units, bboxes)
+                   if id(unit.bbox) != bbox)
+    gc.collect()
+    print("per tick: %.1f bboxes replaced, %.1f objects kept, "
+          "%d bytes peak memory growth"
+          % (float(replaced) / args.ticks,
+             float(len(gc.get_objects()) - tracked) / args.ticks,
+             (_max_rss() - rss_ticks) // args.ticks))
+
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
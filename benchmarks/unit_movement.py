@@ -0,0 +1,80 @@
+#!/usr/bin/env python2
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""unit_movement.py: time ObjectManager.update with many moving units
+
+Sends all units to random destinations (straight lines, no map) and
+prints the time per tick of the vectorized movement step alone and of the
+whole update including the spatial index."""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from pygame import Rect
+
+from game.gameobjects.gameobjects import Unit
+from game.gameobjects.management import ObjectManager, SPATIAL_INDEXES
+
+
+def bench(index, count, ticks, size, tick_time, seed):
+    rng = random.Random(seed)
+    area = Rect(0, 0, size, size)
+    manager = ObjectManager(area, index=index)
+    for _ in range(count):
+        unit = manager.create(Unit, Rect(rng.randrange(size - 16),
+                                         rng.randrange(size - 16), 16, 16))
+        unit.send_to((rng.randrange(8, size - 8), rng.randrange(8, size - 8)))
+    gametime = 0
+    # start the moves
+    manager.update(gametime)
+
+    step_time = 0.0
+    start = time.time()
+    for _ in range(ticks):
+        gametime += tick_time
+        manager.update(gametime)
+    update_time = time.time() - start
+
+    # the step alone, without updating the index
+    for _ in range(ticks):
+        gametime += tick_time
+        step_start = time.time()
+        manager.units.step(gametime)
+        step_time += time.time() - step_start
+    return (step_time / ticks, update_time / ticks,
+            int(manager.units.moving.sum()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-n', '--units', type=int, default=100000,
+                        help="number of units (default 100000)")
+    parser.add_argument('-t', '--ticks', type=int, default=20,
+                        help="number of ticks (default 20)")
+    parser.add_argument('-s', '--size', type=int, default=8192,
+                        help="width and height of the area (default 8192)")
+    parser.add_argument('--tick-time', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('indexes', nargs='*', default=sorted(SPATIAL_INDEXES),
+                        help="indexes to compare (default all)")
+    args = parser.parse_args()
+
+    print("%-10s %12s %12s %8s" % ('index', 'step/tick', 'update/tick',
+                                   'moving'))
+    for name in args.indexes:
+        step, update, moving = bench(name, args.units, args.ticks,
+                                     args.size, args.tick_time, args.seed)
+        print("%-10s %10.2fms %10.2fms %8d"
+              % (name, step * 1000, update * 1000, moving))
+
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
@@ -1 +0,0 @@
-from game import Game
\ No newline at end of file
@@ -17,7 +17,7 @@ class Camera(object):
 
     def __init__(self, view_size):
         self.view_rect = Rect((0, 0), view_size)
-        self.move_event = EventManager.new_event_code()
+        self.move_event = EventManager.new_event_code(coalesce=True)
 
         self._moving = False
         self._move_vector = [0, 0]
@@ -42,6 +42,14 @@ class Camera(object):
             self._move_vector[1] = y
         self._moving = True
 
+    @property
+    def move_direction(self):
+        """Direction (x, y) the camera is moving in, (0, 0) if it is not
+        moving."""
+        if not self._moving:
+            return 0, 0
+        return tuple(self._move_vector)
+
     def stop_moving(self):
         self._move_vector = [0, 0]
         self._moving = False
@@ -0,0 +1,143 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""chunks.py: streaming of chunked maps"""
+
+from collections import OrderedDict
+
+import numpy as np
+
+
+class ChunkCache(object):
+    """Keeps recently used chunks of a chunked map in memory.
+
+    chunks is an array of shape (chunks_y, chunks_x, layers, chunk_size,
+    chunk_size) as returned by mapfile.open_chunked_map. A chunk is copied
+    out of it when it is first used, the least recently used chunks are
+    dropped while more than budget bytes are loaded. Changed chunks are
+    never dropped, since they can not be read again."""
+
+    def __init__(self, chunks, tiles_x, tiles_y, budget=64 * 1024 * 1024):
+        self.tiles_x = tiles_x
+        self.tiles_y = tiles_y
+        self.chunks_y, self.chunks_x, self.layers, self.chunk_size = \
+            chunks.shape[:4]
+        self.budget = budget
+        self.loads = 0
+        self.evictions = 0
+        self._chunks = chunks
+        self._chunk_bytes = chunks[0, 0].nbytes
+        # (chunk x, chunk y) -> array of shape (layers, size, size)
+        self._loaded = OrderedDict()
+        self._changed = set()
+
+    def __len__(self):
+        return len(self._loaded)
+
+    def __contains__(self, chunk):
+        return chunk in self._loaded
+
+    @property
+    def memory(self):
+        """Bytes used by the loaded chunks."""
+        return len(self._loaded) * self._chunk_bytes
+
+    def chunk_at(self, x, y):
+        """Get the coordinates of the chunk containing tile (x, y)."""
+        return x // self.chunk_size, y // self.chunk_size
+
+    def get(self, cx, cy):
+        """Get chunk (cx, cy), loading it if needed."""
+        key = (cx, cy)
+        chunk = self._loaded.get(key)
+        if chunk is not None:
+            # mark as most recently used
+            del self._loaded[key]
+            self._loaded[key] = chunk
+            return chunk
+        chunk = np.array(self._chunks[cy, cx])
+        self.loads += 1
+        self._loaded[key] = chunk
+        # the caller may be about to change it, so it is not dropped yet
+        self._evict(key)
+        return chunk
+
+    def get_tile(self, x, y, layer=0):
+        """Get the tile at (x, y)."""
+        size = self.chunk_size
+        return self.get(x // size, y // size)[layer, y % size, x % size]
+
+    def set_tile(self, x, y, tile, layer=0):
+        """Change the tile at (x, y) in memory."""
+        size = self.chunk_size
+        key = (x // size, y // size)
+        self.get(*key)[layer, y % size, x % size] = tile
+        self._changed.add(key)
+
+    def area(self, min_x, min_y, max_x, max_y, layer=0):
+        """Get a copy of the tiles in [min_x, max_x) x [min_y, max_y)
+        (clipped to the map) as an array indexed [y, x]."""
+        min_x = max(0, min_x)
+        min_y = max(0, min_y)
+        max_x = min(self.tiles_x, max_x)
+        max_y = min(self.tiles_y, max_y)
+        result = np.zeros((max(0, max_y - min_y), max(0, max_x - min_x)),
+                          dtype=self._chunks.dtype)
+        size = self.chunk_size
+        for cy, cx in self._chunks_in(min_x, min_y, max_x, max_y):
+            chunk = self.get(cx, cy)[layer]
+            x0 = max(min_x, cx * size)
+            y0 = max(min_y, cy * size)
+            x1 = min(max_x, (cx + 1) * size)
+            y1 = min(max_y, (cy + 1) * size)
+            result[y0 - min_y:y1 - min_y, x0 - min_x:x1 - min_x] = \
+                chunk[y0 - cy * size:y1 - cy * size,
+                      x0 - cx * size:x1 - cx * size]
+        return result
+
+    def load_area(self, min_x, min_y, max_x, max_y):
+        """Make sure the chunks covering the tiles in [min_x, max_x) x
+        [min_y, max_y) are loaded."""
+        for cy, cx in self._chunks_in(max(0, min_x), max(0, min_y),
+                                      min(self.tiles_x, max_x),
+                                      min(self.tiles_y, max_y)):
+            self.get(cx, cy)
+
+    def iter_chunks(self, layer=0):
+        """Iterate over (min_x, min_y, tiles) of all chunks, tiles clipped
+        to the map. The chunks are read without keeping them loaded,
+        unless they are loaded already."""
+        size = self.chunk_size
+        for cy in range(self.chunks_y):
+            for cx in range(self.chunks_x):
+                chunk = self._loaded.get((cx, cy))
+                if chunk is None:
+                    chunk = self._chunks[cy, cx]
+                yield (cx * size, cy * size,
+                       chunk[layer, :min(size, self.tiles_y - cy * size),
+                             :min(size, self.tiles_x - cx * size)])
+
+    def clear(self):
+        """Drop all loaded chunks that have not been changed."""
+        for key in list(self._loaded):
+            if key not in self._changed:
+                del self._loaded[key]
+
+    def _chunks_in(self, min_x, min_y, max_x, max_y):
+        size = self.chunk_size
+        for cy in range(min_y // size, (max_y + size - 1) // size):
+            for cx in range(min_x // size, (max_x + size - 1) // size):
+                yield cy, cx
+
+    def _evict(self, keep):
+        """Drop unchanged chunks other than keep while over budget."""
+        if self.memory <= self.budget:
+            return
+        for key in list(self._loaded):
+            if key in self._changed or key == keep:
+                continue
+            del self._loaded[key]
+            self.evictions += 1
+            if self.memory <= self.budget:
+                return
\ No newline at end of file
@@ -11,10 +11,34 @@ class EventError(Exception):
     pass
 
 
+class BusEvent(object):
+    """Internal event, passed to the subscribers of its code.
+
+    Event records are reused once they are dispatched, so subscribers must
+    not keep them (attributes like pos may be kept)."""
+
+    def __init__(self):
+        self.code = None
+
+
 class EventManager(object):
-    """Manages event subscriptions."""
+    """Manages event subscriptions.
+
+    Internal events (codes from new_event_code) do not go through the
+    pygame event queue, they are dispatched by update after the pygame
+    events. For codes created with coalesce set only the last event posted
+    before a dispatch is passed on."""
 
     _event_code_counter = pygame.NUMEVENTS
+    _coalesced_codes = set()
+
+    EVENT_POOL_SIZE = 64
+
+    # internal events waiting for dispatch
+    _pending = []
+    # code -> pending event, for coalesced codes
+    _pending_by_code = {}
+    _free_events = [BusEvent() for _ in range(EVENT_POOL_SIZE)]
 
     def __init__(self):
         self._subscriptions = {}
@@ -51,18 +75,51 @@ class EventManager(object):
                     action(event)
             except KeyError:
                 pass
+        self.dispatch()
+
+    def dispatch(self):
+        """Call the subscribers of the pending internal events. Events
+        posted meanwhile are dispatched by the next call."""
+        pending = EventManager._pending
+        if not pending:
+            return
+        EventManager._pending = []
+        EventManager._pending_by_code.clear()
+        free_events = EventManager._free_events
+        for event in pending:
+            # None if replaced by a later event of a coalesced code
+            if event.code is not None:
+                self._handle_user_event(event)
+            event.__dict__.clear()
+            event.code = None
+            free_events.append(event)
 
     @staticmethod
     def post(code, **kwargs):
         if 'code' in kwargs:
             raise EventError("user events may not define a code attribute")
 
-        kwargs['code'] = code
-        pygame.event.post(pygame.event.Event(pygame.USEREVENT, kwargs))
+        pending_by_code = EventManager._pending_by_code
+        if code in EventManager._coalesced_codes:
+            old_event = pending_by_code.get(code)
+            if old_event is not None:
+                old_event.code = None
+        free_events = EventManager._free_events
+        event = free_events.pop() if free_events else BusEvent()
+        event.__dict__.update(kwargs)
+        event.code = code
+        EventManager._pending.append(event)
+        if code in EventManager._coalesced_codes:
+            pending_by_code[code] = event
 
     @staticmethod
-    def new_event_code():
+    def new_event_code(coalesce=False):
+        """Get a new code for internal events. If coalesce is set, only the
+        last event of the code posted before a dispatch is dispatched."""
         EventManager._event_code_counter += 1
+        if coalesce:
+            EventManager._coalesced_codes.add(
+                EventManager._event_code_counter)
         return EventManager._event_code_counter
 
     def _handle_user_event(self, event):
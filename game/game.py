@@ -4,6 +4,8 @@
 
 """game.py: manages all other modules of the game"""
 
+import os
+
 import pygame
 from pygame import Rect
 
@@ -11,19 +13,34 @@ from camera import Camera
 from events import EventManager
 from input import InputManager
 from rendering import Renderer
-from map import Map
-from gameobjects.management import ObjectManager
-from gameobjects.gameobjects import Unit
+from simulation import Simulation
 
 
 class Game(object):
     """Manages other game modules."""
 
-    def __init__(self, min_cycle_time=10):
+    def __init__(self, min_cycle_time=10, path_budget=4, path_workers=0,
+                 dirty_rects=False, tick_time=10, max_steps=5,
+                 headless=False):
+        """Create the game.
+
+        The simulation runs in ticks of tick_time milliseconds, at most
+        max_steps of them per rendered frame, frames take at least
+        min_cycle_time milliseconds. In headless mode nothing is rendered
+        and ticks run as fast as possible (and deterministically, see
+        Simulation).
+
+        path_budget is the time in milliseconds spent on path searches per
+        rendered frame, shared by its ticks. For path_workers see
+        Simulation. dirty_rects enables the dirty rect mode of the
+        Renderer."""
         self.min_cycle_time = min_cycle_time
+        self.path_budget = path_budget
+        self.tick_time = tick_time
+        self.max_steps = max_steps
+        self.headless = headless
 
         self._run = False
-        self._last_update = 0
 
         self._last_mouse_pos = None
         self._selecting = False
@@ -31,19 +48,30 @@ class Game(object):
         self._selection_rect = None
         self._mouse_right_down = False
 
+        if headless:
+            # the event queue still needs a video driver
+            os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
         pygame.init()
 
         screen_width, screen_height = screen_size = (1024, 768)
-        self._screen = pygame.display.set_mode(screen_size, pygame.DOUBLEBUF)
-
-        self._map = Map('default')
+        self._sim = Simulation('default', tick_time, path_budget,
+                               path_workers, deterministic=headless)
+        self._map = self._sim.map
+        self._objects = self._sim.objects
         self._camera = Camera(screen_size)
-        self._renderer = Renderer(self._screen, self._camera)
-        self._objects = ObjectManager(self._map.size)
+        if headless:
+            self._screen = None
+            self._renderer = None
+        else:
+            self._screen = pygame.display.set_mode(screen_size,
+                                                   pygame.DOUBLEBUF)
+            self._renderer = Renderer(self._screen, self._camera,
+                                      dirty_rects)
 
         self._event_mgr = EventManager()
         self._event_mgr.subscribe(pygame.QUIT, self._handle_quit)
         self._event_mgr.subscribe(self._camera.move_event, self._camera_moved)
+        self._objects.set_view(self._camera.view_rect)
 
         self._input = InputManager(self._event_mgr)
         self._input.set_keybind(pygame.K_ESCAPE, self.stop)
@@ -72,46 +100,81 @@ class Game(object):
         self._event_mgr.subscribe(self._input.rsclick,
                                   self._right_shiftclick)
 
-    def run(self):
-        """Run the main game loop."""
-        self._load()
-        self._last_update = pygame.time.get_ticks()
+    def run(self, ticks=None):
+        """Run the main game loop, stop after ticks ticks if set.
 
+        When the simulation falls behind more than max_steps ticks the
+        rest is dropped. Rendering interpolates object positions between
+        the last two ticks."""
+        self._load()
         self._run = True
-        while self._run:
-            gametime = pygame.time.get_ticks()
-            time_passed = gametime - self._last_update
+        if self.headless:
+            while self._run and (ticks is None or self.ticks < ticks):
+                self._tick()
+            self._shutdown()
+            return
+
+        last_time = pygame.time.get_ticks()
+        lag = 0
+        while self._run and (ticks is None or self.ticks < ticks):
+            frame_start = pygame.time.get_ticks()
+            lag += frame_start - last_time
+            last_time = frame_start
+
+            steps = 0
+            path_budget = self.path_budget
+            while lag >= self.tick_time and steps < self.max_steps:
+                path_budget -= self._tick(path_budget)
+                lag -= self.tick_time
+                steps += 1
+            if lag >= self.tick_time:
+                # too far behind to catch up
+                lag %= self.tick_time
+
+            self._draw(float(lag) / self.tick_time)
+
+            frame_time = pygame.time.get_ticks() - frame_start
+            if frame_time < self.min_cycle_time:
+                # give other threads some cpu time
+                pygame.time.wait(self.min_cycle_time - frame_time)
 
-            if time_passed < self.min_cycle_time:
-                pygame.time.wait(1)  # give other threads some cpu time
-                continue
+        self._shutdown()
 
-            self._update(gametime, time_passed)
-            self._draw()
+    @property
+    def ticks(self):
+        """Number of simulation ticks so far."""
+        return self._sim.ticks
 
-        self._shutdown()
+    def _tick(self, path_budget=None):
+        """Advance the simulation by one tick, return the time spent on
+        path searches (see Simulation.tick)."""
+        self._event_mgr.update()
+        path_time = self._sim.tick(path_budget)
+        self._camera.update(self.tick_time)
+        if self._map.chunks is not None:
+            self._map.stream(self._camera.view_rect,
+                             self._camera.move_direction,
+                             self._objects.active_positions())
+        return path_time
 
     def _load(self):
-        unit_tex = self._renderer.load_texture('cross.png')
+        if self._renderer is None:
+            unit_tex = None
+            unit_size = Simulation.UNIT_SIZE
+        else:
+            unit_tex = self._renderer.load_texture('cross.png')
+            unit_size = self._renderer.texture_size(unit_tex)
 
         for x in range(0, 48, 16):
-            unit_pos = (x, 16)
-            unit_rect = Rect(unit_pos, self._renderer.texture_size(unit_tex))
-            unit_id = self._objects.create(Unit, unit_rect)
-            self._renderer.assign_texture(unit_id, unit_tex)
+            unit_id = self._sim.spawn_unit((x, 16), unit_size)
+            if self._renderer is not None:
+                self._renderer.assign_texture(unit_id, unit_tex)
 
     def _shutdown(self):
-        pass
-
-    def _update(self, gametime, time_passed):
-        self._event_mgr.update()
-        self._objects.update(gametime)
-        self._camera.update(time_passed)
-
-        self._last_update = gametime
+        self._sim.shutdown()
 
-    #noinspection PyUnusedLocal
     def _camera_moved(self, event):
+        self._objects.set_view(event.cam.view_rect)
         if self._selecting:
             self._update_selection_rectangle(self._last_mouse_pos)
 
@@ -145,13 +208,14 @@ class Game(object):
     def _right_shiftclick(self, event):
         self._objects.send_selected(self._camera.point_to_map(event.pos), True)
 
-    def _draw(self):
+    def _draw(self, alpha=1.0):
+        # the last camera move of the ticks updates the visible objects
+        self._event_mgr.dispatch()
         self._renderer.frame_start()
 
         self._renderer.draw_map(self._map)
 
-        objs = self._objects.query(self._camera.view_rect)
-        self._renderer.draw_objects(objs)
+        self._renderer.draw_objects(self._objects.visible, alpha)
 
         if self._selecting:
             self._renderer.draw_rectangle(self._selection_rect, (255, 0, 0))
@@ -9,7 +9,11 @@ from game import util
 class GameObject(object):
     """Superclass of all game objects, has id and bbox (location) attribute"""
 
+    __slots__ = ('_manager', 'bbox', 'id', 'selected')
+
     _id_counter = 0
+    # index in the UnitStore of the manager, for units
+    slot = None
 
     def __init__(self, manager, bbox):
         self._manager = manager
@@ -30,9 +34,20 @@ class GameObject(object):
     def __eq__(self, other):
         return self.id == other
 
-    def __getattr__(self, item):
-        if item == 'size':
-            return self.bbox.width, self.bbox.height
+    @property
+    def size(self):
+        return self.bbox.size
+
+    @property
+    def prev_pos(self):
+        """Position (top left) before the last update, objects other than
+        units do not move in updates."""
+        return self.bbox.topleft
+
+    @property
+    def is_active(self):
+        """Whether the object is doing something, like moving."""
+        return False
 
     @staticmethod
     def _new_id():
@@ -41,58 +56,97 @@ class GameObject(object):
 
 
 class Unit(GameObject):
+    """Moving game object, its position and move are kept in the UnitStore
+    of its manager (at index slot)."""
+
+    __slots__ = ('slot', '_paths', '_destination')
+
     MOVE_THRESHOLD = 0.5
 
-    def __init__(self, manager, bbox):
+    def __init__(self, manager, bbox, speed=0.1):
+        self.slot = manager.units.add(self, bbox.topleft, bbox.size,
+                                      speed)
         GameObject.__init__(self, manager, bbox)
 
-        self._waypoints = []
-        self._is_moving = False
+        # path requests of the queued move orders
+        self._paths = []
+        self._destination = None
 
-        self._move_start = None
-        self._move_dest = None
-        self._move_dir = None
-        self._move_start_time = 0
-        self._move_end_time = 0
+    @property
+    def prev_pos(self):
+        return self._manager.units.prev_pos(self.slot)
 
-        self.speed = 0.1
+    @property
+    def speed(self):
+        """Speed in pixels per millisecond."""
+        return float(self._manager.units.speed[self.slot])
+
+    @speed.setter
+    def speed(self, speed):
+        self._manager.units.speed[self.slot] = speed
+
+    @property
+    def is_moving(self):
+        return bool(self._manager.units.moving[self.slot])
 
     def update(self, gametime):
-        if self._is_moving:
-            if gametime > self._move_end_time:
-                self._manager.move_object_to(self, self._move_dest)
-                self._is_moving = False
-            else:
-                time_passed = gametime - self._move_start_time
-                new_pos = util.vector_add(self._move_start,
-                                          util.vector_mul(self._move_dir,
-                                          time_passed * self.speed))
-                self._manager.move_object_to(self, new_pos)
+        """Start moving to the next waypoint, unless moving already. The
+        move itself is done by UnitStore.step."""
+        if self.is_moving:
+            return
+        waypoint = self._next_waypoint()
+        if waypoint is not None:
+            self._set_dest(waypoint, gametime)
+
+    @property
+    def is_active(self):
+        return self.is_moving or len(self._paths) > 0
+
+    def send_to(self, destination, add_waypoint=False, use_flow_field=False):
+        """Send unit to destination (map position of the unit center).
+
+        If use_flow_field is set the unit follows the flow field shared by
+        all units sent to the same tile. Returns the PathRequest of the
+        order, the unit waits until it is done and skips the order if there
+        is no path to destination."""
+        if add_waypoint and self.is_active:
+            start = self._destination
         else:
-            if len(self._waypoints) > 0:
-                self._move_start_time = gametime
-                move_dist = self._set_dest(self._waypoints.pop(0))
-                self._move_end_time = gametime + move_dist / self.speed
-
-    def send_to(self, destination, add_waypoint=False):
-        # TODO: pathfinding
+            start = self.bbox.center
 
-        center_dst = (destination[0] - self.bbox.width / 2,
-                      destination[1] - self.bbox.height / 2)
+        request = self._manager.request_path(start, destination,
+                                            use_flow_field)
         if add_waypoint:
-            self._waypoints.append(center_dst)
+            self._paths.append(request)
         else:
-            self._is_moving = False
-            self._waypoints = [center_dst]
-
-    def _set_dest(self, destination):
+            for old_request in self._paths:
+                old_request.cancel()
+            self._manager.units.stop(self.slot)
+            self._paths = [request]
+        self._destination = destination
+        self._manager.wake(self)
+        return request
+
+    def _next_waypoint(self):
+        """Get the next waypoint (top left position) or None."""
+        while len(self._paths) > 0:
+            request = self._paths[0]
+            if not request.done:
+                # wait for the path
+                return None
+            if request.waypoints is not None:
+                center = next(request.waypoints, None)
+                if center is not None:
+                    return (center[0] - self.bbox.width / 2,
+                            center[1] - self.bbox.height / 2)
+            self._paths.pop(0)
+        return None
+
+    def _set_dest(self, destination, gametime):
         pos = (self.bbox.x, self.bbox.y)
         if util.point_dist(destination, pos) > Unit.MOVE_THRESHOLD:
             move_vector = util.vector_diff(destination, pos)
-            self._move_start = pos
-            self._move_dest = destination
-            self._move_dir = util.vector_normalize(move_vector)
-            self._is_moving = True
-            return util.vector_len(move_vector)
-        else:
-            return 0
\ No newline at end of file
+            self._manager.units.start_move(
+                self.slot, pos, destination,
+                util.vector_normalize(move_vector), gametime,
+                gametime + util.vector_len(move_vector) / self.speed)
\ No newline at end of file
@@ -4,15 +4,125 @@
 
 """management.py: game object management"""
 
+from heapq import heappush, heappop
+from itertools import count, islice, izip
+from math import ceil, sqrt
+
+import numpy as np
 from pygame import Rect
 from game import util
+from game.pathqueue import PathRequest
+from game.gameobjects.unitstore import UnitStore
 
 
 class TreeError(Exception):
     pass
 
 
-class QuadtreeNode(object):
+class SpatialIndex(object):
+    """Base class of the spatial indexes.
+
+    Subclasses implement the generators iter_at, iter_query and
+    iter_intersect. The queries returning sets and the visitors are built
+    on them. The index must not change while a generator is used.
+
+    For move_many they implement _locations, which tells where objects are
+    stored for an array of bboxes, and _moved, which stores an object
+    whose bbox changed where it belongs now."""
+
+    def query_at(self, point, out=None):
+        """Get the objects whose bbox collides with point. They are added
+        to the set out if given, instead of a new set."""
+        return self._collect(self.iter_at(point), out)
+
+    def query(self, area=None, out=None):
+        """Get all objects or, if area is set, the objects contained in
+        area. They are added to the set out if given, instead of a new
+        set."""
+        return self._collect(self.iter_query(area), out)
+
+    def query_intersect(self, area, out=None):
+        """Get the objects that intersect with area. They are added to the
+        set out if given, instead of a new set."""
+        return self._collect(self.iter_intersect(area), out)
+
+    def visit_at(self, point, callback):
+        """Call callback with every object whose bbox collides with
+        point."""
+        for obj in self.iter_at(point):
+            callback(obj)
+
+    def visit_query(self, area, callback):
+        """Call callback with every object contained in area (all objects
+        if area is None)."""
+        for obj in self.iter_query(area):
+            callback(obj)
+
+    def visit_intersect(self, area, callback):
+        """Call callback with every object that intersects with area."""
+        for obj in self.iter_intersect(area):
+            callback(obj)
+
+    def iter_radius(self, point, radius):
+        """Iterate over the objects whose bbox is at most radius away from
+        point (see util.rect_point_dist_sq)."""
+        reach = int(ceil(radius)) + 1
+        radius_sq = radius * radius
+        dist_sq = util.rect_point_dist_sq
+        area = Rect(int(point[0]) - reach, int(point[1]) - reach,
+                    2 * reach + 1, 2 * reach + 1)
+        for obj in self.iter_intersect(area):
+            if dist_sq(obj.bbox, point) <= radius_sq:
+                yield obj
+
+    def query_radius(self, point, radius, out=None):
+        """Get the objects whose bbox is at most radius away from point.
+        They are added to the set out if given, instead of a new set."""
+        return self._collect(self.iter_radius(point, radius), out)
+
+    def nearest(self, point, k=1, max_dist=None, accept=None):
+        """Get a list of the k objects closest to point (by the distance of
+        their bbox, nearest first), at most max_dist away if set. If accept
+        is set only objects for which it returns True are counted."""
+        objs = (obj for _, obj in self.iter_nearest(point, max_dist))
+        if accept is not None:
+            objs = (obj for obj in objs if accept(obj))
+        return list(islice(objs, k))
+
+    def nearest_many(self, points, k=1, max_dist=None, accept=None):
+        """Like nearest, for each point of points. Returns a list of
+        lists."""
+        return [self.nearest(point, k, max_dist, accept) for point in points]
+
+    def query_radius_many(self, points, radius):
+        """Like query_radius, for each point of points. Returns a list of
+        sets."""
+        return [set(self.iter_radius(point, radius)) for point in points]
+
+    def move_many(self, objs, old_positions, positions, sizes):
+        """Move every object of objs from the top left position at the
+        same index of old_positions (where the index has it now) to the
+        one in positions (inside the index), sizes are the bbox sizes (all
+        integer arrays of shape (len(objs), 2)). The bboxes are changed in
+        place, only the objects whose node or cells change are moved in
+        the index."""
+        for obj, x, y in izip(objs, positions[:, 0].tolist(),
+                              positions[:, 1].tolist()):
+            obj.bbox.topleft = x, y
+        changed = (self._locations(old_positions, sizes) !=
+                   self._locations(positions, sizes)).any(axis=1)
+        for i in np.flatnonzero(changed).tolist():
+            self._moved(objs[i])
+
+    @staticmethod
+    def _collect(objs, out):
+        if out is None:
+            return set(objs)
+        out.update(objs)
+        return out
+
+
+class QuadtreeNode(SpatialIndex):
     """Represents one noe of a Quadtree."""
 
     def __init__(self, parent, bbox):
@@ -25,6 +135,12 @@ class QuadtreeNode(object):
         assert(parent is None or isinstance(parent, QuadtreeNode))
         self.parent = parent
         self._bb = bbox
+        if parent is None:
+            self._root = self
+            # object -> node storing it, only kept by the root
+            self._nodes = {}
+        else:
+            self._root = parent._root
 
         self._data = set()
         self._has_children = False
@@ -44,77 +160,97 @@ class QuadtreeNode(object):
                     return True
 
         self._data.add(obj)
+        self._root._nodes[obj] = self
         return True
 
-    def query_at(self, point):
-        result = set()
-        if not self._bb.collidepoint(point):
-            return result
+    def remove(self, obj):
+        """Remove object from the tree."""
+        node = self._root._nodes.pop(obj)
+        node._data.remove(obj)
+        node._purge_empty_nodes()
 
-        if len(self._data) > 0:
-            for obj in self._data:
+    def iter_at(self, point):
+        """Iterate over the objects under this node whose bbox collides
+        with point."""
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            if not node._bb.collidepoint(point):
+                continue
+            for obj in node._data:
                 if obj.bbox.collidepoint(point):
-                    result.add(obj)
-
-        if self._has_children:
-            for child in self._childs:
-                result.update(child.query_at(point))
-
-        return result
+                    yield obj
+            if node._has_children:
+                stack.extend(node._childs)
 
-    def query(self, area=None):
-        """Query for objects in the tree under this node.
+    def iter_query(self, area=None):
+        """Iterate over the objects under this node.
 
         If area is set this will only objects that are contained in area"""
-        result = set()
-        if area is not None and not self._bb.contains_rect(area):
-            return result
-
-        if len(self._data) > 0:
-            for obj in self._data:
-                if area is None or area.contains_rect(obj.bbox):
-                    result.add(obj)
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            if area is not None and not node._bb.colliderect(area):
+                continue
+            for obj in node._data:
+                if area is None or area.contains(obj.bbox):
+                    yield obj
+            if node._has_children:
+                stack.extend(node._childs)
 
-        if self._has_children:
-            for child in self._childs:
-                result.update(child.query(area))
-
-        return result
-
-    def query_intersect(self, area):
-        """Query for objects in the tree under this node.
-
-        If area is set this will only objects that intersect with area"""
-        result = set()
-        if not self._bb.colliderect(area):
-            return result
-
-        if len(self._data) > 0:
-            for obj in self._data:
+    def iter_intersect(self, area):
+        """Iterate over the objects under this node that intersect with
+        area."""
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            if not node._bb.colliderect(area):
+                continue
+            for obj in node._data:
                 if obj.bbox.colliderect(area):
-                    result.add(obj)
+                    yield obj
+            if node._has_children:
+                stack.extend(node._childs)
 
-        if not self._has_children:
-            return result
-
-        for child in self._childs:
-            result.update(child.query_intersect(area))
+    def iter_nearest(self, point, max_dist=None):
+        """Iterate over (distance, object) by increasing distance of the
+        object bboxes under this node from point, up to max_dist if set.
 
-        return result
+        Best-first search: nodes and objects wait in one heap, nodes with
+        the distance of their bbox, which no object in them is closer."""
+        limit = float('inf') if max_dist is None else max_dist * max_dist
+        dist_sq = util.rect_point_dist_sq
+        tie = count()
+        heap = [(dist_sq(self._bb, point), next(tie), self, True)]
+        while heap:
+            dist, _, item, is_node = heappop(heap)
+            if not is_node:
+                yield sqrt(dist), item
+                continue
+            for obj in item._data:
+                dist = dist_sq(obj.bbox, point)
+                if dist <= limit:
+                    heappush(heap, (dist, next(tie), obj, False))
+            if item._has_children:
+                for child in item._childs:
+                    dist = dist_sq(child._bb, point)
+                    if dist <= limit:
+                        heappush(heap, (dist, next(tie), child, True))
 
     def move_to(self, obj, new_bbox):
-        """Move obj to new location."""
-        if not self._bb.contains(obj.bbox):
+        """Move obj to new location.
+
+        The node of obj is looked up directly. If new_bbox still belongs
+        into it only the bbox is updated, otherwise obj moves up only as
+        far as needed and then down again."""
+        if not self._root._bb.contains(new_bbox):
             return False
-        if obj in self._data:
-            self._data.remove(obj)
-            obj.bbox = new_bbox
-            self._insert_up(obj)
-            return True
-        for child in self._childs:
-            if child.move_to(obj, new_bbox):
-                return True
-        raise TreeError("move failed")
+        node = self._root._nodes.get(obj)
+        if node is None:
+            raise TreeError("move failed")
+        obj.bbox = new_bbox
+        node._relocate(obj)
+        return True
 
     def print_tree(self, indent=0):
         """Print contents of this tree"""
@@ -126,7 +262,43 @@ class QuadtreeNode(object):
         for child in self._childs:
             child.print_tree(indent + 2)
 
+    def _child_contains(self, bbox):
+        if not self._has_children:
+            return False
+        for child in self._childs:
+            if child._bb.contains(bbox):
+                return True
+        return False
+
+    def _locations(self, positions, sizes):
+        """Get (depth, x, y) of the node, the deepest one containing the
+        bbox, for every bbox."""
+        root = self._root._bb
+        width_bits = root.width.bit_length() - 1
+        height_bits = root.height.bit_length() - 1
+        first = positions - root.topleft
+        last = first + np.maximum(sizes - 1, 0)
+        # the lowest node size both edges lie in is given by the highest
+        # bit in which they differ
+        bits = np.frexp(first ^ last)[1]
+        depth = np.minimum(width_bits - bits[:, 0],
+                           height_bits - bits[:, 1])
+        return np.column_stack((depth, first[:, 0] >> (width_bits - depth),
+                                first[:, 1] >> (height_bits - depth)))
+
+    def _moved(self, obj):
+        self._root._nodes[obj]._relocate(obj)
+
     #noinspection PyProtectedMember
+    def _relocate(self, obj):
+        """Move obj, which is stored here and whose bbox changed, to the
+        node it belongs into now."""
+        if self._bb.contains(obj.bbox) and not self._child_contains(obj.bbox):
+            return
+        self._data.remove(obj)
+        self._insert_up(obj)
+        self._purge_empty_nodes()
+
     def _insert_up(self, obj):
         if self._bb.contains(obj.bbox):
             self.insert(obj)
@@ -174,38 +346,649 @@ class QuadtreeNode(object):
 
 
 class Quadtree(QuadtreeNode):
-    """Represents a quadtree that contains objects with a location attribute"""
+    """Represents a quadtree that contains objects with a location attribute
+
+    The root node is extended to the next power of two sizes, so bbox may
+    have any size. Objects outside bbox are still refused, as by the other
+    indexes."""
 
     def __init__(self, bbox):
-        QuadtreeNode.__init__(self, None, bbox)
+        QuadtreeNode.__init__(self, None,
+                              Rect(bbox.topleft,
+                                   (util.next_power2(bbox.width),
+                                    util.next_power2(bbox.height))))
+        self._bounds = Rect(bbox)
+
+    def insert(self, obj):
+        """Insert object into the tree."""
+        if not self._bounds.contains(obj.bbox):
+            return False
+        return QuadtreeNode.insert(self, obj)
+
+    def move_to(self, obj, new_bbox):
+        """Move obj to new location, see QuadtreeNode.move_to."""
+        if not self._bounds.contains(new_bbox):
+            return False
+        return QuadtreeNode.move_to(self, obj, new_bbox)
+
+
+class LooseQuadtreeNode(object):
+    """Represents one node of a LooseQuadtree."""
+
+    def __init__(self, parent, bbox, depth):
+        self.parent = parent
+        self.depth = depth
+        self._bb = bbox
+        # objects may stick out of the node by half its size on each side
+        self._loose_bb = bbox.inflate(bbox.width, bbox.height)
+        self._split_x = bbox.x + bbox.width // 2
+        self._split_y = bbox.y + bbox.height // 2
+
+        self._data = set()
+        self._childs = None
+
+    def fits(self, bbox):
+        """Check if an object with bbox may be stored in this node."""
+        return (self._bb.collidepoint(bbox.center) and
+                bbox.width <= self._bb.width and
+                bbox.height <= self._bb.height)
+
+    def child_for(self, bbox):
+        """Get the child an object with bbox belongs into or None."""
+        if self._childs is None:
+            return None
+        x, y = bbox.center
+        child = self._childs[(x >= self._split_x) + 2 * (y >= self._split_y)]
+        if bbox.width <= child._bb.width and bbox.height <= child._bb.height:
+            return child
+        return None
+
+    def subdivide(self):
+        x, y = self._bb.topleft
+        width_1 = self._split_x - x
+        height_1 = self._split_y - y
+        width_2 = self._bb.width - width_1
+        height_2 = self._bb.height - height_1
+        if width_1 == 0 or height_1 == 0:
+            return False
+
+        depth = self.depth + 1
+        self._childs = [
+            LooseQuadtreeNode(self, Rect(x, y, width_1, height_1), depth),
+            LooseQuadtreeNode(self, Rect(self._split_x, y,
+                                         width_2, height_1), depth),
+            LooseQuadtreeNode(self, Rect(x, self._split_y,
+                                         width_1, height_2), depth),
+            LooseQuadtreeNode(self, Rect(self._split_x, self._split_y,
+                                         width_2, height_2), depth)]
+        return True
+
+    def print_tree(self, indent=0):
+        """Print contents of this tree"""
+        print(' ' * indent + str(self._data))
+
+        if self._childs is None:
+            return
+
+        for child in self._childs:
+            child.print_tree(indent + 2)
+
+
+class LooseQuadtree(SpatialIndex):
+    """Quadtree with loose nodes and buckets.
+
+    An object is stored in the deepest node that contains its center and
+    is at least as large as the object. Every node may hold objects which
+    stick out of it by up to half its size, so objects on split lines do
+    not pile up near the root. Leaves split into four when they hold more
+    than capacity objects, unless they are max_depth deep."""
+
+    MAX_DEPTH = 8
+    CAPACITY = 8
+
+    def __init__(self, bbox, max_depth=None, capacity=None):
+        self.max_depth = LooseQuadtree.MAX_DEPTH if max_depth is None \
+            else max_depth
+        self.capacity = LooseQuadtree.CAPACITY if capacity is None \
+            else capacity
+        self._bb = bbox
+        self._root = LooseQuadtreeNode(None, bbox, 0)
+        # object -> node storing it
+        self._nodes = {}
+        # the split lines of the nodes if all were split, see _locations
+        self._splits_x = np.array(self._splits(bbox.x, bbox.width, 0))
+        self._splits_y = np.array(self._splits(bbox.y, bbox.height, 0))
+
+    def __len__(self):
+        return len(self._nodes)
+
+    def insert(self, obj):
+        """Insert object into the tree."""
+        if not self._bb.contains(obj.bbox):
+            return False
+
+        node = self._root
+        child = node.child_for(obj.bbox)
+        while child is not None:
+            node = child
+            child = node.child_for(obj.bbox)
+        self._add(node, obj)
+        return True
+
+    def remove(self, obj):
+        """Remove object from the tree."""
+        node = self._nodes.pop(obj)
+        node._data.remove(obj)
+        self._purge_empty_nodes(node)
+
+    def iter_at(self, point):
+        """Iterate over the objects whose bbox collides with point."""
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            if not node._loose_bb.collidepoint(point):
+                continue
+            for obj in node._data:
+                if obj.bbox.collidepoint(point):
+                    yield obj
+            if node._childs is not None:
+                stack.extend(node._childs)
+
+    def iter_query(self, area=None):
+        """Iterate over all objects or, if area is set, the objects
+        contained in area."""
+        if area is None:
+            for obj in self._nodes:
+                yield obj
+            return
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            if not node._loose_bb.colliderect(area):
+                continue
+            for obj in node._data:
+                if area.contains(obj.bbox):
+                    yield obj
+            if node._childs is not None:
+                stack.extend(node._childs)
+
+    def iter_intersect(self, area):
+        """Iterate over the objects that intersect with area."""
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            if not node._loose_bb.colliderect(area):
+                continue
+            for obj in node._data:
+                if obj.bbox.colliderect(area):
+                    yield obj
+            if node._childs is not None:
+                stack.extend(node._childs)
+
+    def iter_nearest(self, point, max_dist=None):
+        """Iterate over (distance, object) by increasing distance of the
+        object bboxes from point, up to max_dist if set.
+
+        Best-first search: nodes and objects wait in one heap, nodes with
+        the distance of their loose bbox, which no object in them is
+        closer."""
+        limit = float('inf') if max_dist is None else max_dist * max_dist
+        dist_sq = util.rect_point_dist_sq
+        tie = count()
+        heap = [(0, next(tie), self._root, True)]
+        while heap:
+            dist, _, item, is_node = heappop(heap)
+            if not is_node:
+                yield sqrt(dist), item
+                continue
+            for obj in item._data:
+                dist = dist_sq(obj.bbox, point)
+                if dist <= limit:
+                    heappush(heap, (dist, next(tie), obj, False))
+            if item._childs is not None:
+                for child in item._childs:
+                    dist = dist_sq(child._loose_bb, point)
+                    if dist <= limit:
+                        heappush(heap, (dist, next(tie), child, True))
+
+    def move_to(self, obj, new_bbox):
+        """Move obj to new location."""
+        if not self._bb.contains(new_bbox):
+            return False
+        node = self._nodes.get(obj)
+        if node is None:
+            raise TreeError("move failed")
+        obj.bbox = new_bbox
+        self._relocate(obj, node)
+        return True
+
+    def print_tree(self):
+        """Print contents of this tree"""
+        self._root.print_tree()
+
+    def _splits(self, start, size, depth):
+        """Get the split lines (on one axis) below a node at start with
+        size on that axis."""
+        half = size // 2
+        if depth >= self.max_depth or half == 0:
+            return []
+        return (self._splits(start, half, depth + 1) + [start + half] +
+                self._splits(start + half, size - half, depth + 1))
+
+    def _locations(self, positions, sizes):
+        """Get the cell of the center of every bbox in the grid of all
+        split lines. Objects whose center stays in its cell stay in their
+        node."""
+        centers = positions + sizes // 2
+        return np.column_stack((
+            np.searchsorted(self._splits_x, centers[:, 0], 'right'),
+            np.searchsorted(self._splits_y, centers[:, 1], 'right')))
+
+    def _moved(self, obj):
+        self._relocate(obj, self._nodes[obj])
+
+    def _relocate(self, obj, node):
+        """Move obj, stored in node and whose bbox changed, to the node it
+        belongs into now."""
+        bbox = obj.bbox
+        if ((node is self._root or node.fits(bbox)) and
+                node.child_for(bbox) is None):
+            return
+        self.remove(obj)
+        self.insert(obj)
+
+    def _add(self, node, obj):
+        node._data.add(obj)
+        self._nodes[obj] = node
+        if (node._childs is not None or len(node._data) <= self.capacity or
+                node.depth >= self.max_depth):
+            return
+        if not node.subdivide():
+            return
+        for other in list(node._data):
+            child = node.child_for(other.bbox)
+            if child is not None:
+                node._data.remove(other)
+                self._add(child, other)
+
+    def _purge_empty_nodes(self, node):
+        if node._childs is None:
+            node = node.parent
+        while node is not None:
+            for child in node._childs:
+                if child._childs is not None or child._data:
+                    return
+            node._childs = None
+            node = node.parent
+
+
+class SpatialHashGrid(SpatialIndex):
+    """Uniform grid of square cells of cell_size pixels, as a spatial index
+    with the same interface as Quadtree.
+
+    Objects are stored in every cell their bbox overlaps, only cells with
+    objects exist. Moves within the same cells only update the bbox."""
+
+    CELL_SIZE = 64
+
+    def __init__(self, bbox, cell_size=None):
+        self.cell_size = SpatialHashGrid.CELL_SIZE if cell_size is None \
+            else cell_size
+        self._bb = bbox
+        # (cell x, cell y) -> set of objects
+        self._cells = {}
+        # object -> (min cell x, min cell y, max cell x, max cell y)
+        self._cell_ranges = {}
+
+    def __len__(self):
+        return len(self._cell_ranges)
+
+    def insert(self, obj):
+        """Insert object into the grid."""
+        if not self._bb.contains(obj.bbox):
+            return False
+        cell_range = self._cell_range(obj.bbox)
+        self._cell_ranges[obj] = cell_range
+        self._add(obj, cell_range)
+        return True
+
+    def remove(self, obj):
+        """Remove object from the grid."""
+        self._discard(obj, self._cell_ranges.pop(obj))
+
+    def move_to(self, obj, new_bbox):
+        """Move obj to new location."""
+        if not self._bb.contains(new_bbox):
+            return False
+        if obj not in self._cell_ranges:
+            raise TreeError("move failed")
+        obj.bbox = new_bbox
+        self._moved(obj)
+        return True
+
+    def iter_at(self, point):
+        """Iterate over the objects whose bbox collides with point."""
+        cell = (point[0] // self.cell_size, point[1] // self.cell_size)
+        for obj in self._cells.get(cell, ()):
+            if obj.bbox.collidepoint(point):
+                yield obj
+
+    def iter_query(self, area=None):
+        """Iterate over all objects or, if area is set, the objects
+        contained in area."""
+        if area is None:
+            return iter(self._cell_ranges)
+        return self._iter_area(area, area.contains)
+
+    def iter_intersect(self, area):
+        """Iterate over the objects that intersect with area."""
+        return self._iter_area(area, area.colliderect)
+
+    def iter_nearest(self, point, max_dist=None):
+        """Iterate over (distance, object) by increasing distance of the
+        object bboxes from point, up to max_dist if set.
+
+        The cells are searched in square rings around the cell of point.
+        Objects only stored in cells of the next ring are at least ring *
+        cell_size away, closer objects found so far are yielded before
+        that ring is searched."""
+        limit = float('inf') if max_dist is None else max_dist * max_dist
+        dist_sq = util.rect_point_dist_sq
+        size = self.cell_size
+        cells = self._cells
+        center_x = int(point[0] // size)
+        center_y = int(point[1] // size)
+        min_x, min_y, max_x, max_y = self._cell_range(self._bb)
+        max_ring = max(abs(center_x - min_x), abs(max_x - center_x),
+                       abs(center_y - min_y), abs(max_y - center_y))
+        tie = count()
+        heap = []
+        seen = set()
+        for ring in xrange(max_ring + 1):
+            if ring == 0:
+                ring_cells = ((center_x, center_y),)
+            else:
+                ring_cells = self._ring_cells(center_x, center_y, ring)
+            for cell in ring_cells:
+                objs = cells.get(cell)
+                if not objs:
+                    continue
+                for obj in objs:
+                    if obj in seen:
+                        continue
+                    seen.add(obj)
+                    dist = dist_sq(obj.bbox, point)
+                    if dist <= limit:
+                        heappush(heap, (dist, next(tie), obj))
+            bound = (ring * size) ** 2
+            while heap and heap[0][0] <= bound:
+                dist, _, obj = heappop(heap)
+                yield sqrt(dist), obj
+            if bound > limit:
+                return
+        while heap:
+            dist, _, obj = heappop(heap)
+            yield sqrt(dist), obj
+
+    def print_tree(self):
+        """Print contents of this grid"""
+        for cell in sorted(self._cells):
+            print(str(cell) + ' ' + str(self._cells[cell]))
+
+    def _locations(self, positions, sizes):
+        """Get the cell range (min x, min y, max x, max y) of every
+        bbox."""
+        size = self.cell_size
+        return np.column_stack((positions // size,
+                                (positions + sizes - 1) // size))
+
+    def _moved(self, obj):
+        old_range = self._cell_ranges[obj]
+        new_range = self._cell_range(obj.bbox)
+        if new_range != old_range:
+            self._discard(obj, old_range)
+            self._add(obj, new_range)
+            self._cell_ranges[obj] = new_range
+
+    def _cell_range(self, bbox):
+        size = self.cell_size
+        return (bbox.left // size, bbox.top // size,
+                (bbox.right - 1) // size, (bbox.bottom - 1) // size)
+
+    def _iter_area(self, area, test):
+        """Iterate over the objects in the cells overlapping area for which
+        test(obj.bbox) is true. Every object is only tested in the first of
+        these cells it is stored in."""
+        area = area.clip(self._bb)
+        if area.width == 0 or area.height == 0:
+            return
+        min_x, min_y, max_x, max_y = self._cell_range(area)
+        cells = self._cells
+        cell_ranges = self._cell_ranges
+        if (max_x - min_x + 1) * (max_y - min_y + 1) > len(cells):
+            # fewer cells exist than the area covers
+            keys = [key for key in cells
+                    if min_x <= key[0] <= max_x and min_y <= key[1] <= max_y]
+        else:
+            keys = [(x, y) for y in xrange(min_y, max_y + 1)
+                    for x in xrange(min_x, max_x + 1) if (x, y) in cells]
+        for key in keys:
+            x, y = key
+            for obj in cells[key]:
+                cell_range = cell_ranges[obj]
+                if (x == (cell_range[0] if cell_range[0] > min_x else min_x)
+                        and y == (cell_range[1] if cell_range[1] > min_y
+                                  else min_y) and test(obj.bbox)):
+                    yield obj
+
+    @staticmethod
+    def _ring_cells(center_x, center_y, ring):
+        """Iterate over the cells ring cells away from the center cell in
+        x or y direction (ring > 0)."""
+        top = center_y - ring
+        bottom = center_y + ring
+        for x in xrange(center_x - ring, center_x + ring + 1):
+            yield x, top
+            yield x, bottom
+        left = center_x - ring
+        right = center_x + ring
+        for y in xrange(top + 1, bottom):
+            yield left, y
+            yield right, y
+
+    def _add(self, obj, cell_range):
+        min_x, min_y, max_x, max_y = cell_range
+        cells = self._cells
+        for y in range(min_y, max_y + 1):
+            for x in range(min_x, max_x + 1):
+                objs = cells.get((x, y))
+                if objs is None:
+                    cells[(x, y)] = set([obj])
+                else:
+                    objs.add(obj)
+
+    def _discard(self, obj, cell_range):
+        min_x, min_y, max_x, max_y = cell_range
+        cells = self._cells
+        for y in range(min_y, max_y + 1):
+            for x in range(min_x, max_x + 1):
+                objs = cells[(x, y)]
+                objs.discard(obj)
+                if not objs:
+                    del cells[(x, y)]
+
+
+# names of the spatial indexes ObjectManager can use
+SPATIAL_INDEXES = {
+    'quadtree': Quadtree,
+    'loose': LooseQuadtree,
+    'grid': SpatialHashGrid,
+}
 
 
 class ObjectManager(object):
     """Manages game objects and provides methods for interacting with them"""
 
-    def __init__(self, bbox):
+    # groups at least this large share a flow field instead of searching
+    # a path for every object
+    FLOW_FIELD_MIN_OBJECTS = 8
+
+    def __init__(self, bbox, map_=None, path_queue=None, index='quadtree'):
+        """Create an object manager for the area bbox.
+
+        index is the name of the spatial index, see SPATIAL_INDEXES."""
         self._bb = bbox
-        self._quadtree = Quadtree(self._bb)
+        self._map = map_
+        self._path_queue = path_queue
+        try:
+            self._index = SPATIAL_INDEXES[index](self._bb)
+        except KeyError:
+            raise TreeError("unknown spatial index " + str(index))
         self._id_to_obj = {}
         self.selection = set()
+        # positions and moves of the units
+        self.units = UnitStore()
+        # units that have orders but are not moving
+        self._waiting = set()
+        # objects intersecting _view, see set_view
+        self.visible = set()
+        self._view = None
 
     def update(self, gametime):
-        """Update objects"""
-        for obj in self._id_to_obj.values():
-            obj.update(gametime)
+        """Update objects.
+
+        Waiting units start their next move, then all moving units are
+        advanced at once and moved in the spatial index together."""
+        waiting = self._waiting
+        for unit in list(waiting):
+            unit.update(gametime)
+            if unit.is_moving or not unit.is_active:
+                waiting.discard(unit)
+
+        units = self.units
+        slots, positions, finished = units.step(gametime)
+        if len(slots):
+            bb = self._bb
+            sizes = np.column_stack((units.width[slots],
+                                     units.height[slots]))
+            ends = positions + sizes
+            inside = ((positions[:, 0] >= bb.left) &
+                      (positions[:, 1] >= bb.top) &
+                      (ends[:, 0] <= bb.right) & (ends[:, 1] <= bb.bottom))
+            if not inside.all():
+                # these stay where they are, like in move_object_to
+                outside = slots[~inside]
+                units.rect_x[outside] = units.prev_x[outside]
+                units.rect_y[outside] = units.prev_y[outside]
+                slots = slots[inside]
+                positions = positions[inside]
+                sizes = sizes[inside]
+            unit_list = units.units
+            self._index.move_many([unit_list[slot] for slot in slots.tolist()],
+                                  np.column_stack((units.prev_x[slots],
+                                                   units.prev_y[slots])),
+                                  positions, sizes)
+            if self._view is not None:
+                self._update_visible(slots, positions, sizes)
+        for slot in finished:
+            waiting.add(units.units[slot])
 
     def create(self, which, location):
         """Create a new object of type which at location."""
         obj = which(self, location)
         self._id_to_obj[obj.id] = obj
-        self._quadtree.insert(obj)
+        self._index.insert(obj)
+        self._update_visible_object(obj)
         return obj
 
-    def query(self, location=None, point=None):
-        """Get all objects or all objects that intersect with area if set."""
+    def set_view(self, view):
+        """Keep visible up to date with the objects that intersect view
+        (usually the camera view).
+
+        Only the parts of view that were not in the last view are queried,
+        moved objects are added and removed by update."""
+        if view == self._view:
+            return
+        old_view = self._view
+        self._view = Rect(view)
+        visible = self.visible
+        if old_view is None or not old_view.colliderect(view):
+            visible.clear()
+            self._index.query_intersect(view, visible)
+            return
+        for strip in util.rect_difference(old_view, view):
+            for obj in self._index.iter_intersect(strip):
+                if not obj.bbox.colliderect(view):
+                    visible.discard(obj)
+        for strip in util.rect_difference(view, old_view):
+            self._index.query_intersect(strip, visible)
+
+    def query(self, location=None, point=None, out=None):
+        """Get all objects or all objects that intersect with area if set.
+
+        The objects are added to the set out if given, so a set can be
+        reused for queries every frame."""
         if point is not None:
-            return self._quadtree.query_at(point)
-        return self._quadtree.query_intersect(location)
+            return self._index.query_at(point, out)
+        if location is None:
+            return self._index.query(None, out)
+        return self._index.query_intersect(location, out)
+
+    def query_radius(self, point, radius, out=None):
+        """Get the objects whose bbox is at most radius away from point,
+        added to the set out if given."""
+        return self._index.query_radius(point, radius, out)
+
+    def nearest(self, point, k=1, max_dist=None, exclude=None):
+        """Get a list of the k objects closest to point (nearest first), at
+        most max_dist away if set, without the object exclude."""
+        accept = None
+        if exclude is not None:
+            accept = lambda obj: obj is not exclude
+        return self._index.nearest(point, k, max_dist, accept)
+
+    def nearest_many(self, points, k=1, max_dist=None, exclude=None):
+        """Like nearest for each point of points, but only units are
+        found. exclude is a list with a unit (or None) per point.
+
+        The units are searched as arrays in the UnitStore, only points
+        whose k nearest units are not certainly found that way are
+        searched in the spatial index. Returns a list of lists."""
+        exclude_slots = None
+        if exclude is not None:
+            exclude_slots = [-1 if unit is None else unit.slot
+                             for unit in exclude]
+        results, complete = self.units.nearest_many(points, k, max_dist,
+                                                    exclude_slots)
+        unit_list = self.units.units
+        found = []
+        for i, slots in enumerate(results):
+            if complete[i]:
+                found.append([unit_list[slot] for slot in slots.tolist()])
+                continue
+            unit = None if exclude is None else exclude[i]
+            found.append(self._index.nearest(
+                points[i], k, max_dist,
+                lambda obj: obj.slot is not None and obj is not unit))
+        return found
+
+    def query_radius_many(self, points, radius, exclude=None):
+        """Like query_radius for each point of points, but only units are
+        found. exclude is like for nearest_many. Returns a list of sets."""
+        exclude_slots = None
+        if exclude is not None:
+            exclude_slots = [-1 if unit is None else unit.slot
+                             for unit in exclude]
+        unit_list = self.units.units
+        return [set(unit_list[slot] for slot in slots.tolist())
+                for slots in self.units.radius_many(points, radius,
+                                                    exclude_slots)]
+
+    def active_positions(self):
+        """Get the centers of all active objects (see
+        GameObject.is_active)."""
+        return [obj.bbox.center for obj in self._id_to_obj.values()
+                if obj.is_active]
 
     def get_object_by_id(self, obj_id):
         """Get an object by its id."""
@@ -214,27 +997,31 @@ class ObjectManager(object):
     def move_object(self, obj_id, x, y):
         """Move object with id obj_id by (x, y)."""
         obj = self.get_object_by_id(obj_id)
-        new_bbox = obj.bbox.move(x, y)
-        if not self._bb.contains(new_bbox):
-            return False
-        self._quadtree.move_to(obj, new_bbox)
-        return True
+        return self.move_object_to(obj, obj.bbox.move(x, y).topleft)
 
     def move_object_to(self, obj, pos):
         """Move object to new position."""
         new_bbox = Rect(pos, obj.bbox.size)
         if not self._bb.contains(new_bbox):
             return False
-        self._quadtree.move_to(obj, new_bbox)
+        self._index.move_to(obj, new_bbox)
+        if obj.slot is not None:
+            self.units.set_position(obj.slot, new_bbox.topleft)
+        self._update_visible_object(obj)
         return True
 
+    def wake(self, unit):
+        """Let unit look for its next waypoint in the next updates, until
+        it moves or has no orders left."""
+        self._waiting.add(unit)
+
     def select_area(self, area):
         """Select all objects whose bbox collides with area."""
-        self.select_objects(self._quadtree.query_intersect(area))
+        self.select_objects(self._index.query_intersect(area))
 
     def select_at(self, point):
         """Select all objects whose bbox collides with point."""
-        self.select_objects(self._quadtree.query_at(point))
+        self.select_objects(self._index.query_at(point))
 
     def select_objects(self, objs):
         """Select a set of objects."""
@@ -245,7 +1032,72 @@ class ObjectManager(object):
         for obj in self.selection:
             obj.selected = True
 
+    def find_path(self, from_pos, to_pos, use_flow_field=False):
+        """Get waypoints leading from from_pos to to_pos.
+
+        Returns None if to_pos can not be reached. Without a map objects
+        move in a straight line."""
+        if self._map is None:
+            return [to_pos]
+        if use_flow_field:
+            return self._map.follow_flow_field(from_pos, to_pos)
+        return self._map.find_path(from_pos, to_pos)
+
+    def request_path(self, from_pos, to_pos, use_flow_field=False):
+        """Like find_path, but return a PathRequest for the waypoints.
+
+        With a path queue the search runs over the next frames, otherwise
+        the request is done immediately."""
+        if self._path_queue is None:
+            request = PathRequest()
+            request.finish(self.find_path(from_pos, to_pos, use_flow_field))
+            return request
+        return self._path_queue.submit(
+            self._path_steps(from_pos, to_pos, use_flow_field))
+
+    def _update_visible(self, slots, positions, sizes):
+        """Add the units of slots that moved into the view to visible and
+        remove the ones that moved out of it."""
+        view = self._view
+        units = self.units
+
+        def in_view(xs, ys):
+            return ((xs < view.right) & (xs + sizes[:, 0] > view.left) &
+                    (ys < view.bottom) & (ys + sizes[:, 1] > view.top))
+
+        was_visible = in_view(units.prev_x[slots], units.prev_y[slots])
+        is_visible = in_view(positions[:, 0], positions[:, 1])
+        if (was_visible == is_visible).all():
+            return
+        unit_list = units.units
+        visible = self.visible
+        for slot in slots[is_visible & ~was_visible].tolist():
+            visible.add(unit_list[slot])
+        for slot in slots[was_visible & ~is_visible].tolist():
+            visible.discard(unit_list[slot])
+
+    def _update_visible_object(self, obj):
+        if self._view is None:
+            return
+        if obj.bbox.colliderect(self._view):
+            self.visible.add(obj)
+        else:
+            self.visible.discard(obj)
+
+    def _path_steps(self, from_pos, to_pos, use_flow_field):
+        if self._map is None:
+            yield self.find_path(from_pos, to_pos, use_flow_field)
+            return
+        if use_flow_field:
+            steps = self._map.follow_flow_field_steps(from_pos, to_pos)
+        else:
+            steps = self._map.find_path_steps(from_pos, to_pos)
+        for result in steps:
+            yield result
+
     def send_selected(self, destination, add_waypoint=False):
         """Send all selected objects to (x, y)."""
+        use_flow_field = \
+            len(self.selection) >= ObjectManager.FLOW_FIELD_MIN_OBJECTS
         for obj in self.selection:
-            obj.send_to(destination, add_waypoint)
\ No newline at end of file
+            obj.send_to(destination, add_waypoint, use_flow_field)
\ No newline at end of file
@@ -0,0 +1,281 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""unitstore.py: unit movement state in arrays"""
+
+import numpy as np
+
+
+class UnitStore(object):
+    """Keeps the positions and moves of units in NumPy arrays, one element
+    (at the slot of the unit) per unit and one array per coordinate, so
+    step advances all moving units at once.
+
+    x, y is the exact position (top left) of a unit, rect_x, rect_y the
+    position of its bbox (truncated like Rect does) and prev_x, prev_y the
+    bbox position before the last step. A move goes from start_x, start_y
+    in direction dir_x, dir_y (unit vector) with speed pixels per
+    millisecond and ends at dest_x, dest_y after end_time."""
+
+    # name -> dtype
+    FIELDS = {
+        'x': np.float64,
+        'y': np.float64,
+        'rect_x': np.intp,
+        'rect_y': np.intp,
+        'prev_x': np.intp,
+        'prev_y': np.intp,
+        'width': np.intp,
+        'height': np.intp,
+        'start_x': np.float64,
+        'start_y': np.float64,
+        'dest_x': np.float64,
+        'dest_y': np.float64,
+        'dir_x': np.float64,
+        'dir_y': np.float64,
+        'start_time': np.float64,
+        'end_time': np.float64,
+        'speed': np.float64,
+        'moving': np.bool_,
+    }
+
+    def __init__(self, capacity=64):
+        # unit of every slot
+        self.units = []
+        self._capacity = 0
+        self._grow(capacity)
+
+    def __len__(self):
+        return len(self.units)
+
+    def add(self, unit, pos, size, speed):
+        """Add unit with bbox size at pos and return its slot."""
+        slot = len(self.units)
+        if slot == self._capacity:
+            self._grow(2 * self._capacity)
+        self.units.append(unit)
+        self.set_position(slot, pos)
+        self.prev_x[slot], self.prev_y[slot] = pos
+        self.width[slot], self.height[slot] = size
+        self.speed[slot] = speed
+        self.moving[slot] = False
+        return slot
+
+    def set_position(self, slot, pos):
+        """Place the unit of slot at pos (after a move by other means than
+        step)."""
+        self.x[slot], self.y[slot] = pos
+        self.rect_x[slot], self.rect_y[slot] = pos
+
+    def prev_pos(self, slot):
+        """Get the bbox position of the unit of slot before the last
+        step."""
+        return int(self.prev_x[slot]), int(self.prev_y[slot])
+
+    def start_move(self, slot, start, dest, direction, start_time, end_time):
+        """Let the unit of slot move from start to dest."""
+        self.start_x[slot], self.start_y[slot] = start
+        self.dest_x[slot], self.dest_y[slot] = dest
+        self.dir_x[slot], self.dir_y[slot] = direction
+        self.start_time[slot] = start_time
+        self.end_time[slot] = end_time
+        self.moving[slot] = True
+
+    def stop(self, slot):
+        """Stop the move of the unit of slot where it is."""
+        self.moving[slot] = False
+
+    def step(self, gametime):
+        """Advance all moving units to their position at gametime.
+
+        Return (slots, positions, finished): the slots of the units whose
+        bbox position changed, their new positions as array of shape
+        (len(slots), 2) and the slots of the units that reached their
+        destination."""
+        count = len(self.units)
+        rect_x = self.rect_x[:count]
+        rect_y = self.rect_y[:count]
+        self.prev_x[:count] = rect_x
+        self.prev_y[:count] = rect_y
+        moving = self.moving[:count]
+        if not moving.any():
+            slots = np.flatnonzero(moving)
+            return slots, np.empty((0, 2), dtype=np.intp), slots
+
+        # computed for all units, that is faster than selecting the moving
+        # ones first when most units move
+        dist = (gametime - self.start_time[:count]) * self.speed[:count]
+        done = moving & (gametime > self.end_time[:count])
+        x = np.where(done, self.dest_x[:count],
+                     self.start_x[:count] + self.dir_x[:count] * dist)
+        y = np.where(done, self.dest_y[:count],
+                     self.start_y[:count] + self.dir_y[:count] * dist)
+        self.x[:count] = np.where(moving, x, self.x[:count])
+        self.y[:count] = np.where(moving, y, self.y[:count])
+
+        new_x = x.astype(np.intp)
+        new_y = y.astype(np.intp)
+        slots = np.flatnonzero(moving & ((new_x != rect_x) |
+                                         (new_y != rect_y)))
+        new_x = new_x[slots]
+        new_y = new_y[slots]
+        rect_x[slots] = new_x
+        rect_y[slots] = new_y
+        moving &= ~done
+        return slots, np.column_stack((new_x, new_y)), np.flatnonzero(done)
+
+    def nearest_many(self, points, k=1, max_dist=None, exclude=None):
+        """Find the k units closest to each point of points (by the
+        distance of their bbox, see util.rect_point_dist_sq), at most
+        max_dist away if set. exclude is a slot (or -1) per point whose
+        unit is skipped for that point.
+
+        Return (results, complete): results holds an array of slots,
+        nearest first, per point. Only units in the grid cells around a
+        point are searched, complete[i] is False if results[i] may have
+        missed closer units."""
+        count = len(self.units)
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        if not count:
+            return ([np.empty(0, dtype=np.intp)] * len(points),
+                    np.ones(len(points), dtype=np.bool_))
+        half_size = (max(self.width[:count].max(),
+                         self.height[:count].max()) + 1) // 2
+        # cells holding about k units on average
+        cell_size = max(2 * half_size, int(np.sqrt(
+            self._spread(count) * k / float(count))) + 1)
+        if max_dist is not None and max_dist + half_size <= 2 * cell_size:
+            cell_size = max(cell_size, int(np.ceil(max_dist)) + half_size)
+        queries, slots, dist_sq, bound = self._query_pairs(points,
+                                                           cell_size)
+
+        keep = np.ones(len(slots), dtype=np.bool_)
+        if max_dist is not None:
+            keep &= dist_sq <= max_dist * max_dist
+        if exclude is not None:
+            exclude = np.asarray(exclude, dtype=np.intp)
+            keep &= slots != exclude[queries]
+        queries = queries[keep]
+        slots = slots[keep]
+        dist_sq = dist_sq[keep]
+
+        # by query, then by distance (one key sorts much faster than
+        # lexsort, distances closer than about 1e-4 may be swapped)
+        scale = 2 * dist_sq.max() + 1 if len(dist_sq) else 1
+        order = np.argsort(queries * scale + dist_sq)
+        queries = queries[order]
+        group_starts = np.searchsorted(queries, np.arange(len(points) + 1))
+        rank = np.arange(len(queries)) - group_starts[queries]
+        nearest = rank < k
+        found = np.minimum(np.diff(group_starts), k)
+        results = np.split(slots[order][nearest], np.cumsum(found)[:-1])
+
+        # the k-th distance of every point with k results
+        kth_dist_sq = np.full(len(points), np.inf)
+        last = rank == k - 1
+        kth_dist_sq[queries[last]] = dist_sq[order][last]
+        complete = kth_dist_sq <= bound * bound
+        if max_dist is not None and max_dist <= bound:
+            complete[:] = True
+        return results, complete
+
+    def radius_many(self, points, radius, exclude=None):
+        """Find the units whose bbox is at most radius away from each point
+        of points. exclude is like for nearest_many. Return a list with an
+        array of slots per point."""
+        count = len(self.units)
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        if not count:
+            return [np.empty(0, dtype=np.intp)] * len(points)
+        half_size = (max(self.width[:count].max(),
+                         self.height[:count].max()) + 1) // 2
+        cell_size = max(2 * half_size, int(np.ceil(radius)) + half_size)
+        queries, slots, dist_sq, _ = self._query_pairs(points, cell_size)
+        keep = dist_sq <= radius * radius
+        if exclude is not None:
+            exclude = np.asarray(exclude, dtype=np.intp)
+            keep &= slots != exclude[queries]
+        queries = queries[keep]
+        slots = slots[keep]
+        found = np.bincount(queries, minlength=len(points))
+        return np.split(slots[np.argsort(queries, kind='mergesort')],
+                        np.cumsum(found)[:-1])
+
+    def _spread(self, count):
+        """Area covered by the bbox positions of the units."""
+        rect_x = self.rect_x[:count]
+        rect_y = self.rect_y[:count]
+        return (max(1, rect_x.max() - rect_x.min()) *
+                max(1, rect_y.max() - rect_y.min()))
+
+    def _query_pairs(self, points, cell_size):
+        """Sort the units into square cells of cell_size (at least twice
+        the largest unit size, by their bbox center) and pair every point
+        with the units in its cell and the eight cells around it.
+
+        Return (queries, slots, dist_sq, bound): the point index and slot
+        of every pair, the squared distance of the bbox from the point and
+        the distance all units not paired with a point are at least away
+        from it."""
+        count = len(self.units)
+        left = self.rect_x[:count]
+        top = self.rect_y[:count]
+        right = left + self.width[:count]
+        bottom = top + self.height[:count]
+        center_x = (left + right) // 2
+        center_y = (top + bottom) // 2
+        min_x = center_x.min()
+        min_y = center_y.min()
+        # at most about count cells
+        cell_size = max(cell_size, int(np.sqrt(
+            (center_x.max() - min_x + 1) * (center_y.max() - min_y + 1) /
+            float(count))) + 1)
+        cell_x = (center_x - min_x) // cell_size
+        cell_y = (center_y - min_y) // cell_size
+        cells_x = cell_x.max() + 1
+        cells_y = cell_y.max() + 1
+        cell = cell_y * cells_x + cell_x
+        by_cell = np.argsort(cell, kind='mergesort')
+        starts = np.searchsorted(cell[by_cell],
+                                 np.arange(cells_x * cells_y + 1))
+
+        # the 3x3 cells around every point
+        point_x = np.floor((points[:, 0] - min_x) / cell_size).astype(np.intp)
+        point_y = np.floor((points[:, 1] - min_y) / cell_size).astype(np.intp)
+        offsets = np.arange(-1, 2)
+        window_x = (point_x[:, np.newaxis, np.newaxis] +
+                    offsets[np.newaxis, np.newaxis, :])
+        window_y = (point_y[:, np.newaxis, np.newaxis] +
+                    offsets[np.newaxis, :, np.newaxis])
+        valid = ((window_x >= 0) & (window_x < cells_x) &
+                 (window_y >= 0) & (window_y < cells_y))
+        window = np.where(valid, window_y * cells_x + window_x, 0).ravel()
+        valid = valid.ravel()
+        begin = np.where(valid, starts[window], 0)
+        lengths = np.where(valid, starts[window + 1], 0) - begin
+
+        total = lengths.sum()
+        pair_starts = np.cumsum(lengths) - lengths
+        slots = by_cell[np.repeat(begin - pair_starts, lengths) +
+                        np.arange(total)]
+        queries = np.repeat(np.repeat(np.arange(len(points)), 9), lengths)
+        query_x = points[queries, 0]
+        query_y = points[queries, 1]
+        dx = np.maximum(np.maximum(left[slots] - query_x,
+                                   query_x - right[slots]), 0)
+        dy = np.maximum(np.maximum(top[slots] - query_y,
+                                   query_y - bottom[slots]), 0)
+        # a center outside of the cells is at least cell_size away, the
+        # bbox sticks out of its center by at most half the largest size
+        half_size = (max(self.width[:count].max(),
+                         self.height[:count].max()) + 1) // 2
+        return queries, slots, dx * dx + dy * dy, cell_size - half_size
+
+    def _grow(self, capacity):
+        for name, dtype in UnitStore.FIELDS.items():
+            array = np.zeros(capacity, dtype=dtype)
+            if self._capacity:
+                array[:self._capacity] = getattr(self, name)
+            setattr(self, name, array)
+        self._capacity = capacity
\ No newline at end of file
@@ -7,6 +7,20 @@
 import pygame
 import util
 from events import EventManager
+from gameobjects.management import SpatialHashGrid
+
+
+class HotArea(object):
+    """Screen area with callbacks for the mouse entering and leaving it."""
+
+    __slots__ = ('id', 'bbox', 'enter_action', 'leave_action')
+
+    def __init__(self, hotarea_id, bbox, enter_action, leave_action):
+        self.id = hotarea_id
+        self.bbox = bbox
+        # (callback, args) or None
+        self.enter_action = enter_action
+        self.leave_action = leave_action
 
 
 class InputManager(object):
@@ -19,6 +33,10 @@ class InputManager(object):
 
     SHIFTKEYS = {pygame.K_LSHIFT, pygame.K_RSHIFT}
 
+    # hot areas are clipped to this screen area
+    HOTAREA_BOUNDS = pygame.Rect(0, 0, 8192, 8192)
+    HOTAREA_CELL_SIZE = 64
+
     def __init__(self, event_manager):
         event_manager.subscribe(pygame.KEYDOWN, self._key_down)
         event_manager.subscribe(pygame.KEYUP, self._key_up)
@@ -30,11 +48,13 @@ class InputManager(object):
         self._keybinds_down = {}
         self._keybinds_up = {}
 
-        self._hot_area_ids = set()
+        # hotarea id -> HotArea
+        self._hot_areas = {}
+        self._hot_area_index = SpatialHashGrid(
+            InputManager.HOTAREA_BOUNDS, InputManager.HOTAREA_CELL_SIZE)
+        # hot areas the mouse is in
         self._active_hotareas = set()
         self._hot_area_counter = 0
-        self._hot_area_rects = {}
-        self._hot_area_actions = {}
 
         self._pushed_keys = set()
 
@@ -49,7 +69,7 @@ class InputManager(object):
 
         self.mouse_drag_start = EventManager.new_event_code()
         self.mouse_drag_end = EventManager.new_event_code()
-        self.mouse_drag_update = EventManager.new_event_code()
+        self.mouse_drag_update = EventManager.new_event_code(coalesce=True)
 
         self.mouse_dragging = False
         self._mouse_drag_start = None
@@ -68,27 +88,34 @@ class InputManager(object):
     def unset_keybind(self, key, callback):
         self._keybinds_down[key].remove(callback)
 
-    def set_hotarea(self, area, callback, args=None):
+    def set_hotarea(self, area, callback, args=None, leave_callback=None,
+                    leave_args=None):
         """Set a hotarea and return its id.
 
         When the mouse moves into the specified area, the specified callback
         will be called. args can be a dict of arguments to be passed to
-        the callback"""
+        the callback. leave_callback is called with leave_args when the
+        mouse moves out of the area again."""
 
         hotarea_id = self._new_hotarea_id()
-        rect = pygame.Rect(area)
-
-        self._hot_area_ids.add(hotarea_id)
-        self._hot_area_rects[hotarea_id] = rect
-        self._hot_area_actions[hotarea_id] = (callback,
-                                              {} if args is None else args)
+        rect = pygame.Rect(area).clip(InputManager.HOTAREA_BOUNDS)
+
+        enter_action = (callback, {} if args is None else args)
+        leave_action = None
+        if leave_callback is not None:
+            leave_action = (leave_callback,
+                            {} if leave_args is None else leave_args)
+        hot_area = HotArea(hotarea_id, rect, enter_action, leave_action)
+        self._hot_areas[hotarea_id] = hot_area
+        self._hot_area_index.insert(hot_area)
+        return hotarea_id
 
     def unset_hotarea(self, hotarea_id):
         """Unset hotarea with given id."""
 
-        self._hot_area_ids.remove(hotarea_id)
-        del self._hot_area_rects[hotarea_id]
-        del self._hot_area_actions[hotarea_id]
+        hot_area = self._hot_areas.pop(hotarea_id)
+        self._hot_area_index.remove(hot_area)
+        self._active_hotareas.discard(hot_area)
 
     def _new_hotarea_id(self):
         self._hot_area_counter += 1
@@ -127,16 +154,25 @@ class InputManager(object):
                 self.mouse_dragging = True
                 EventManager.post(self.mouse_drag_start, pos=pos)
 
-        current_active_hotareas = set()
-        for hotarea_id in self._hot_area_ids:
-            if self._hot_area_rects[hotarea_id].collidepoint(pos):
-                current_active_hotareas.add(hotarea_id)
+        self._update_hotareas(pos)
 
-        entered_hotareas = current_active_hotareas - self._active_hotareas
-        #left_hotareas = self._active_hotareas - current_active_hotareas
+    def _update_hotareas(self, pos):
+        """Call the leave and enter callbacks of the hot areas the mouse
+        left or entered by moving to pos."""
+        current_active_hotareas = self._hot_area_index.query_at(pos)
+        if current_active_hotareas == self._active_hotareas:
+            return
 
-        for hotarea_id in entered_hotareas:
-            callback, args = self._hot_area_actions[hotarea_id]
+        left_hotareas = self._active_hotareas - current_active_hotareas
+        entered_hotareas = current_active_hotareas - self._active_hotareas
+        self._active_hotareas = current_active_hotareas
+
+        for hot_area in sorted(left_hotareas, key=lambda area: area.id):
+            if hot_area.leave_action is not None:
+                callback, args = hot_area.leave_action
+                callback(**args)
+        for hot_area in sorted(entered_hotareas, key=lambda area: area.id):
+            callback, args = hot_area.enter_action
             callback(**args)
 
     def _mouse_down(self, event):
@@ -4,81 +4,537 @@
 
 """map.py: map background management"""
 
-from pygame import image, Rect
+import os
+from collections import OrderedDict
+
+import numpy as np
+from pygame import image, Rect, Surface
+
+import mapfile
+from chunks import ChunkCache
+from pathfinding import create_pathfinder, FlowFieldCache, PathCache, \
+    SEARCHING, WAITING
+from pathworkers import PathWorkerPool
 
 
 class MapError(Exception):
     pass
 
 
+def _grow(region, diagonal):
+    """Get region (bool array) extended by its orthogonal (and diagonal)
+    neighbours."""
+    grown = region.copy()
+    grown[1:, :] |= region[:-1, :]
+    grown[:-1, :] |= region[1:, :]
+    grown[:, 1:] |= region[:, :-1]
+    grown[:, :-1] |= region[:, 1:]
+    if diagonal:
+        grown[1:, 1:] |= region[:-1, :-1]
+        grown[1:, :-1] |= region[:-1, 1:]
+        grown[:-1, 1:] |= region[1:, :-1]
+        grown[:-1, :-1] |= region[1:, 1:]
+    return grown
+
+
 class Map(object):
     """manages map background content and drawing"""
 
     DEFAULT_MAP_DIR = 'content/maps/'
+    BLOCKING_TILES = {1}
+    FLOW_FIELD_CACHE_SIZE = 8
+    # chunks loaded around the view and units of chunked maps
+    STREAM_MARGIN = 1
+    # chunks loaded ahead of the view in its move direction
+    PREFETCH_CHUNKS = 2
+    # pre-rendered map surfaces cover this many tiles in each direction
+    SURFACE_CHUNK_TILES = 16
+    SURFACE_CACHE_SIZE = 64
     _tile_size = 16
 
-    def __init__(self, map_name=None):
+    def __init__(self, map_name=None, path_mode=None, corner_cutting=False,
+                 chunk_budget=64 * 1024 * 1024):
         self.size = None
         self.tiles_x = 0
         self.tiles_y = 0
         self._tiles = None
+        self.layers = None
+        self.chunks = None
+        self.chunk_budget = chunk_budget
+        # (chunk x, chunk y) -> pre-rendered Surface, least recently used
+        # first
+        self._surfaces = OrderedDict()
+        # created when first used, see pathfinder
+        self._pathfinder = None
+        self._path_cache = None
+        self._flow_fields = None
+        self.path_workers = None
+        self.path_mode = path_mode
+        self.corner_cutting = corner_cutting
 
-        self._texmap = image.load('content/texmap.png')
-        self._texmap_tiles_x = self._texmap.get_width() // Map._tile_size
-        self._texmap_tiles_y = self._texmap.get_height() // Map._tile_size
+        # loaded on first draw, maps without display do not need it
+        self._texmap = None
+        self._texmap_tiles_x = 0
+        self._texmap_tiles_y = 0
 
         if map_name is not None:
             self.load(map_name)
 
     def load(self, map_name, map_dir=None):
-        """Load map with name map_name."""
+        """Load map with name map_name.
+
+        A binary map file (see mapfile) is preferred over a text map and is
+        memory mapped, tile changes are not written back to it. Chunked
+        binary maps are streamed through a ChunkCache (self.chunks) which
+        keeps at most about chunk_budget bytes of tiles in memory, tiles
+        and layers are None then. The tiles are only read for pathfinding
+        when it is first used. Running path workers are started again for
+        the new map."""
         self.tiles_x = None
         self.tiles_y = None
-        self._tiles = []
+        self._tiles = None
+        self.layers = None
+        self.chunks = None
+        self._pathfinder = None
+        self._path_cache = None
+        self._flow_fields = None
+        self._surfaces.clear()
 
         if map_dir is None:
             map_dir = Map.DEFAULT_MAP_DIR
-        fh = open(map_dir + map_name + '.map', 'r')
-
-        for line in fh:
-            items = [int(x) for x in line.split()]
-            if self.tiles_x is None:
-                self.tiles_x = len(items)
+        path = map_dir + map_name
+        binary_path = path + mapfile.EXTENSION
+        try:
+            if not os.path.exists(binary_path):
+                self.layers = mapfile.read_text_map(path + '.map')[np.newaxis]
+            elif mapfile.read_map_header(binary_path)[4]:
+                chunks, self.tiles_x, self.tiles_y = \
+                    mapfile.open_chunked_map(binary_path)
+                self.chunks = ChunkCache(chunks, self.tiles_x, self.tiles_y,
+                                         self.chunk_budget)
             else:
-                if self.tiles_x != len(items):
-                    raise MapError("line width does not match first line")
-            self._tiles.append(items)
-        fh.close()
+                self.layers = mapfile.open_map(binary_path)
+        except mapfile.MapFileError as e:
+            raise MapError(str(e))
 
-        self.tiles_y = len(self._tiles)
+        if self.layers is not None:
+            self._tiles = self.layers[0]
+            self.tiles_y, self.tiles_x = self._tiles.shape
 
         self.size = Rect(0, 0,
                          self.tiles_x * Map._tile_size,
                          self.tiles_y * Map._tile_size)
 
+        if self.path_workers is not None:
+            # the same pool, so its users keep working
+            self.path_workers.reset(self.tiles_x, self.tiles_y,
+                                    self._blocked_tiles())
+
+    @property
+    def pathfinder(self):
+        """The pathfinder of the map (see create_pathfinder), created with
+        the walkability of all tiles when it is first used."""
+        if self._pathfinder is None and self.tiles_x:
+            self._create_pathfinder()
+        return self._pathfinder
+
+    @property
+    def path_cache(self):
+        """The PathCache of pathfinder."""
+        if self._path_cache is None and self.tiles_x:
+            self._create_pathfinder()
+        return self._path_cache
+
+    @property
+    def flow_fields(self):
+        """The FlowFieldCache of pathfinder."""
+        if self._flow_fields is None and self.tiles_x:
+            self._create_pathfinder()
+        return self._flow_fields
+
+    def _create_pathfinder(self):
+        self._pathfinder = create_pathfinder(self.tiles_x, self.tiles_y,
+                                             self.path_mode,
+                                             self.corner_cutting)
+        self._pathfinder.set_all_blocked(self._blocking_grid())
+        self._path_cache = PathCache(self._pathfinder)
+        self._path_cache.workers = self.path_workers
+        self._flow_fields = FlowFieldCache(self._pathfinder,
+                                           Map.FLOW_FIELD_CACHE_SIZE)
+
+    def _blocking_grid(self):
+        if self.chunks is None:
+            return self.blocking_mask().view(np.uint8).tobytes()
+        # one pass over all chunks, without keeping them loaded
+        blocked = np.zeros((self.tiles_y, self.tiles_x), dtype=bool)
+        for x, y, tiles in self.chunks.iter_chunks():
+            blocked[y:y + tiles.shape[0], x:x + tiles.shape[1]] = \
+                self.blocking_mask(tiles)
+        return blocked.view(np.uint8).tobytes()
+
+    @property
+    def tiles(self):
+        """The tile grid (the first of layers), an array indexed [y, x].
+        Change tiles only through set_tile."""
+        return self._tiles
+
+    @property
+    def blocked(self):
+        """Array view of the blocked flags of the pathfinder (uint8, indexed
+        [y, x]), shares its memory."""
+        return np.frombuffer(self.pathfinder.blocked, dtype=np.uint8) \
+            .reshape(self.tiles_y, self.tiles_x)
+
+    def get_tile(self, x, y):
+        """Get the tile at (x, y)."""
+        if self.chunks is not None:
+            return self.chunks.get_tile(x, y)
+        return self._tiles[y, x]
+
+    def tile_area(self, min_x, min_y, max_x, max_y):
+        """Get the tiles in [min_x, max_x) x [min_y, max_y) (clipped to the
+        map) as an array indexed [y, x], a view into tiles unless the map
+        is chunked."""
+        if self.chunks is not None:
+            return self.chunks.area(min_x, min_y, max_x, max_y)
+        return self._tiles[max(0, min_y):max(0, max_y),
+                           max(0, min_x):max(0, max_x)]
+
+    def stream(self, view_rect, direction=(0, 0), positions=()):
+        """Load the chunks of a chunked map around view_rect and the map
+        positions in positions (e.g. of moving units) and prefetch the
+        chunks ahead of view_rect in direction (see Camera.move_direction).
+        Does nothing if the map is not chunked."""
+        if self.chunks is None:
+            return
+        tile_size = Map._tile_size
+        margin = Map.STREAM_MARGIN * self.chunks.chunk_size
+        min_x = view_rect.left // tile_size - margin
+        min_y = view_rect.top // tile_size - margin
+        max_x = view_rect.right // tile_size + 1 + margin
+        max_y = view_rect.bottom // tile_size + 1 + margin
+
+        # least important first, the cache drops the least recently used
+        # chunks
+        ahead = Map.PREFETCH_CHUNKS * self.chunks.chunk_size
+        dx = ahead * ((direction[0] > 0) - (direction[0] < 0))
+        dy = ahead * ((direction[1] > 0) - (direction[1] < 0))
+        if dx or dy:
+            self.chunks.load_area(min_x + dx, min_y + dy,
+                                  max_x + dx, max_y + dy)
+        for pos in positions:
+            x, y = self.pos_to_tile(pos)
+            self.chunks.load_area(x, y, x + 1, y + 1)
+        self.chunks.load_area(min_x, min_y, max_x, max_y)
+
+    def set_tile(self, x, y, tile):
+        """Change the tile at (x, y)."""
+        if self.chunks is not None:
+            self.chunks.set_tile(x, y, tile)
+        else:
+            self._tiles[y, x] = tile
+        self._drop_surfaces(x, y, x + 1, y + 1)
+        blocked = tile in Map.BLOCKING_TILES
+        # paths only change with the walkability
+        if self.blocked[y, x] == blocked:
+            return
+        self.pathfinder.set_blocked(x, y, blocked)
+        if self.path_workers is not None:
+            self.path_workers.set_blocked(x, y, blocked)
+        self.path_cache.invalidate((x, y, x + 1, y + 1))
+        self.flow_fields.clear()
+
+    def fill_tiles(self, mask, tile):
+        """Set all tiles where the bool array mask is True to tile."""
+        if self.chunks is not None:
+            ys, xs = np.nonzero(mask)
+            for x, y in zip(xs.tolist(), ys.tolist()):
+                if self.chunks.get_tile(x, y) != tile:
+                    self.set_tile(x, y, tile)
+            return
+        changed = mask & (self._tiles != tile)
+        if not changed.any():
+            return
+        self._tiles[changed] = tile
+        ys, xs = np.nonzero(changed)
+        self._drop_surfaces(xs.min(), ys.min(), xs.max() + 1, ys.max() + 1)
+        blocked = tile in Map.BLOCKING_TILES
+        # only tiles whose walkability changed concern the pathfinder
+        changed &= self.blocked != blocked
+        ys, xs = np.nonzero(changed)
+        for x, y in zip(xs.tolist(), ys.tolist()):
+            self.pathfinder.set_blocked(x, y, blocked)
+            if self.path_workers is not None:
+                self.path_workers.set_blocked(x, y, blocked)
+        if len(xs) > 0:
+            self.path_cache.invalidate((xs.min(), ys.min(),
+                                        xs.max() + 1, ys.max() + 1))
+            self.flow_fields.clear()
+
+    def start_path_workers(self, processes=None):
+        """Search the routes of find_path_steps in a pool of processes
+        worker processes (one per cpu if not set)."""
+        self.stop_path_workers()
+        self.path_workers = PathWorkerPool(self.tiles_x, self.tiles_y,
+                                           self._blocked_tiles(),
+                                           self.path_mode,
+                                           self.corner_cutting, processes)
+        self.path_cache.workers = self.path_workers
+
+    def stop_path_workers(self):
+        """Stop the worker processes started by start_path_workers."""
+        if self.path_workers is None:
+            return
+        self.path_workers.close()
+        self.path_workers = None
+        self.path_cache.workers = None
+
+    def _blocked_tiles(self):
+        blocked_y, blocked_x = np.nonzero(self.blocked)
+        return zip(blocked_x.tolist(), blocked_y.tolist())
+
+    def find_path(self, from_pos, to_pos):
+        """Find a path between two map positions.
+
+        Return an iterator over waypoints (tile centers, ending with to_pos)
+        not including from_pos or None if to_pos is not reachable. Route
+        segments are refined while the waypoints are consumed."""
+        from_tile = self.pos_to_tile(from_pos)
+        to_tile = self.pos_to_tile(to_pos)
+        route = self.path_cache.find_route(from_tile, to_tile)
+        if route is None:
+            return None
+        return self._iter_waypoints(route, to_pos)
+
+    def find_path_steps(self, from_pos, to_pos, pause_every=256):
+        """Resumable version of find_path.
+
+        Return a generator which yields SEARCHING while the search is not
+        finished, or WAITING while it waits for the path workers, and the
+        result of find_path as its last value."""
+        from_tile = self.pos_to_tile(from_pos)
+        to_tile = self.pos_to_tile(to_pos)
+        for route in self.path_cache.route_steps(from_tile, to_tile,
+                                                 pause_every):
+            if route is SEARCHING or route is WAITING:
+                yield route
+        if route is None:
+            yield None
+        else:
+            yield self._iter_waypoints(route, to_pos)
+
+    def follow_flow_field(self, from_pos, to_pos):
+        """Like find_path, but follow the (cached) flow field of the tile
+        containing to_pos instead of searching a path.
+
+        Meant for many objects sent to the same destination."""
+        field = self.flow_fields.get(self.pos_to_tile(to_pos))
+        return self._follow(field, self.pos_to_tile(from_pos), to_pos)
+
+    def follow_flow_field_steps(self, from_pos, to_pos, pause_every=256):
+        """Resumable version of follow_flow_field.
+
+        Return a generator which yields SEARCHING while the flow field is
+        not computed as far as from_pos and the result of
+        follow_flow_field as its last value."""
+        field = self.flow_fields.get(self.pos_to_tile(to_pos))
+        from_tile = self.pos_to_tile(from_pos)
+        for result in field.expand_steps(from_tile, pause_every):
+            yield result
+        yield self._follow(field, from_tile, to_pos)
+
+    def _follow(self, field, from_tile, to_pos):
+        if not field.reachable(from_tile):
+            return None
+        return self._iter_flow_waypoints(field, from_tile, to_pos)
+
+    def _iter_flow_waypoints(self, field, tile, to_pos):
+        prev_dir = None
+        direction = field.direction(tile)
+        while direction is not None:
+            if prev_dir is not None and direction != prev_dir:
+                yield self.tile_center(tile)
+            prev_dir = direction
+            tile = (tile[0] + direction[0], tile[1] + direction[1])
+            direction = field.direction(tile)
+        yield to_pos
+
+    def _iter_waypoints(self, route, to_pos):
+        # only yield the tiles where the path changes direction
+        prev_tile = route[0]
+        prev_dir = None
+        searched_from = None
+        i = 1
+        while i < len(route):
+            segment = self.pathfinder.refine(route[i - 1], route[i])
+            i += 1
+            if segment is None:
+                # tiles changed since the route was searched, search again
+                # from the last tile reached, unless that was just done
+                if prev_tile == searched_from:
+                    route = None
+                else:
+                    route = self.path_cache.find_route(prev_tile, route[-1])
+                    searched_from = prev_tile
+                if route is None:
+                    # stop where the path is cut
+                    yield self.tile_center(prev_tile)
+                    return
+                i = 1
+                continue
+            for tile in segment[1:]:
+                direction = (tile[0] - prev_tile[0], tile[1] - prev_tile[1])
+                if prev_dir is not None and direction != prev_dir:
+                    yield self.tile_center(prev_tile)
+                prev_tile = tile
+                prev_dir = direction
+        yield to_pos
+
+    def blocking_mask(self, tiles=None):
+        """Get a bool array which is True where tiles (the whole map if not
+        set) are blocking."""
+        if tiles is None:
+            if self._tiles is None:
+                return self.blocked.astype(bool)
+            tiles = self._tiles
+        mask = np.zeros(tiles.shape, dtype=bool)
+        for tile in Map.BLOCKING_TILES:
+            mask |= tiles == tile
+        return mask
+
+    def walkable_mask(self, tiles=None):
+        """Get a bool array which is True where tiles (the whole map if not
+        set) are walkable."""
+        return ~self.blocking_mask(tiles)
+
+    def fill_region(self, x, y, mask=None, diagonal=False):
+        """Get a bool array of the tiles connected to (x, y) in mask.
+
+        mask defaults to the walkable tiles if (x, y) is walkable, else to
+        the blocking tiles. With diagonal set tiles touching at corners
+        are connected, too."""
+        if mask is None:
+            mask = self.walkable_mask()
+            if not mask[y, x]:
+                mask = ~mask
+        region = np.zeros(mask.shape, dtype=bool)
+        if not mask[y, x]:
+            return region
+        region[y, x] = True
+        # grow the region by one tile per step, within the bounding box of
+        # what was reached so far
+        min_x = max_x = x
+        min_y = max_y = y
+        while True:
+            min_x = max(0, min_x - 1)
+            min_y = max(0, min_y - 1)
+            max_x = min(mask.shape[1] - 1, max_x + 1)
+            max_y = min(mask.shape[0] - 1, max_y + 1)
+            window = region[min_y:max_y + 1, min_x:max_x + 1]
+            grown = _grow(window, diagonal)
+            grown &= mask[min_y:max_y + 1, min_x:max_x + 1]
+            if np.array_equal(grown, window):
+                return region
+            region[min_y:max_y + 1, min_x:max_x + 1] = grown
+            rows = np.flatnonzero(region.any(axis=1))
+            cols = np.flatnonzero(region.any(axis=0))
+            min_y, max_y = rows[0], rows[-1]
+            min_x, max_x = cols[0], cols[-1]
+
+    def neighbourhood(self, x, y, radius=1):
+        """Get the tiles at most radius tiles away from (x, y) (clipped at
+        the map border), see tile_area."""
+        return self.tile_area(x - radius, y - radius,
+                              x + radius + 1, y + radius + 1)
+
+    def count_neighbours(self, mask, diagonal=True):
+        """Count for every tile how many of its neighbours are set in mask.
+
+        Only the four orthogonal neighbours are counted if diagonal is not
+        set."""
+        padded = np.pad(mask.astype(np.uint8), 1, 'constant')
+        height, width = mask.shape
+        counts = np.zeros(mask.shape, dtype=np.uint8)
+        for dy in (-1, 0, 1):
+            for dx in (-1, 0, 1):
+                if (dx == 0 and dy == 0) or (dx and dy and not diagonal):
+                    continue
+                counts += padded[1 + dy:1 + dy + height,
+                                 1 + dx:1 + dx + width]
+        return counts
+
+    def pos_to_tile(self, pos):
+        """Get coordinates of the tile that contains map position pos."""
+        return int(pos[0]) // Map._tile_size, int(pos[1]) // Map._tile_size
+
+    def tile_center(self, tile):
+        """Get map position of the center of a tile."""
+        return ((tile[0] * Map._tile_size) + Map._tile_size // 2,
+                (tile[1] * Map._tile_size) + Map._tile_size // 2)
+
     def draw(self, surface, view_rect, to_screen):
         """Draw map to surface.
 
         Only draw tiles in view_rect and use to_screen to convert
-        map coordinates to screen coordinates"""
-        tile_startx = max(0, view_rect.x // Map._tile_size)
-        tile_starty = max(0, view_rect.y // Map._tile_size)
-        tiles_x = min(self.tiles_x - tile_startx,
-                      view_rect.width // Map._tile_size)
-        tiles_y = min(self.tiles_y - tile_starty,
-                      view_rect.height // Map._tile_size)
-        tile_size = (Map._tile_size, Map._tile_size)
-        for y in range(tile_starty, tile_starty + tiles_y):
-            for x in range(tile_startx, tile_startx + tiles_x):
-                src_rect = self._get_tex_rect(self._get_tile(x, y))
-                tile_pos = (x * Map._tile_size, y * Map._tile_size)
-                dst_rect = Rect(to_screen(tile_pos), tile_size)
-                surface.blit(self._texmap, dst_rect, src_rect)
-
-    def _get_tile(self, x, y):
-        return self._tiles[y][x]
-
-    def _get_tex_rect(self, texture_id):
-        x = (texture_id % self._texmap_tiles_x) * self._tile_size
-        y = (texture_id // self._texmap_tiles_x) * self._tile_size
-        return x, y, self._tile_size, self._tile_size
\ No newline at end of file
+        map coordinates to screen coordinates. The map is drawn from
+        cached pre-rendered surfaces of SURFACE_CHUNK_TILES ** 2 tiles."""
+        chunk_px = Map.SURFACE_CHUNK_TILES * Map._tile_size
+        view_rect = view_rect.clip(self.size)
+        for cy in range(view_rect.top // chunk_px,
+                        (view_rect.bottom + chunk_px - 1) // chunk_px):
+            for cx in range(view_rect.left // chunk_px,
+                            (view_rect.right + chunk_px - 1) // chunk_px):
+                surface.blit(self._chunk_surface(cx, cy, surface),
+                             to_screen((cx * chunk_px, cy * chunk_px)))
+
+    def _chunk_surface(self, cx, cy, like_surface):
+        key = (cx, cy)
+        chunk_surface = self._surfaces.get(key)
+        if chunk_surface is not None:
+            # mark as most recently used
+            del self._surfaces[key]
+        else:
+            chunk_surface = self._render_chunk(cx, cy, like_surface)
+            while len(self._surfaces) >= Map.SURFACE_CACHE_SIZE:
+                self._surfaces.popitem(last=False)
+        self._surfaces[key] = chunk_surface
+        return chunk_surface
+
+    def _load_texmap(self):
+        self._texmap = image.load('content/texmap.png')
+        self._texmap_tiles_x = self._texmap.get_width() // Map._tile_size
+        self._texmap_tiles_y = self._texmap.get_height() // Map._tile_size
+
+    def _render_chunk(self, cx, cy, like_surface):
+        if self._texmap is None:
+            self._load_texmap()
+        tile_size = Map._tile_size
+        min_x = cx * Map.SURFACE_CHUNK_TILES
+        min_y = cy * Map.SURFACE_CHUNK_TILES
+        tiles = self.tile_area(min_x, min_y,
+                               min_x + Map.SURFACE_CHUNK_TILES,
+                               min_y + Map.SURFACE_CHUNK_TILES) \
+            .astype(np.intp)
+        tiles_y, tiles_x = tiles.shape
+        chunk_surface = Surface((tiles_x * tile_size, tiles_y * tile_size),
+                                0, like_surface)
+        # texture positions of all tiles at once
+        tex_x = ((tiles % self._texmap_tiles_x) * tile_size).tolist()
+        tex_y = ((tiles // self._texmap_tiles_x) * tile_size).tolist()
+        for row in range(tiles_y):
+            row_tex_x = tex_x[row]
+            row_tex_y = tex_y[row]
+            for col in range(tiles_x):
+                chunk_surface.blit(self._texmap,
+                                   (col * tile_size, row * tile_size),
+                                   (row_tex_x[col], row_tex_y[col],
+                                    tile_size, tile_size))
+        return chunk_surface
+
+    def _drop_surfaces(self, min_x, min_y, max_x, max_y):
+        """Drop the cached surfaces showing tiles in [min_x, max_x) x
+        [min_y, max_y)."""
+        size = Map.SURFACE_CHUNK_TILES
+        for cy in range(min_y // size, (max_y + size - 1) // size):
+            for cx in range(min_x // size, (max_x + size - 1) // size):
+                self._surfaces.pop((cx, cy), None)
\ No newline at end of file
@@ -0,0 +1,175 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""mapfile.py: binary map files
+
+A binary map file starts with a header of HEADER_SIZE bytes:
+
+    magic      4 bytes  'PDMP'
+    version    uint16
+    dtype      uint16   tile type, see DTYPES
+    tiles_x    uint32
+    tiles_y    uint32
+    layers     uint16
+    chunk_size uint16   0 if the map is not chunked (always 0 in version 1)
+
+followed by zeros up to HEADER_SIZE. All numbers are little endian. The
+tiles follow as layers * tiles_y * tiles_x values, row by row for each
+layer.
+
+Chunked maps store square chunks of chunk_size tiles instead, row by row.
+Each chunk holds layers * chunk_size * chunk_size values, so it can be
+read in one piece. Chunks at the right and lower border are filled up
+with zeros."""
+
+import struct
+import sys
+
+import numpy as np
+
+
+class MapFileError(Exception):
+    pass
+
+
+MAGIC = b'PDMP'
+VERSION = 2
+EXTENSION = '.bmap'
+HEADER_SIZE = 64
+_HEADER = struct.Struct('<4sHHIIHH')
+
+# dtype code in the header -> tile type
+DTYPES = {
+    1: np.dtype('<u1'),
+    2: np.dtype('<u2'),
+    3: np.dtype('<u4'),
+}
+
+
+def read_header(fh):
+    """Read the header of a binary map file.
+
+    Return (dtype, tiles_x, tiles_y, layers, chunk_size)."""
+    data = fh.read(HEADER_SIZE)
+    if len(data) < HEADER_SIZE:
+        raise MapFileError("file too short for header")
+    magic, version, dtype_code, tiles_x, tiles_y, layers, chunk_size = \
+        _HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise MapFileError("not a binary map file")
+    if not 1 <= version <= VERSION:
+        raise MapFileError("unsupported version " + str(version))
+    if dtype_code not in DTYPES:
+        raise MapFileError("unknown tile type " + str(dtype_code))
+    return DTYPES[dtype_code], tiles_x, tiles_y, layers, chunk_size
+
+
+def read_map_header(path):
+    """Like read_header, but open the file at path."""
+    fh = open(path, 'rb')
+    try:
+        return read_header(fh)
+    finally:
+        fh.close()
+
+
+def open_map(path, writable=False):
+    """Memory map the tiles of a binary map file.
+
+    Return an array of shape (layers, tiles_y, tiles_x). Tiles are read
+    from the file when they are first accessed. Changes are written back
+    to the file only if writable is set, otherwise they stay in memory."""
+    dtype, tiles_x, tiles_y, layers, chunk_size = read_map_header(path)
+    if chunk_size:
+        raise MapFileError("map is chunked, use open_chunked_map")
+    return np.memmap(path, dtype=dtype, mode='r+' if writable else 'c',
+                     offset=HEADER_SIZE, shape=(layers, tiles_y, tiles_x))
+
+
+def open_chunked_map(path):
+    """Memory map the chunks of a chunked binary map file (read only).
+
+    Return (chunks, tiles_x, tiles_y) where chunks is an array of shape
+    (chunks_y, chunks_x, layers, chunk_size, chunk_size)."""
+    dtype, tiles_x, tiles_y, layers, chunk_size = read_map_header(path)
+    if not chunk_size:
+        raise MapFileError("map is not chunked")
+    shape = ((tiles_y + chunk_size - 1) // chunk_size,
+             (tiles_x + chunk_size - 1) // chunk_size,
+             layers, chunk_size, chunk_size)
+    chunks = np.memmap(path, dtype=dtype, mode='r', offset=HEADER_SIZE,
+                       shape=shape)
+    return chunks, tiles_x, tiles_y
+
+
+def write_map(path, tiles, chunk_size=0):
+    """Write tiles (array of shape (tiles_y, tiles_x) or (layers, tiles_y,
+    tiles_x)) to a binary map file, in chunks of chunk_size tiles if
+    set."""
+    tiles = np.asarray(tiles)
+    if tiles.ndim == 2:
+        tiles = tiles[np.newaxis]
+    if tiles.ndim != 3:
+        raise MapFileError("tiles have to be two or three dimensional")
+    for code, dtype in DTYPES.items():
+        if tiles.dtype.newbyteorder('<') == dtype:
+            break
+    else:
+        raise MapFileError("unsupported tile type " + str(tiles.dtype))
+    layers, tiles_y, tiles_x = tiles.shape
+    header = _HEADER.pack(MAGIC, VERSION, code, tiles_x, tiles_y, layers,
+                          chunk_size)
+    fh = open(path, 'wb')
+    try:
+        fh.write(header.ljust(HEADER_SIZE, b'\0'))
+        if not chunk_size:
+            fh.write(np.ascontiguousarray(tiles, dtype=dtype).tobytes())
+            return
+        chunk = np.zeros((layers, chunk_size, chunk_size), dtype=dtype)
+        for y in range(0, tiles_y, chunk_size):
+            for x in range(0, tiles_x, chunk_size):
+                part = tiles[:, y:y + chunk_size, x:x + chunk_size]
+                chunk.fill(0)
+                chunk[:, :part.shape[1], :part.shape[2]] = part
+                fh.write(chunk.tobytes())
+    finally:
+        fh.close()
+
+
+def read_text_map(path):
+    """Read a text map (one line of whitespace separated tile numbers per
+    row) into a uint16 array of shape (tiles_y, tiles_x)."""
+    rows = []
+    fh = open(path, 'r')
+    try:
+        for line in fh:
+            items = [int(x) for x in line.split()]
+            if rows and len(rows[0]) != len(items):
+                raise MapFileError("line width does not match first line")
+            rows.append(items)
+    finally:
+        fh.close()
+    return np.array(rows, dtype=np.uint16)
+
+
+def convert_text_map(text_path, binary_path=None, chunk_size=0):
+    """Convert a text map to a binary map file next to it (or binary_path)
+    and return the path of the binary file."""
+    if binary_path is None:
+        base = text_path[:-4] if text_path.endswith('.map') else text_path
+        binary_path = base + EXTENSION
+    write_map(binary_path, read_text_map(text_path), chunk_size)
+    return binary_path
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    chunk_size = 0
+    if len(args) >= 2 and args[0] == '--chunk-size':
+        chunk_size = int(args[1])
+        args = args[2:]
+    if not args:
+        sys.exit("usage: mapfile.py [--chunk-size N] text.map [text.map ...]")
+    for name in args:
+        print(convert_text_map(name, chunk_size=chunk_size))
\ No newline at end of file
@@ -2,13 +2,1566 @@
 # License, v. 2.0. If a copy of the MPL was not distributed with this
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 
-"""pathfinding.py: """
+"""pathfinding.py: path search on the tile grid"""
+
+from array import array
+from collections import OrderedDict
+import ctypes
+from functools import partial
+from heapq import heappush, heappop
+from itertools import product
+
+import numpy as np
+
+# integer step costs keep f values exact, so ties are broken by h
+# instead of by floating point noise
+STRAIGHT_COST = 10
+DIAGONAL_COST = 14
+DIAGONAL_EXTRA = DIAGONAL_COST - STRAIGHT_COST
+
+# the eight grid directions as (dx, dy), DIRECTIONS[7 - i] is the
+# opposite of DIRECTIONS[i]
+DIRECTIONS = [(dx, dy) for dy in (-1, 0, 1) for dx in (-1, 0, 1)
+              if dx or dy]
+NO_DIRECTION = 255
+
+
+class PathfindingError(Exception):
+    pass
+
+
+def octile_dist(x1, y1, x2, y2):
+    """Distance on an 8-connected grid in step cost units."""
+    dx = abs(x1 - x2)
+    dy = abs(y1 - y2)
+    if dx > dy:
+        return STRAIGHT_COST * dx + DIAGONAL_EXTRA * dy
+    return STRAIGHT_COST * dy + DIAGONAL_EXTRA * dx
+
+
+def _sign(n):
+    return (n > 0) - (n < 0)
+
+
+def _zeros(ctype, count):
+    """Get a ctypes array of count zeros. Unlike array(...) * count its
+    memory is only used as far as it is written to."""
+    return (ctype * count).from_buffer(np.zeros(count, dtype=ctype))
+
+
+class SearchState(object):
+    """Node state of a grid search.
+
+    The state lives in flat 32 bit arrays indexed by y * size_x + x which
+    are allocated once, 16 bytes per node of which only the parts reached
+    by searches take up memory. Every search uses a new generation number,
+    an entry is only valid if its generation matches the current one, so
+    the arrays never have to be cleared between searches."""
+
+    _MAX_GENERATION = 0xffffffff
+
+    def __init__(self, node_count):
+        self.g_cost = _zeros(ctypes.c_int32, node_count)
+        self.parent = _zeros(ctypes.c_int32, node_count)
+        self.seen = _zeros(ctypes.c_uint32, node_count)
+        self.closed = _zeros(ctypes.c_uint32, node_count)
+        self.generation = 0
+
+    def next_generation(self):
+        """Start a new search and return its generation number."""
+        if self.generation == SearchState._MAX_GENERATION:
+            node_count = len(self.seen)
+            self.seen = _zeros(ctypes.c_uint32, node_count)
+            self.closed = _zeros(ctypes.c_uint32, node_count)
+            self.generation = 0
+        self.generation += 1
+        return self.generation
+
+
+# yielded by resumable searches that are not finished yet
+SEARCHING = object()
+# yielded by resumable searches waiting for a result from another process
+WAITING = object()
 
 
 class Pathfinder(object):
-    def __init__(self, size_x, size_y):
+    """A* search on a size_x * size_y tile grid.
+
+    Searches use a preallocated SearchState. Resumable searches started
+    with route_steps get a second one, so they can be paused while other
+    searches run, and start over if tiles changed during a pause."""
+
+    # refine connects route tiles with straight or diagonal lines
+    LINEAR_SEGMENTS = True
+
+    def __init__(self, size_x, size_y, corner_cutting=False):
         self._size_x = size_x
         self._size_y = size_y
+        self.corner_cutting = corner_cutting
+
+        node_count = size_x * size_y
+        self._blocked = bytearray(node_count)
+        self._state = SearchState(node_count)
+        self._background_state = None
+        # changed with the tiles, resumable searches start over then
+        self._version = 0
+
+        # (dx, dy, index offset, cost) in the order of DIRECTIONS
+        self._neighbours = [(dx, dy, dy * size_x + dx,
+                             DIAGONAL_COST if dx and dy else STRAIGHT_COST)
+                            for dx, dy in DIRECTIONS]
+
+        self.last_expanded = 0
+
+    @property
+    def size(self):
+        return self._size_x, self._size_y
+
+    @property
+    def version(self):
+        """Number that changes whenever tiles change."""
+        return self._version
+
+    def set_blocked(self, x, y, blocked=True):
+        """Mark tile (x, y) as (not) walkable."""
+        node = y * self._size_x + x
+        blocked = 1 if blocked else 0
+        if self._blocked[node] != blocked:
+            self._blocked[node] = blocked
+            self._version += 1
+
+    def set_all_blocked(self, blocked):
+        """Set the walkability of all tiles from blocked, a buffer of
+        size_x * size_y bytes in row major order (1 for blocked tiles)."""
+        self._blocked[:] = blocked
+        self._version += 1
+
+    @property
+    def blocked(self):
+        """The bytearray of blocked flags (row major), change it only
+        through set_blocked or set_all_blocked."""
+        return self._blocked
+
+    def is_blocked(self, x, y):
+        """Check if (x, y) is outside the grid or not walkable."""
+        if not (0 <= x < self._size_x and 0 <= y < self._size_y):
+            return True
+        return self._blocked[y * self._size_x + x] != 0
 
     def find_path(self, from_coords, to_coords):
-        pass
\ No newline at end of file
+        """Find a path between two tiles.
+
+        Return the list of tile coordinates from from_coords to to_coords
+        (both included) or None if there is no path. Diagonal steps are
+        only taken if both adjacent orthogonal tiles are walkable, or one
+        of them if corner_cutting is set."""
+        route = self.find_route(from_coords, to_coords)
+        if route is None:
+            return None
+        path = [route[0]]
+        for i in range(1, len(route)):
+            path.extend(self.refine(route[i - 1], route[i])[1:])
+        return path
+
+    def find_route(self, from_coords, to_coords):
+        """Find a coarse route between two tiles.
+
+        Consecutive tiles of the route are connected by refine. The flat
+        search returns the complete path."""
+        if self.is_blocked(*from_coords) or self.is_blocked(*to_coords):
+            return None
+        if self._search(from_coords, to_coords) is None:
+            return None
+        return self._reconstruct(to_coords)
+
+    def route_steps(self, from_coords, to_coords, pause_every=256):
+        """Resumable version of find_route.
+
+        Return a generator which yields SEARCHING after every pause_every
+        expanded nodes and the result of find_route as its last value. The
+        search starts over if tiles changed during a pause, so the route
+        fits the tiles at the time it is returned."""
+        while True:
+            version = self._version
+            steps = self._route_steps(from_coords, to_coords, pause_every)
+            for route in steps:
+                if route is not SEARCHING:
+                    yield route
+                    return
+                yield SEARCHING
+                if self._version != version:
+                    steps.close()
+                    break
+
+    def _route_steps(self, from_coords, to_coords, pause_every):
+        """Generator running find_route in the background state, see
+        route_steps."""
+        if self.is_blocked(*from_coords) or self.is_blocked(*to_coords):
+            yield None
+            return
+        if self._background_state is None:
+            self._background_state = SearchState(self._size_x * self._size_y)
+        state = self._background_state
+        for cost in self._search_steps(from_coords, to_coords, None, state,
+                                       pause_every):
+            if cost is SEARCHING:
+                yield SEARCHING
+        if cost is None:
+            yield None
+        else:
+            yield self._reconstruct(to_coords, state)
+
+    def refine(self, from_coords, to_coords):
+        """Get the tile path between two consecutive tiles of a route, a
+        straight or diagonal line, or None if tiles changed since the route
+        was searched and a step of the line is not possible anymore."""
+        dx = _sign(to_coords[0] - from_coords[0])
+        dy = _sign(to_coords[1] - from_coords[1])
+        steps = max(abs(to_coords[0] - from_coords[0]),
+                    abs(to_coords[1] - from_coords[1]))
+        max_blocked_sides = 1 if self.corner_cutting else 0
+        x, y = from_coords
+        path = [from_coords]
+        for _ in range(steps):
+            if self.is_blocked(x + dx, y + dy):
+                return None
+            if dx and dy and (self.is_blocked(x + dx, y) +
+                              self.is_blocked(x, y + dy) >
+                              max_blocked_sides):
+                return None
+            x += dx
+            y += dy
+            path.append((x, y))
+        return path
+
+    def refine_bounds(self, from_coords, to_coords):
+        """Get the area (min_x, min_y, max_x, max_y) that the refined path
+        between two consecutive tiles of a route stays in."""
+        return (min(from_coords[0], to_coords[0]),
+                min(from_coords[1], to_coords[1]),
+                max(from_coords[0], to_coords[0]) + 1,
+                max(from_coords[1], to_coords[1]) + 1)
+
+    def find_local_path(self, from_coords, to_coords, bounds):
+        """Find a path with plain A* that does not leave bounds
+        (min_x, min_y, max_x, max_y), return None if there is none."""
+        if self.is_blocked(*from_coords) or self.is_blocked(*to_coords):
+            return None
+        for cost in Pathfinder._search_steps(self, from_coords, to_coords,
+                                             bounds):
+            pass
+        if cost is None:
+            return None
+        return self._reconstruct(to_coords)
+
+    def _search(self, from_coords, to_coords, bounds=None):
+        """Run A* from from_coords to to_coords and return the path cost.
+
+        If bounds (min_x, min_y, max_x, max_y) is set the search does not
+        leave that area. Returns None if there is no path, otherwise the
+        path can be read with _reconstruct until the next search."""
+        for cost in self._search_steps(from_coords, to_coords, bounds):
+            pass
+        return cost
+
+    def _search_steps(self, from_coords, to_coords, bounds=None, state=None,
+                      pause_every=0):
+        """Generator running _search in state, yields SEARCHING after every
+        pause_every expanded nodes (if set) and the path cost at the end."""
+        size_x = self._size_x
+        if bounds is None:
+            min_x, min_y, max_x, max_y = 0, 0, size_x, self._size_y
+        else:
+            min_x, min_y, max_x, max_y = bounds
+        if state is None:
+            state = self._state
+        blocked = self._blocked
+        g_cost = state.g_cost
+        parent = state.parent
+        seen = state.seen
+        closed = state.closed
+        neighbours = self._neighbours
+        max_blocked_sides = 1 if self.corner_cutting else 0
+        gen = state.next_generation()
+
+        goal_x, goal_y = to_coords
+        start = from_coords[1] * size_x + from_coords[0]
+        goal = goal_y * size_x + goal_x
+
+        seen[start] = gen
+        g_cost[start] = 0
+        parent[start] = -1
+        h = octile_dist(from_coords[0], from_coords[1], goal_x, goal_y)
+        open_heap = [(h, h, start)]
+        expanded = 0
+        next_pause = pause_every if pause_every else -1
+
+        while open_heap:
+            node = heappop(open_heap)[2]
+            if closed[node] == gen:
+                continue
+            if node == goal:
+                self.last_expanded = expanded
+                yield g_cost[goal]
+                return
+            closed[node] = gen
+            expanded += 1
+            if expanded == next_pause:
+                next_pause += pause_every
+                yield SEARCHING
+
+            y, x = divmod(node, size_x)
+            g = g_cost[node]
+            for dx, dy, offset, cost in neighbours:
+                nx = x + dx
+                ny = y + dy
+                if not (min_x <= nx < max_x and min_y <= ny < max_y):
+                    continue
+                neighbour = node + offset
+                if blocked[neighbour] or closed[neighbour] == gen:
+                    continue
+                if dx and dy and (blocked[node + dx] +
+                                  blocked[node + dy * size_x] >
+                                  max_blocked_sides):
+                    continue
+
+                new_g = g + cost
+                if seen[neighbour] == gen and new_g >= g_cost[neighbour]:
+                    continue
+                seen[neighbour] = gen
+                g_cost[neighbour] = new_g
+                parent[neighbour] = node
+
+                adx = abs(nx - goal_x)
+                ady = abs(ny - goal_y)
+                if adx > ady:
+                    h = STRAIGHT_COST * adx + DIAGONAL_EXTRA * ady
+                else:
+                    h = STRAIGHT_COST * ady + DIAGONAL_EXTRA * adx
+                heappush(open_heap, (new_g + h, h, neighbour))
+
+        self.last_expanded = expanded
+        yield None
+
+    def _reconstruct(self, to_coords, state=None):
+        size_x = self._size_x
+        node = to_coords[1] * size_x + to_coords[0]
+        parent = (self._state if state is None else state).parent
+        path = []
+        while node != -1:
+            path.append((node % size_x, node // size_x))
+            node = parent[node]
+        path.reverse()
+        return path
+
+
+class HierarchicalPathfinder(Pathfinder):
+    """Hierarchical A* (HPA*) on a tile grid.
+
+    The grid is split into square clusters. Entrances are placed on the
+    walkable runs along cluster borders and connected by the distances
+    between the entrances of each cluster, which gives a small abstract
+    graph. Routes are searched on that graph and each route segment is
+    refined with an A* search limited to one cluster when it is needed.
+
+    Entrances are found for the whole map before the first search, the
+    distances inside a cluster are computed the first time a search
+    reaches the cluster (or by precompute). Changing a tile only rebuilds
+    its own cluster and the entrances of the borders the tile lies on.
+
+    Resumable searches (route_steps) pause while finding entrances and
+    building clusters, too, and start over if tiles changed meanwhile."""
+
+    # borders whose entrances are found (or clusters whose entrances are
+    # updated) between pauses of route_steps
+    BORDERS_PER_STEP = 64
+
+    # walkable border runs at least this long get two entrances
+    LONG_ENTRANCE = 6
+    LINEAR_SEGMENTS = False
+
+    def __init__(self, size_x, size_y, corner_cutting=False,
+                 cluster_size=16):
+        Pathfinder.__init__(self, size_x, size_y, corner_cutting)
+        self.cluster_size = cluster_size
+        self._clusters_x = (size_x + cluster_size - 1) // cluster_size
+        self._clusters_y = (size_y + cluster_size - 1) // cluster_size
+
+        # (cluster, right or lower neighbour cluster) -> [(tile, tile)]
+        self._transitions = None
+        # cluster -> set of abstract nodes (tile indices) in that cluster
+        self._cluster_nodes = None
+        # abstract node -> {abstract node: cost}
+        self._edges = None
+
+        # clusters whose intra cluster edges are missing or outdated
+        self._unbuilt = None
+        self._dirty_clusters = None
+        self._dirty_borders = None
+        # clusters next to borders with new entrances
+        self._touched = None
+        self._reset_abstraction()
+
+    def set_blocked(self, x, y, blocked=True):
+        """Mark tile (x, y) as (not) walkable."""
+        blocked = 1 if blocked else 0
+        if self._blocked[y * self._size_x + x] == blocked:
+            return
+        Pathfinder.set_blocked(self, x, y, blocked)
+
+        cluster = self._cluster_at(x, y)
+        min_x, min_y, max_x, max_y = self._cluster_bounds(cluster)
+        self._dirty_clusters.add(cluster)
+        for border in self._borders(cluster):
+            first, second = border
+            if self._is_vertical(border):
+                on_border = x == (max_x - 1 if first == cluster else min_x)
+            else:
+                on_border = y == (max_y - 1 if first == cluster else min_y)
+            if on_border:
+                self._dirty_borders.add(border)
+
+    def set_all_blocked(self, blocked):
+        """Set the walkability of all tiles, see Pathfinder.set_all_blocked.
+
+        The abstract graph is rebuilt on demand."""
+        Pathfinder.set_all_blocked(self, blocked)
+        self._reset_abstraction()
+
+    def _reset_abstraction(self):
+        cluster_count = self._clusters_x * self._clusters_y
+        self._transitions = {}
+        self._cluster_nodes = [set() for _ in range(cluster_count)]
+        self._edges = {}
+        self._unbuilt = set(range(cluster_count))
+        self._dirty_clusters = set()
+        self._dirty_borders = set()
+        self._touched = set()
+        for cluster in range(cluster_count):
+            self._dirty_borders.update(self._borders(cluster))
+
+    def precompute(self):
+        """Build the complete abstract graph now instead of on demand."""
+        for _ in self._update_abstraction():
+            pass
+        for cluster in list(self._unbuilt):
+            for _ in self._build_cluster(cluster):
+                pass
+
+    def find_route(self, from_coords, to_coords):
+        """Find a route of cluster entrances between two tiles.
+
+        The route starts with from_coords and ends with to_coords,
+        returns None if there is no path."""
+        for route in self._route_steps(from_coords, to_coords, 0):
+            pass
+        return route
+
+    def _route_steps(self, from_coords, to_coords, pause_every):
+        """Generator running find_route for route_steps, yields SEARCHING
+        after about every pause_every abstract edges followed, every
+        BORDERS_PER_STEP borders whose entrances are found and every
+        entrance connected in a new cluster."""
+        if self.is_blocked(*from_coords) or self.is_blocked(*to_coords):
+            yield None
+            return
+        for step in self._update_abstraction(pause_every):
+            yield step
+
+        start_cluster = self._cluster_at(*from_coords)
+        if start_cluster == self._cluster_at(*to_coords) and \
+                self._search(from_coords, to_coords,
+                             self._cluster_bounds(start_cluster)) is not None:
+            yield [from_coords, to_coords]
+            return
+
+        size_x = self._size_x
+        start = from_coords[1] * size_x + from_coords[0]
+        goal = to_coords[1] * size_x + to_coords[0]
+        edges = self._edges
+        temp_nodes = [(node, self._cluster_at(node % size_x, node // size_x))
+                      for node in (start, goal) if node not in edges]
+        try:
+            for node, cluster in temp_nodes:
+                edges[node] = {}
+                self._connect(node, self._cluster_nodes[cluster], cluster)
+            for route in self._search_abstract(start, goal, pause_every):
+                if route is SEARCHING:
+                    yield SEARCHING
+        finally:
+            for node, cluster in temp_nodes:
+                # tiles changed during a pause may have made it an entrance
+                if node in self._cluster_nodes[cluster]:
+                    continue
+                for other in edges.pop(node, ()):
+                    if other in edges:
+                        edges[other].pop(node, None)
+
+        if route is None:
+            yield None
+        else:
+            yield [(node % size_x, node // size_x) for node in route]
+
+    def refine(self, from_coords, to_coords):
+        """Get the tile path between two consecutive tiles of a route."""
+        cluster = self._cluster_at(*from_coords)
+        if cluster != self._cluster_at(*to_coords):
+            # a step across the border
+            return Pathfinder.refine(self, from_coords, to_coords)
+        if self._search(from_coords, to_coords,
+                        self._cluster_bounds(cluster)) is None:
+            return None
+        return self._reconstruct(to_coords)
+
+    def refine_bounds(self, from_coords, to_coords):
+        """Get the area (min_x, min_y, max_x, max_y) that the refined path
+        between two consecutive tiles of a route stays in."""
+        cluster = self._cluster_at(*from_coords)
+        if cluster != self._cluster_at(*to_coords):
+            return Pathfinder.refine_bounds(self, from_coords, to_coords)
+        return self._cluster_bounds(cluster)
+
+    def _cluster_at(self, x, y):
+        return (y // self.cluster_size) * self._clusters_x + \
+            x // self.cluster_size
+
+    def _cluster_bounds(self, cluster):
+        cluster_size = self.cluster_size
+        min_x = (cluster % self._clusters_x) * cluster_size
+        min_y = (cluster // self._clusters_x) * cluster_size
+        return (min_x, min_y,
+                min(min_x + cluster_size, self._size_x),
+                min(min_y + cluster_size, self._size_y))
+
+    def _borders(self, cluster):
+        """Get keys of the borders between cluster and its neighbours."""
+        cx = cluster % self._clusters_x
+        cy = cluster // self._clusters_x
+        borders = []
+        if cx > 0:
+            borders.append((cluster - 1, cluster))
+        if cx < self._clusters_x - 1:
+            borders.append((cluster, cluster + 1))
+        if cy > 0:
+            borders.append((cluster - self._clusters_x, cluster))
+        if cy < self._clusters_y - 1:
+            borders.append((cluster, cluster + self._clusters_x))
+        return borders
+
+    def _is_vertical(self, border):
+        """Check if border separates a left and a right cluster."""
+        return border[1] == border[0] + 1 and self._clusters_x > 1
+
+    def _find_transitions(self, border):
+        """Get pairs of adjacent tiles that connect the clusters of border."""
+        size_x = self._size_x
+        blocked = self._blocked
+        min_x, min_y, max_x, max_y = self._cluster_bounds(border[0])
+        if self._is_vertical(border):
+            side = [y * size_x + max_x - 1 for y in range(min_y, max_y)]
+            step = 1
+        else:
+            side = [(max_y - 1) * size_x + x for x in range(min_x, max_x)]
+            step = size_x
+
+        transitions = []
+        run = []
+        for tile in side + [None]:
+            if tile is not None and not blocked[tile] and \
+                    not blocked[tile + step]:
+                run.append(tile)
+                continue
+            if len(run) >= HierarchicalPathfinder.LONG_ENTRANCE:
+                transitions.append((run[0], run[0] + step))
+                transitions.append((run[-1], run[-1] + step))
+            elif len(run) > 0:
+                middle = run[len(run) // 2]
+                transitions.append((middle, middle + step))
+            run = []
+        return transitions
+
+    def _update_abstraction(self, pause_every=0):
+        """Generator applying tile changes to entrances and marking
+        clusters for rebuild, yields SEARCHING after every BORDERS_PER_STEP
+        borders or clusters if pause_every is set."""
+        per_step = HierarchicalPathfinder.BORDERS_PER_STEP
+        done = 0
+        # the sets may be replaced by set_all_blocked during a pause
+        while self._dirty_borders:
+            border = self._dirty_borders.pop()
+            self._transitions[border] = self._find_transitions(border)
+            self._touched.update(border)
+            done += 1
+            if pause_every and done % per_step == 0:
+                yield SEARCHING
+
+        while self._touched:
+            cluster = self._touched.pop()
+            nodes = self._cluster_node_set(cluster)
+            if nodes != self._cluster_nodes[cluster]:
+                self._reset_cluster(cluster, nodes)
+                self._unbuilt.add(cluster)
+            done += 1
+            if pause_every and done % per_step == 0:
+                yield SEARCHING
+
+        self._unbuilt.update(self._dirty_clusters)
+        self._dirty_clusters = set()
+
+    def _cluster_node_set(self, cluster):
+        nodes = set()
+        for border in self._borders(cluster):
+            for tile_a, tile_b in self._transitions[border]:
+                nodes.add(tile_a if border[0] == cluster else tile_b)
+        return nodes
+
+    def _reset_cluster(self, cluster, nodes):
+        """Replace the abstract nodes of cluster, keeping only the edges
+        to neighbouring clusters."""
+        edges = self._edges
+        for node in self._cluster_nodes[cluster]:
+            for other in edges.pop(node):
+                if other in edges:
+                    edges[other].pop(node, None)
+
+        self._cluster_nodes[cluster] = nodes
+        for node in nodes:
+            edges[node] = {}
+
+        for border in self._borders(cluster):
+            for tile_a, tile_b in self._transitions[border]:
+                edges.setdefault(tile_a, {})[tile_b] = STRAIGHT_COST
+                edges.setdefault(tile_b, {})[tile_a] = STRAIGHT_COST
+
+    def _build_cluster(self, cluster):
+        """Generator computing the edges between the abstract nodes of a
+        cluster, yields SEARCHING after connecting each node."""
+        edges = self._edges
+        nodes = self._cluster_nodes[cluster]
+        for node in nodes:
+            for other in list(edges[node]):
+                if other in nodes:
+                    del edges[node][other]
+
+        remaining = set(nodes)
+        for node in nodes:
+            remaining.discard(node)
+            self._connect(node, remaining, cluster)
+            yield SEARCHING
+        self._unbuilt.discard(cluster)
+
+    def _connect(self, node, others, cluster):
+        """Add intra cluster edges between node and others."""
+        edges = self._edges
+        for other, cost in self._costs_to(node, others, cluster).items():
+            edges[node][other] = cost
+            edges[other][node] = cost
+
+    def _costs_to(self, node, targets, cluster):
+        """Run Dijkstra from node inside cluster until all targets are
+        reached, return dict of reachable targets and their path costs."""
+        size_x = self._size_x
+        min_x, min_y, max_x, max_y = self._cluster_bounds(cluster)
+        blocked = self._blocked
+        g_cost = self._state.g_cost
+        seen = self._state.seen
+        closed = self._state.closed
+        neighbours = self._neighbours
+        max_blocked_sides = 1 if self.corner_cutting else 0
+        gen = self._state.next_generation()
+
+        remaining = set(targets)
+        remaining.discard(node)
+        costs = {}
+        seen[node] = gen
+        g_cost[node] = 0
+        open_heap = [(0, node)]
+
+        while open_heap and remaining:
+            g, current = heappop(open_heap)
+            if closed[current] == gen:
+                continue
+            closed[current] = gen
+            if current in remaining:
+                remaining.discard(current)
+                costs[current] = g
+
+            y, x = divmod(current, size_x)
+            for dx, dy, offset, cost in neighbours:
+                nx = x + dx
+                ny = y + dy
+                if not (min_x <= nx < max_x and min_y <= ny < max_y):
+                    continue
+                neighbour = current + offset
+                if blocked[neighbour] or closed[neighbour] == gen:
+                    continue
+                if dx and dy and (blocked[current + dx] +
+                                  blocked[current + dy * size_x] >
+                                  max_blocked_sides):
+                    continue
+                new_g = g + cost
+                if seen[neighbour] == gen and new_g >= g_cost[neighbour]:
+                    continue
+                seen[neighbour] = gen
+                g_cost[neighbour] = new_g
+                heappush(open_heap, (new_g, neighbour))
+
+        return costs
+
+    def _search_abstract(self, start, goal, pause_every=0):
+        """Generator running A* on the abstract graph, yields SEARCHING
+        after about every pause_every edges followed (if set) and while
+        building clusters, and the list of nodes or None at the end."""
+        size_x = self._size_x
+        edges = self._edges
+        unbuilt = self._unbuilt
+        goal_x = goal % size_x
+        goal_y = goal // size_x
+
+        g_cost = {start: 0}
+        parent = {start: None}
+        closed = set()
+        h = octile_dist(start % size_x, start // size_x, goal_x, goal_y)
+        open_heap = [(h, h, start)]
+        followed = 0
+        next_pause = pause_every
+
+        while open_heap:
+            node = heappop(open_heap)[2]
+            if node in closed:
+                continue
+            if node == goal:
+                route = []
+                while node is not None:
+                    route.append(node)
+                    node = parent[node]
+                route.reverse()
+                yield route
+                return
+            closed.add(node)
+            if pause_every and followed >= next_pause:
+                next_pause = followed + pause_every
+                yield SEARCHING
+
+            x = node % size_x
+            y = node // size_x
+            cluster = self._cluster_at(x, y)
+            if cluster in unbuilt:
+                for step in self._build_cluster(cluster):
+                    if pause_every:
+                        yield step
+
+            g = g_cost[node]
+            node_edges = edges[node]
+            followed += len(node_edges)
+            for other, cost in node_edges.items():
+                if other in closed:
+                    continue
+                new_g = g + cost
+                if other in g_cost and new_g >= g_cost[other]:
+                    continue
+                g_cost[other] = new_g
+                parent[other] = node
+                h = octile_dist(other % size_x, other // size_x,
+                                goal_x, goal_y)
+                heappush(open_heap, (new_g + h, h, other))
+
+        yield None
+
+
+class JumpPointPathfinder(Pathfinder):
+    """Jump point search (JPS) on a uniform cost tile grid.
+
+    Instead of adding every neighbour to the open list the search jumps
+    along straight and diagonal lines and only stops at tiles where an
+    obstacle forces a turn, so symmetric paths are not expanded. Routes
+    consist of these jump points, the tiles in between lie on a straight
+    or diagonal line. Path costs are the same as with Pathfinder using
+    the same corner_cutting setting.
+
+    Jumps scan a copy of the grid with a blocked border of one tile, so
+    the scans need no bounds checks."""
+
+    def __init__(self, size_x, size_y, corner_cutting=False):
+        Pathfinder.__init__(self, size_x, size_y, corner_cutting)
+        self._width = size_x + 2
+        self._padded = bytearray([1]) * (self._width * (size_y + 2))
+        for y in range(size_y):
+            row = (y + 1) * self._width + 1
+            self._padded[row:row + size_x] = bytearray(size_x)
+
+    def set_blocked(self, x, y, blocked=True):
+        """Mark tile (x, y) as (not) walkable."""
+        Pathfinder.set_blocked(self, x, y, blocked)
+        self._padded[(y + 1) * self._width + x + 1] = 1 if blocked else 0
+
+    def set_all_blocked(self, blocked):
+        """Set the walkability of all tiles, see Pathfinder.set_all_blocked.
+        """
+        Pathfinder.set_all_blocked(self, blocked)
+        size_x = self._size_x
+        for y in range(self._size_y):
+            row = (y + 1) * self._width + 1
+            self._padded[row:row + size_x] = \
+                self._blocked[y * size_x:(y + 1) * size_x]
+
+    def _search_steps(self, from_coords, to_coords, bounds=None, state=None,
+                      pause_every=0):
+        """Run the jump point search, see Pathfinder._search_steps."""
+        if bounds is not None:
+            raise PathfindingError("jump point search can not be bounded")
+
+        size_x = self._size_x
+        width = self._width
+        if state is None:
+            state = self._state
+        g_cost = state.g_cost
+        parent = state.parent
+        seen = state.seen
+        closed = state.closed
+        gen = state.next_generation()
+        jump = self._prepare()
+
+        goal_x, goal_y = to_coords
+        start = from_coords[1] * size_x + from_coords[0]
+        goal = goal_y * size_x + goal_x
+        padded_goal = (goal_y + 1) * width + goal_x + 1
+
+        seen[start] = gen
+        g_cost[start] = 0
+        parent[start] = -1
+        h = octile_dist(from_coords[0], from_coords[1], goal_x, goal_y)
+        open_heap = [(h, h, start)]
+        expanded = 0
+        next_pause = pause_every if pause_every else -1
+
+        while open_heap:
+            node = heappop(open_heap)[2]
+            if closed[node] == gen:
+                continue
+            if node == goal:
+                self.last_expanded = expanded
+                yield g_cost[goal]
+                return
+            closed[node] = gen
+            expanded += 1
+            if expanded == next_pause:
+                next_pause += pause_every
+                yield SEARCHING
+
+            y, x = divmod(node, size_x)
+            g = g_cost[node]
+            padded_node = (y + 1) * width + x + 1
+            if parent[node] == -1:
+                directions = self._start_directions(padded_node)
+            else:
+                parent_y, parent_x = divmod(parent[node], size_x)
+                directions = self._pruned_directions(
+                    padded_node, _sign(x - parent_x), _sign(y - parent_y))
+
+            for dx, dy in directions:
+                jump_point = jump(padded_node, dx, dy, padded_goal)
+                if jump_point < 0:
+                    continue
+                jump_y, jump_x = divmod(jump_point, width)
+                jump_x -= 1
+                jump_y -= 1
+                successor = jump_y * size_x + jump_x
+                if closed[successor] == gen:
+                    continue
+
+                new_g = g + octile_dist(x, y, jump_x, jump_y)
+                if seen[successor] == gen and new_g >= g_cost[successor]:
+                    continue
+                seen[successor] = gen
+                g_cost[successor] = new_g
+                parent[successor] = node
+
+                h = octile_dist(jump_x, jump_y, goal_x, goal_y)
+                heappush(open_heap, (new_g + h, h, successor))
+
+        self.last_expanded = expanded
+        yield None
+
+    def _prepare(self):
+        """Called before every search, return the jump function of the
+        search (see _jump)."""
+        return self._jump
+
+    def _can_step(self, node, dx, dy):
+        """Check if the step from walkable padded node in direction
+        (dx, dy) is allowed."""
+        grid = self._padded
+        width = self._width
+        if grid[node + dy * width + dx]:
+            return False
+        if dx and dy:
+            blocked_sides = grid[node + dx] + grid[node + dy * width]
+            return blocked_sides <= (1 if self.corner_cutting else 0)
+        return True
+
+    def _start_directions(self, node):
+        return [(dx, dy) for dx, dy in DIRECTIONS
+                if self._can_step(node, dx, dy)]
+
+    def _pruned_directions(self, node, dx, dy):
+        """Get the directions to search from padded node reached in
+        direction (dx, dy): the natural neighbours and the forced ones."""
+        grid = self._padded
+        width = self._width
+        directions = []
+        if dx and dy:
+            side_x = not grid[node + dx]
+            side_y = not grid[node + dy * width]
+            if side_y:
+                directions.append((0, dy))
+            if side_x:
+                directions.append((dx, 0))
+            if self.corner_cutting:
+                if side_x or side_y:
+                    directions.append((dx, dy))
+                if side_y and grid[node - dx]:
+                    directions.append((-dx, dy))
+                if side_x and grid[node - dy * width]:
+                    directions.append((dx, -dy))
+            elif side_x and side_y:
+                directions.append((dx, dy))
+            return [d for d in directions
+                    if not grid[node + d[1] * width + d[0]]]
+
+        # straight movement, (px, py) is perpendicular to (dx, dy)
+        px, py = dy, dx
+        ahead = not grid[node + dy * width + dx]
+        if self.corner_cutting:
+            if ahead:
+                directions.append((dx, dy))
+            for side in (1, -1):
+                if grid[node + side * (py * width + px)]:
+                    directions.append((dx + side * px, dy + side * py))
+        else:
+            for side in (1, -1):
+                if not grid[node + side * (py * width + px)]:
+                    directions.append((side * px, side * py))
+                    if ahead:
+                        directions.append((dx + side * px, dy + side * py))
+            if ahead:
+                directions.append((dx, dy))
+        return [d for d in directions if self._can_step(node, d[0], d[1])]
+
+    def _jump(self, node, dx, dy, goal):
+        """Move from padded node in direction (dx, dy) until a jump point
+        is found and return it or -1."""
+        width = self._width
+        if not (dx and dy):
+            if dx:
+                return self._jump_straight(node, dx, width, goal)
+            return self._jump_straight(node, dy * width, 1, goal)
+
+        grid = self._padded
+        step = dy * width + dx
+        step_y = dy * width
+        corner_cutting = self.corner_cutting
+        max_blocked_sides = 1 if corner_cutting else 0
+        while grid[node + dx] + grid[node + step_y] <= max_blocked_sides:
+            node += step
+            if grid[node]:
+                return -1
+            if node == goal:
+                return node
+            if corner_cutting and (
+                    (grid[node - dx] and not grid[node - dx + step_y]) or
+                    (grid[node - step_y] and not grid[node + dx - step_y])):
+                return node
+            if self._jump_straight(node, dx, width, goal) >= 0 or \
+                    self._jump_straight(node, step_y, 1, goal) >= 0:
+                return node
+        return -1
+
+    def _jump_straight(self, node, step, side, goal):
+        """Jump along a row or column, side is the index offset to the
+        neighbouring rows or columns."""
+        grid = self._padded
+        if self.corner_cutting:
+            while True:
+                node += step
+                if grid[node]:
+                    return -1
+                if node == goal:
+                    return node
+                if (grid[node + side] and not grid[node + step + side]) or \
+                        (grid[node - side] and not grid[node + step - side]):
+                    return node
+
+        while True:
+            node += step
+            if grid[node]:
+                return -1
+            if node == goal:
+                return node
+            back = node - step
+            if (grid[back + side] and not grid[node + side]) or \
+                    (grid[back - side] and not grid[node - side]):
+                return node
+
+
+class JumpPointPlusPathfinder(JumpPointPathfinder):
+    """Jump point search with precomputed jumps (JPS+).
+
+    For every tile and direction the distance to the next jump point (or,
+    stored negated, the number of free steps until a wall) is computed
+    once, so a jump is a table lookup instead of a scan. The tables are
+    computed with numpy along all lines of a direction at once and rebuilt
+    in place before the next search after tiles changed. Resumable
+    searches build them in bands of about TABLE_TILES_PER_STEP tiles with
+    a pause after each band, searches share a build that is under way."""
+
+    TABLE_TILES_PER_STEP = 16384
+
+    def __init__(self, size_x, size_y, corner_cutting=False):
+        JumpPointPathfinder.__init__(self, size_x, size_y, corner_cutting)
+        # direction -> table, None while the tables are outdated
+        self._distances = None
+        # the tables, rebuilds write into them again
+        self._tables = None
+        # generator building the tables, see _precompute
+        self._table_steps = None
+
+    def set_blocked(self, x, y, blocked=True):
+        """Mark tile (x, y) as (not) walkable."""
+        version = self._version
+        JumpPointPathfinder.set_blocked(self, x, y, blocked)
+        if self._version != version:
+            self._distances = None
+            self._table_steps = None
+
+    def set_all_blocked(self, blocked):
+        """Set the walkability of all tiles, see Pathfinder.set_all_blocked.
+        """
+        JumpPointPathfinder.set_all_blocked(self, blocked)
+        self._distances = None
+        self._table_steps = None
+
+    def _search_steps(self, from_coords, to_coords, bounds=None, state=None,
+                      pause_every=0):
+        """Run the jump point search, see Pathfinder._search_steps. Missing
+        tables are built first, with a pause after every band if
+        pause_every is set."""
+        while self._distances is None:
+            if self._table_steps is None:
+                self._table_steps = self._precompute()
+            next(self._table_steps, None)
+            if pause_every and self._distances is None:
+                yield SEARCHING
+        for cost in JumpPointPathfinder._search_steps(
+                self, from_coords, to_coords, bounds, state, pause_every):
+            yield cost
+
+    def _prepare(self):
+        return partial(self._table_jump, self._distances)
+
+    def _precompute(self):
+        """Generator building the tables, yields after every band."""
+        width = self._width
+        node_count = len(self._padded)
+        band = max(1, JumpPointPlusPathfinder.TABLE_TILES_PER_STEP // width)
+        # row starts of the bands, last band first
+        starts = range(0, node_count, band * width)[::-1]
+        # a copy, tiles changing during the build start a new one
+        grid = np.frombuffer(self._padded, dtype=np.uint8).astype(bool)
+        interior = np.zeros((self._size_y + 2, width), dtype=bool)
+        interior[1:-1, 1:-1] = True
+        interior = interior.ravel()
+        yield
+
+        if self._tables is None:
+            # distances are at most the map size, 16 bits hold them on
+            # all but huge maps
+            typecode = 'h' if max(width, self._size_y + 2) < 0x7fff else 'i'
+            distances = {}
+            for direction in DIRECTIONS:
+                distances[direction] = array(typecode, [0]) * node_count
+                yield
+            self._tables = distances
+        distances = self._tables
+        tables = dict((direction, np.frombuffer(table, dtype=table.typecode))
+                      for direction, table in distances.items())
+        # straight directions first, diagonal jumps depend on them. Only
+        # directions with a positive index step are computed, the others
+        # the same way on the grid turned by 180 degrees (reversed)
+        for group in (((1, 0), (0, 1)), ((1, 1), (-1, 1))):
+            for turned, (dx, dy) in product((False, True), group):
+                sign = -1 if turned else 1
+                values = grid[::-1] if turned else grid
+                table = tables[(sign * dx, sign * dy)]
+                straights = [tables[d] for d in ((sign * dx, 0),
+                                                 (0, sign * dy)) if any(d)]
+                if turned:
+                    table = table[::-1]
+                    straights = [straight[::-1] for straight in straights]
+                step = dy * width + dx
+                chains = _ChainDistances(node_count, step)
+                for start in starts:
+                    stop = min(start + band * width, node_count)
+                    valid, forced = self._jump_flags(
+                        values, straights, dx, dy, start, stop)
+                    valid &= interior[start:stop]
+                    table[start:stop] = chains.band(start, stop, valid,
+                                                    forced & valid)
+                    yield
+        self._distances = distances
+        self._table_steps = None
+
+    def _jump_flags(self, grid, straights, dx, dy, start, stop):
+        """Get for the padded nodes start to stop of grid (bool array) if
+        a step in direction (dx, dy) is possible and if it is forced. For
+        diagonal directions straights are the complete tables of (dx, 0)
+        and (0, dy)."""
+        width = self._width
+        step = dy * width + dx
+
+        def at(offset):
+            # at(offset)[i] is grid[start + i + offset]
+            return _window(grid, start + offset, stop + offset, True)
+
+        valid = ~grid[start:stop] & ~at(step)
+        if dx and dy:
+            step_y = dy * width
+            blocked_sides = at(dx).astype(np.uint8) + at(step_y)
+            valid &= blocked_sides <= (1 if self.corner_cutting else 0)
+            # stop where a straight jump from the next node finds one
+            forced = False
+            for straight in straights:
+                forced = forced | (_window(straight, start + step,
+                                           stop + step, 0) > 0)
+            if self.corner_cutting:
+                forced |= (at(step - dx) & ~at(step - dx + step_y)) | \
+                    (at(step - step_y) & ~at(step + dx - step_y))
+            return valid, forced
+
+        side = 1 if dy else width
+        if self.corner_cutting:
+            forced = (at(step + side) & ~at(2 * step + side)) | \
+                (at(step - side) & ~at(2 * step - side))
+        else:
+            forced = (at(side) & ~at(step + side)) | \
+                (at(-side) & ~at(step - side))
+        return valid, forced
+
+    def _table_jump(self, distances, node, dx, dy, goal):
+        """Like _jump, but look the jump up in distances."""
+        width = self._width
+        dist = distances[(dx, dy)][node]
+        steps = abs(dist)
+        node_y, node_x = divmod(node, width)
+        goal_y, goal_x = divmod(goal, width)
+        goal_dx = goal_x - node_x
+        goal_dy = goal_y - node_y
+        if dx and dy:
+            if _sign(goal_dx) == dx and _sign(goal_dy) == dy:
+                # stop where the goal row or column is crossed
+                to_goal = min(abs(goal_dx), abs(goal_dy))
+                if to_goal <= steps:
+                    return node + to_goal * (dy * width + dx)
+        elif (goal_dy == 0 and _sign(goal_dx) == dx) or \
+                (goal_dx == 0 and _sign(goal_dy) == dy):
+            if abs(goal_dx + goal_dy) <= steps:
+                return goal
+
+        if dist > 0:
+            return node + dist * (dy * width + dx)
+        return -1
+
+
+def _window(values, start, stop, fill):
+    """Get values[start:stop], fill where the index is out of range."""
+    window = np.empty(stop - start, dtype=values.dtype)
+    window.fill(fill)
+    first = max(start, 0)
+    last = min(stop, len(values))
+    if first < last:
+        window[first - start:last - start] = values[first:last]
+    return window
+
+
+class _ChainDistances(object):
+    """Computes the jump distances of a direction with a positive index
+    step, band by band from the last node to the first.
+
+    The nodes node, node + step, node + 2 * step, ... form a chain which
+    ends at the first node that is not valid or forced (a jump point). The
+    distance is 0 for nodes that are not valid, the number of steps to the
+    jump point plus one if it is forced or minus the number of steps to the
+    end of the chain."""
+
+    def __init__(self, node_count, step):
+        self._step = step
+        # forced nodes of the bands done so far
+        self._forced = np.zeros(node_count + step, dtype=bool)
+        # first end at or after each of the step nodes from the start of
+        # the last band on, positions past the end count as ends
+        self._first_ends = np.arange(node_count, node_count + step)
+
+    def band(self, start, stop, valid, forced):
+        """Get the distances of the nodes start to stop, right before the
+        last band, from their valid and forced flags."""
+        step = self._step
+        length = stop - start
+        self._forced[start:stop] = forced
+        index = np.arange(start, stop)
+
+        # each column of the reshaped array is a chain, find the first end
+        # at or after every position
+        rows = -(-length // step) + 1
+        first_end = np.empty(rows * step, dtype=index.dtype)
+        first_end.fill(np.iinfo(index.dtype).max)
+        first_end[:length] = np.where(~valid | forced, index,
+                                      first_end[:length])
+        first_end[length:length + step] = self._first_ends
+        first_end = np.minimum.accumulate(
+            first_end.reshape(rows, step)[::-1], axis=0)[::-1].ravel()
+        self._first_ends = first_end[:step]
+        # and the first end after it
+        next_end = first_end[step:step + length]
+
+        steps = (next_end - index) // step
+        distances = np.where(self._forced[next_end], steps + 1, -steps)
+        distances[~valid] = 0
+        distances[forced] = 1
+        return distances
+
+
+class FlowField(object):
+    """Steps towards one goal tile for every tile of the grid.
+
+    The field is filled by a Dijkstra pass from the goal, so any number
+    of units can follow it to the goal with an O(1) lookup per step. The
+    pass only runs as far as needed to answer the tiles asked for so far
+    and is resumed when a tile further away is looked up, or in parts by
+    expand_steps."""
+
+    #noinspection PyProtectedMember
+    def __init__(self, pathfinder, goal):
+        self.goal = goal
+        self._size_x, self._size_y = pathfinder.size
+        self._blocked = pathfinder._blocked
+        self._neighbours = pathfinder._neighbours
+        self._max_blocked_sides = 1 if pathfinder.corner_cutting else 0
+
+        node_count = self._size_x * self._size_y
+        self._directions = bytearray([NO_DIRECTION]) * node_count
+        self._cost = array('i', [-1]) * node_count
+        self._closed = bytearray(node_count)
+        self._open = []
+        if not pathfinder.is_blocked(*goal):
+            start = goal[1] * self._size_x + goal[0]
+            self._cost[start] = 0
+            self._open.append((0, start))
+
+    def direction(self, tile):
+        """Get the step (dx, dy) from tile towards the goal or None."""
+        node = tile[1] * self._size_x + tile[0]
+        if self._open and not self._closed[node]:
+            self._expand_until(node)
+        direction = self._directions[node]
+        if direction == NO_DIRECTION:
+            return None
+        return DIRECTIONS[direction]
+
+    def reachable(self, tile):
+        """Check if the goal can be reached from tile."""
+        if not (0 <= tile[0] < self._size_x and 0 <= tile[1] < self._size_y):
+            return False
+        return tile == self.goal or self.direction(tile) is not None
+
+    def expand_steps(self, tile, pause_every=256):
+        """Generator continuing the Dijkstra pass until tile is settled, so
+        direction and reachable return at once for it. Yields SEARCHING
+        after every pause_every settled tiles."""
+        if not (0 <= tile[0] < self._size_x and 0 <= tile[1] < self._size_y):
+            return
+        node = tile[1] * self._size_x + tile[0]
+        # another user of the field may complete it during a pause
+        while self._open and not self._closed[node]:
+            self._expand_until(node, pause_every)
+            if self._open and not self._closed[node]:
+                yield SEARCHING
+
+    def _expand_until(self, target, limit=None):
+        """Continue the Dijkstra pass until target is settled, or limit
+        tiles were settled if set."""
+        size_x = self._size_x
+        size_y = self._size_y
+        blocked = self._blocked
+        neighbours = self._neighbours
+        max_blocked_sides = self._max_blocked_sides
+        directions = self._directions
+        cost = self._cost
+        closed = self._closed
+        open_heap = self._open
+        settled = 0
+
+        while open_heap and not closed[target] and settled != limit:
+            g, node = heappop(open_heap)
+            if closed[node]:
+                continue
+            closed[node] = 1
+            settled += 1
+
+            y, x = divmod(node, size_x)
+            # steps are symmetric, so the step from neighbour back to node
+            # is the opposite direction
+            for direction, (dx, dy, offset, step_cost) in \
+                    enumerate(neighbours):
+                nx = x + dx
+                ny = y + dy
+                if not (0 <= nx < size_x and 0 <= ny < size_y):
+                    continue
+                neighbour = node + offset
+                if blocked[neighbour] or closed[neighbour]:
+                    continue
+                if dx and dy and (blocked[node + dx] +
+                                  blocked[node + dy * size_x] >
+                                  max_blocked_sides):
+                    continue
+                new_g = g + step_cost
+                if 0 <= cost[neighbour] <= new_g:
+                    continue
+                cost[neighbour] = new_g
+                directions[neighbour] = 7 - direction
+                heappush(open_heap, (new_g, neighbour))
+
+        if not open_heap:
+            # the field is complete, only the directions are needed now
+            self._cost = None
+            self._closed = None
+
+
+class FlowFieldCache(object):
+    """Keeps the flow fields of the last used goal tiles."""
+
+    def __init__(self, pathfinder, capacity=8):
+        self.capacity = capacity
+        self._pathfinder = pathfinder
+        self._fields = OrderedDict()
+
+    def get(self, goal):
+        """Get the flow field for goal, compute it if it is not cached."""
+        field = self._fields.pop(goal, None)
+        if field is None:
+            field = FlowField(self._pathfinder, goal)
+            if len(self._fields) >= self.capacity:
+                self._fields.popitem(last=False)
+        self._fields[goal] = field
+        return field
+
+    def clear(self):
+        """Drop all cached fields, for example after tiles changed."""
+        self._fields.clear()
+
+
+class PathCache(object):
+    """Caches routes of a pathfinder by (start region, goal region).
+
+    Regions are squares of region_size tiles. A request between two
+    regions that already have a cached route reuses it: only the parts
+    from the start to where the route leaves the start region and from
+    where it enters the goal region to the goal are searched again, with
+    a local A* search. At most capacity route tiles are kept, the least
+    recently used routes are dropped first.
+
+    Call invalidate when tiles change, it drops only the routes passing
+    through the regions around the changed tiles.
+
+    If workers (a PathWorkerPool) is set, route_steps searches missing
+    routes with it instead of the pathfinder."""
+
+    def __init__(self, pathfinder, region_size=8, capacity=65536):
+        self.region_size = region_size
+        self.capacity = capacity
+        self.workers = None
+        self.hits = 0
+        self.misses = 0
+        self._pathfinder = pathfinder
+        # (start region, goal region) -> route
+        self._routes = OrderedDict()
+        # region -> set of keys of the routes passing through it
+        self._keys_by_region = {}
+        self._size = 0
+
+    def __len__(self):
+        return len(self._routes)
+
+    def find_route(self, from_coords, to_coords):
+        """Like Pathfinder.find_route, but use the cache if possible."""
+        key = (self._region_at(from_coords), self._region_at(to_coords))
+        route = self._lookup(key, from_coords, to_coords)
+        if route is not None:
+            return route
+
+        route = self._pathfinder.find_route(from_coords, to_coords)
+        if route is not None:
+            self._add(key, route)
+        return route
+
+    def route_steps(self, from_coords, to_coords, pause_every=256):
+        """Like Pathfinder.route_steps, but use the cache if possible."""
+        key = (self._region_at(from_coords), self._region_at(to_coords))
+        route = self._lookup(key, from_coords, to_coords)
+        if route is not None:
+            yield route
+            return
+
+        searcher = self._pathfinder if self.workers is None else self.workers
+        version = self._pathfinder.version
+        for route in searcher.route_steps(from_coords, to_coords,
+                                          pause_every):
+            if route is SEARCHING or route is WAITING:
+                yield route
+        # a route searched before tiles changed may cross them
+        if route is not None and self._pathfinder.version == version:
+            self._add(key, route)
+        yield route
+
+    def invalidate(self, area):
+        """Drop routes that pass close to area (min_x, min_y, max_x, max_y)
+        of changed tiles."""
+        min_x, min_y, max_x, max_y = area
+        # diagonal steps depend on the tiles next to them
+        area = (min_x - 1, min_y - 1, max_x + 1, max_y + 1)
+        for region in self._regions_in(area):
+            for key in list(self._keys_by_region.get(region, ())):
+                self._remove(key)
+
+    def clear(self):
+        """Drop all cached routes."""
+        self._routes.clear()
+        self._keys_by_region.clear()
+        self._size = 0
+
+    def _region_at(self, tile):
+        return tile[0] // self.region_size, tile[1] // self.region_size
+
+    def _regions_in(self, area):
+        min_x, min_y, max_x, max_y = area
+        region_size = self.region_size
+        for ry in range(max(0, min_y) // region_size,
+                        (max_y - 1) // region_size + 1):
+            for rx in range(max(0, min_x) // region_size,
+                            (max_x - 1) // region_size + 1):
+                yield rx, ry
+
+    def _route_regions(self, route):
+        regions = {self._region_at(route[0])}
+        for i in range(1, len(route)):
+            if not self._pathfinder.LINEAR_SEGMENTS:
+                regions.update(self._regions_in(
+                    self._pathfinder.refine_bounds(route[i - 1], route[i])))
+                continue
+            (x1, y1), (x2, y2) = route[i - 1], route[i]
+            dx = _sign(x2 - x1)
+            dy = _sign(y2 - y1)
+            for step in range(1, max(abs(x2 - x1), abs(y2 - y1)) + 1):
+                regions.add(self._region_at((x1 + step * dx,
+                                             y1 + step * dy)))
+        return regions
+
+    def _lookup(self, key, from_coords, to_coords):
+        """Get the patched route cached for key or None and count the
+        hit or miss."""
+        route = self._routes.get(key)
+        if route is not None:
+            patched = self._patch(route, from_coords, to_coords)
+            if patched is not None:
+                self.hits += 1
+                # mark as most recently used
+                del self._routes[key]
+                self._routes[key] = route
+                return patched
+            self._remove(key)
+        self.misses += 1
+        return None
+
+    def _add(self, key, route):
+        if key in self._routes:
+            self._remove(key)
+        while self._routes and self._size + len(route) > self.capacity:
+            self._remove(next(iter(self._routes)))
+        self._routes[key] = route
+        self._size += len(route)
+        for region in self._route_regions(route):
+            self._keys_by_region.setdefault(region, set()).add(key)
+
+    def _remove(self, key):
+        route = self._routes.pop(key)
+        self._size -= len(route)
+        for region in self._route_regions(route):
+            keys = self._keys_by_region[region]
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_region[region]
+
+    def _patch(self, route, from_coords, to_coords):
+        """Reuse the middle of a cached route for a request whose start and
+        goal lie in the same regions as those of route."""
+        if route[0] == from_coords and route[-1] == to_coords:
+            return list(route)
+        start_region = self._region_at(from_coords)
+        goal_region = self._region_at(to_coords)
+        if start_region == goal_region:
+            return None
+
+        # first route tile outside the start region and last one outside
+        # the goal region
+        first = 0
+        while first < len(route) and \
+                self._region_at(route[first]) == start_region:
+            first += 1
+        last = len(route) - 1
+        while last >= 0 and self._region_at(route[last]) == goal_region:
+            last -= 1
+        if first > last:
+            return None
+
+        head = self._local_path(from_coords, route[first])
+        tail = self._local_path(route[last], to_coords)
+        if head is None or tail is None:
+            return None
+        return head[:-1] + route[first:last + 1] + tail[1:]
+
+    def _local_path(self, from_coords, to_coords):
+        margin = self.region_size
+        size_x, size_y = self._pathfinder.size
+        bounds = (max(0, min(from_coords[0], to_coords[0]) - margin),
+                  max(0, min(from_coords[1], to_coords[1]) - margin),
+                  min(size_x, max(from_coords[0], to_coords[0]) + margin + 1),
+                  min(size_y, max(from_coords[1], to_coords[1]) + margin + 1))
+        return self._pathfinder.find_local_path(from_coords, to_coords,
+                                                bounds)
+
+
+# maps with at least this many tiles use JPS+ by default, it answers
+# cross-map queries on open or structured 1024 x 1024 maps within a few
+# milliseconds where A* and HPA* take 10 to 50 ms
+JUMP_POINT_MIN_TILES = 128 * 128
+
+PATH_MODES = {
+    'astar': Pathfinder,
+    'hierarchical': HierarchicalPathfinder,
+    'jps': JumpPointPathfinder,
+    'jps+': JumpPointPlusPathfinder,
+}
+
+
+def create_pathfinder(size_x, size_y, mode=None, corner_cutting=False):
+    """Create a pathfinder for a size_x * size_y grid.
+
+    mode is one of PATH_MODES, if it is None the mode is chosen by map
+    size."""
+    if mode is None:
+        if size_x * size_y >= JUMP_POINT_MIN_TILES:
+            mode = 'jps+'
+        else:
+            mode = 'astar'
+    if mode not in PATH_MODES:
+        raise PathfindingError("unknown pathfinding mode " + str(mode))
+    return PATH_MODES[mode](size_x, size_y, corner_cutting=corner_cutting)
\ No newline at end of file
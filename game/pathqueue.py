@@ -0,0 +1,89 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""pathqueue.py: path searches spread over several frames"""
+
+from collections import deque
+import time
+
+from pathfinding import SEARCHING, WAITING
+
+
+class PathRequest(object):
+    """Handle for a path that may not be computed yet.
+
+    When done is set, waypoints is an iterator over the waypoints of the
+    path or None if there is no path."""
+
+    def __init__(self, steps=None):
+        self.done = False
+        self.cancelled = False
+        self.waypoints = None
+        self._steps = steps
+
+    def finish(self, path):
+        """Set the result of the request."""
+        self.waypoints = None if path is None else iter(path)
+        self.done = True
+        self._steps = None
+
+    def cancel(self):
+        """Tell the queue the result is not needed anymore."""
+        self.cancelled = True
+        self._steps = None
+
+
+class PathQueue(object):
+    """Runs path searches in submission order for a limited time per frame.
+
+    Searches are generators like Map.find_path_steps which yield SEARCHING
+    until their last value is the path. A search which does not finish
+    within the budget is continued on the next call to process. Searches
+    which yield WAITING wait for workers (a PathWorkerPool), the queue
+    goes on with the next search and checks them again on the next call."""
+
+    def __init__(self, budget=4, workers=None):
+        self.budget = budget
+        self.workers = workers
+        self._requests = deque()
+
+    def __len__(self):
+        return len(self._requests)
+
+    def submit(self, steps):
+        """Queue a search and return its PathRequest."""
+        request = PathRequest(steps)
+        self._requests.append(request)
+        return request
+
+    def process(self, budget=None):
+        """Run queued searches for up to budget milliseconds (self.budget
+        if not set), nothing if budget is not positive."""
+        if budget is None:
+            budget = self.budget
+        deadline = time.time() + budget / 1000.0
+        requests = self._requests
+        waiting = []
+        while requests and time.time() < deadline:
+            request = requests.popleft()
+            if request.cancelled:
+                continue
+            result = next(request._steps)
+            if result is SEARCHING:
+                requests.appendleft(request)
+            elif result is WAITING:
+                waiting.append(request)
+            else:
+                request.finish(result)
+        requests.extendleft(reversed(waiting))
+        if self.workers is not None:
+            self.workers.flush()
+
+    def process_all(self):
+        """Run all queued searches to the end. Blocks while the searches
+        left wait for the workers."""
+        while self._requests:
+            self.process(float('inf'))
+            if self._requests and self.workers is not None:
+                self.workers.wait()
\ No newline at end of file
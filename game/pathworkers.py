@@ -0,0 +1,195 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""pathworkers.py: route searches in worker processes"""
+
+from itertools import izip
+from multiprocessing import Pool
+from multiprocessing.sharedctypes import RawArray, RawValue
+
+import numpy as np
+
+from pathfinding import create_pathfinder, WAITING
+
+
+# pathfinder of a worker process, created by _init_worker
+_worker = None
+
+
+def _init_worker(grid, version, size_x, size_y, mode, corner_cutting):
+    global _worker
+    _worker = _Worker(grid, version, size_x, size_y, mode, corner_cutting)
+
+
+def _find_routes(queries):
+    return _worker.find_routes(queries)
+
+
+class _Worker(object):
+    """Pathfinder of a worker process that follows the shared grid."""
+
+    def __init__(self, grid, version, size_x, size_y, mode, corner_cutting):
+        self._grid = grid
+        self._version = version
+        self._seen_version = None
+        self._size_x = size_x
+        # the grid at _seen_version
+        self._blocked = None
+        self._pathfinder = create_pathfinder(size_x, size_y, mode,
+                                             corner_cutting)
+
+    def find_routes(self, queries):
+        """Search the routes of queries, return the grid version they
+        were searched on and the routes."""
+        self._sync()
+        return self._seen_version, [
+            self._pathfinder.find_route(from_coords, to_coords)
+            for from_coords, to_coords in queries]
+
+    def _sync(self):
+        # read the version first, a change during the copy is picked up
+        # by the next batch
+        version = self._version.value
+        if version == self._seen_version:
+            return
+        self._seen_version = version
+        grid = np.frombuffer(self._grid, dtype=np.uint8).copy()
+        if self._blocked is None:
+            self._pathfinder.set_all_blocked(grid.tobytes())
+        else:
+            size_x = self._size_x
+            for i in np.flatnonzero(grid != self._blocked).tolist():
+                self._pathfinder.set_blocked(i % size_x, i // size_x,
+                                             grid[i])
+        self._blocked = grid
+
+
+class PendingRoute(object):
+    """Route searched by a PathWorkerPool, route is set when done is."""
+
+    def __init__(self, from_coords, to_coords):
+        self.from_coords = from_coords
+        self.to_coords = to_coords
+        self.done = False
+        self.route = None
+
+
+class PathWorkerPool(object):
+    """Searches routes in a multiprocessing pool.
+
+    Every worker has its own pathfinder (see create_pathfinder for mode
+    and corner_cutting). The blocked tiles are kept in shared memory, the
+    workers update their pathfinders when set_blocked changed them.
+    Queries are sent to the workers in batches of batch_size by flush, a
+    batch searched before tiles changed is sent again."""
+
+    def __init__(self, size_x, size_y, blocked, mode=None,
+                 corner_cutting=False, processes=None, batch_size=32):
+        self.batch_size = batch_size
+        self.processes = processes
+        self._mode = mode
+        self._corner_cutting = corner_cutting
+        self._unsent = []
+        # (async result, pending routes) of the sent batches
+        self._batches = []
+        self._start(size_x, size_y, blocked)
+
+    def __len__(self):
+        """Number of queries that are not done."""
+        return len(self._unsent) + sum(len(pending)
+                                       for _, pending in self._batches)
+
+    def set_blocked(self, x, y, blocked=True):
+        """Mark tile (x, y) as (not) walkable for the workers."""
+        node = y * self._size_x + x
+        blocked = 1 if blocked else 0
+        if self._grid[node] != blocked:
+            self._grid[node] = blocked
+            self._version.value += 1
+
+    def submit(self, from_coords, to_coords):
+        """Queue a route search and return its PendingRoute."""
+        pending = PendingRoute(from_coords, to_coords)
+        self._unsent.append(pending)
+        if len(self._unsent) >= self.batch_size:
+            self.flush()
+        return pending
+
+    def flush(self):
+        """Send the queued searches to the workers."""
+        unsent = self._unsent
+        for start in range(0, len(unsent), self.batch_size):
+            self._batches.append(self._send(unsent[start:start +
+                                                   self.batch_size]))
+        self._unsent = []
+
+    def collect(self):
+        """Store the results of finished batches in their PendingRoutes."""
+        if not self._batches:
+            return
+        running = []
+        for result, batch in self._batches:
+            if not result.ready():
+                running.append((result, batch))
+                continue
+            version, routes = result.get()
+            if version != self._version.value:
+                # searched before tiles changed, the routes may cross them
+                running.append(self._send(batch))
+                continue
+            for pending, route in izip(batch, routes):
+                pending.route = route
+                pending.done = True
+        self._batches = running
+
+    def wait(self):
+        """Block until the oldest sent batch is done, then collect the
+        finished batches."""
+        if self._batches:
+            self._batches[0][0].wait()
+        self.collect()
+
+    def route_steps(self, from_coords, to_coords, pause_every=0):
+        """Like Pathfinder.route_steps, but search in a worker. Yields
+        WAITING until the result is back."""
+        pending = self.submit(from_coords, to_coords)
+        while True:
+            self.collect()
+            if pending.done:
+                break
+            yield WAITING
+        yield pending.route
+
+    def reset(self, size_x, size_y, blocked):
+        """Start over with new workers for a size_x * size_y grid with the
+        blocked tiles (x, y) in blocked, like a new PathWorkerPool. The
+        queries that are not done yet get no route."""
+        self.close()
+        self._start(size_x, size_y, blocked)
+
+    def close(self):
+        """Stop the worker processes. The queries that are not done yet get
+        no route."""
+        self._pool.terminate()
+        self._pool.join()
+        for pending in self._unsent + [pending for _, batch in self._batches
+                                       for pending in batch]:
+            pending.done = True
+        self._unsent = []
+        self._batches = []
+
+    def _send(self, batch):
+        queries = [(pending.from_coords, pending.to_coords)
+                   for pending in batch]
+        return self._pool.apply_async(_find_routes, (queries,)), batch
+
+    def _start(self, size_x, size_y, blocked):
+        self._size_x = size_x
+        self._grid = RawArray('B', size_x * size_y)
+        for x, y in blocked:
+            self._grid[y * size_x + x] = 1
+        self._version = RawValue('L', 0)
+        self._pool = Pool(self.processes, _init_worker,
+                          (self._grid, self._version, size_x, size_y,
+                           self._mode, self._corner_cutting))
\ No newline at end of file
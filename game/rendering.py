@@ -4,18 +4,47 @@
 
 """rendering.py: handles rendering of the game"""
 
-from pygame import image, draw, display
+import numpy as np
+from pygame import image, draw, display, Rect, Surface, SRCALPHA, \
+    BLEND_RGBA_MAX
 
 
 class Renderer(object):
     """Manages textures/assignments and provides methods for drawing objects
-    and other graphics to pygame surfaces"""
+    and other graphics to pygame surfaces
 
-    def __init__(self, screen, camera):
+    In dirty rect mode drawing is deferred to frame_end, which only redraws
+    and updates the screen regions that changed since the last frame:
+    where objects moved, appeared, disappeared or changed their selection,
+    and where rectangles changed. The whole screen is redrawn when the
+    camera moved or after invalidate."""
+
+    # redraw the whole screen instead of more dirty rects than this
+    MAX_DIRTY_RECTS = 64
+    # minimum width of the texture atlas
+    ATLAS_WIDTH = 512
+
+    def __init__(self, screen, camera, dirty_rects=False):
         self._surface = screen
         self._cam = camera
         self._textures = {}
         self._texture_assignments = {}
+        # all textures packed into one surface, rebuilt when textures are
+        # loaded
+        self._atlas = None
+        # texture id -> area in the atlas
+        self._atlas_areas = {}
+
+        self.dirty_rects = dirty_rects
+        self._full_redraw = True
+        self._last_view = None
+        self._dirty = []
+        # state of the current and the last frame in dirty rect mode
+        self._map = None
+        self._objs = {}
+        self._last_objs = {}
+        self._rects = []
+        self._last_rects = []
 
         unit_highlight_texture = self.load_texture('unit_highlight.png')
         self.assign_texture('unit_highlight', unit_highlight_texture)
@@ -24,6 +53,7 @@ class Renderer(object):
         """Load texture and return texture id."""
         tex = Texture(texture_name)
         self._textures[tex.id] = tex
+        self._atlas = None
         return tex.id
 
     def assign_texture(self, key, tex_id):
@@ -31,45 +61,227 @@ class Renderer(object):
 
         key will usually be a game object"""
         self._texture_assignments[key] = tex_id
+        self._full_redraw = True
 
     def texture_size(self, tex_id):
         """Get size of a texture by id."""
         return self._textures[tex_id].size
 
+    def invalidate(self, rect=None):
+        """Redraw rect (map coordinates, the whole screen if not set) in the
+        next frame, for changes the renderer does not see (like changed
+        map tiles)."""
+        if rect is None:
+            self._full_redraw = True
+        else:
+            self._dirty.append(self._cam.rect_to_screen(Rect(rect)))
+
     def frame_start(self):
-        self._surface.fill((0, 0, 0))  # clear black
+        if not self.dirty_rects:
+            self._surface.fill((0, 0, 0))  # clear black
+            return
+        self._map = None
+        self._objs = {}
+        self._rects = []
 
     def frame_end(self):
-        display.flip()
+        if not self.dirty_rects:
+            display.flip()
+            return
+
+        view = self._cam.view_rect
+        if self._last_view is None or view != self._last_view:
+            self._full_redraw = True
+            self._last_view = Rect(view)
+        dirty = self._dirty
+        if not self._full_redraw:
+            self._add_changed_objects(dirty)
+            self._add_changed_rects(dirty)
+
+        screen_rect = self._surface.get_rect()
+        if self._full_redraw or len(dirty) > Renderer.MAX_DIRTY_RECTS:
+            self._redraw(screen_rect)
+            display.flip()
+        else:
+            dirty = [rect.clip(screen_rect) for rect in dirty]
+            dirty = [rect for rect in dirty if rect.width and rect.height]
+            for rect in dirty:
+                self._redraw(rect)
+            if dirty:
+                display.update(dirty)
+
+        self._full_redraw = False
+        self._dirty = []
+        self._last_objs = self._objs
+        self._last_rects = self._rects
 
     def draw_map(self, map_):
         """Draw map at the appropriate location."""
+        if self.dirty_rects:
+            self._map = map_
+            return
         map_.draw(self._surface, self._cam.view_rect,
                   self._cam.point_to_screen)
 
-    def draw_objects(self, objs):
-        """Draw a set of objects at the appropriate location."""
-        for obj in objs:
-            self._draw_object(obj)
-            if obj.selected:
-                self._draw_highlight(obj.bbox)
+    def draw_objects(self, objs, alpha=1.0):
+        """Draw a set of objects at the appropriate location.
+
+        Objects are drawn the fraction alpha of the way from their previous
+        position (prev_pos) to their position, for frames between two
+        simulation ticks."""
+        objs = list(objs)
+        positions = self._object_positions(objs, alpha)
+        if self.dirty_rects:
+            for obj, pos in zip(objs, positions.tolist()):
+                self._objs[obj.id] = (obj, Rect(pos, obj.bbox.size),
+                                      obj.selected)
+            return
+        self._draw_batch([(obj.id, obj.selected) for obj in objs],
+                         positions)
 
     def draw_rectangle(self, rect, color, width=1):
         """Draw a simple non-filled rectangle."""
+        if self.dirty_rects:
+            self._rects.append((Rect(rect), color, width))
+            return
         draw.rect(self._surface, color, self._cam.rect_to_screen(rect), width)
 
-    def _draw_object(self, obj):
-        dst_rect = self._cam.rect_to_screen(obj.bbox)
-        self._surface.blit(self._get_tex(obj.id), dst_rect)
+    @staticmethod
+    def _object_positions(objs, alpha):
+        """Get the interpolated map positions of objs as an array."""
+        positions = np.array([obj.bbox.topleft for obj in objs],
+                             dtype=np.intp).reshape(-1, 2)
+        if alpha >= 1:
+            return positions
+        prev_positions = np.array([obj.prev_pos for obj in objs],
+                                  dtype=np.intp).reshape(-1, 2)
+        return np.rint(prev_positions +
+                       (positions - prev_positions) * alpha).astype(np.intp)
 
-    def _draw_highlight(self, rect):
-        dst_rect = self._cam.rect_to_screen(rect)
-        self._surface.blit(self._get_tex('unit_highlight'), dst_rect)
+    def _draw_batch(self, objs, positions):
+        """Draw objects given as (id, selected) at positions (array of map
+        positions) with a single blits call from the texture atlas,
+        highlights after all objects."""
+        if not objs:
+            return
+        atlas = self._get_atlas()
+        areas = self._atlas_areas
+        view = self._cam.view_rect
+        positions = (positions - (view.x, view.y)).tolist()
+
+        # group by texture
+        by_texture = {}
+        highlights = []
+        assignments = self._texture_assignments
+        for (obj_id, selected), pos in zip(objs, positions):
+            tex_id = assignments[obj_id]
+            if tex_id in by_texture:
+                by_texture[tex_id].append(pos)
+            else:
+                by_texture[tex_id] = [pos]
+            if selected:
+                highlights.append(pos)
+
+        blits = [(atlas, pos, areas[tex_id])
+                 for tex_id, tex_positions in by_texture.items()
+                 for pos in tex_positions]
+        highlight_area = areas[assignments['unit_highlight']]
+        blits.extend((atlas, pos, highlight_area) for pos in highlights)
+        if hasattr(self._surface, 'blits'):
+            self._surface.blits(blits, False)
+        else:
+            for blit in blits:
+                self._surface.blit(*blit)
+
+    def _get_atlas(self):
+        if self._atlas is not None:
+            return self._atlas
+        # shelf packing, highest textures first
+        textures = sorted(self._textures.values(),
+                          key=lambda tex: tex.height, reverse=True)
+        width = max([Renderer.ATLAS_WIDTH] +
+                    [tex.width for tex in textures])
+        x = y = row_height = 0
+        areas = {}
+        for tex in textures:
+            if x + tex.width > width:
+                x = 0
+                y += row_height
+                row_height = 0
+            areas[tex.id] = Rect(x, y, tex.width, tex.height)
+            x += tex.width
+            row_height = max(row_height, tex.height)
+
+        atlas = Surface((width, max(1, y + row_height)), SRCALPHA, 32)
+        for tex in textures:
+            # copy pixels and alpha unchanged
+            atlas.blit(tex.surface, areas[tex.id], None, BLEND_RGBA_MAX)
+        if display.get_surface() is not None:
+            atlas = atlas.convert_alpha()
+        self._atlas = atlas
+        self._atlas_areas = areas
+        return atlas
 
     def _get_tex(self, obj_id):
         tex_id = self._texture_assignments[obj_id]
         return self._textures[tex_id].surface
 
+    def _object_rect(self, obj_id, bbox, selected):
+        """Screen area drawn for an object."""
+        rect = Rect(self._cam.point_to_screen(bbox.topleft),
+                    self._get_tex(obj_id).get_size())
+        if selected:
+            rect.union_ip(Rect(rect.topleft,
+                               self._get_tex('unit_highlight').get_size()))
+        return rect
+
+    def _add_changed_objects(self, dirty):
+        objs = self._objs
+        last_objs = self._last_objs
+        for obj_id, (obj, bbox, selected) in objs.items():
+            last = last_objs.get(obj_id)
+            if last is not None and last[1] == bbox and last[2] == selected:
+                continue
+            dirty.append(self._object_rect(obj_id, bbox, selected))
+            if last is not None:
+                dirty.append(self._object_rect(obj_id, last[1], last[2]))
+        for obj_id, (obj, bbox, selected) in last_objs.items():
+            if obj_id not in objs:
+                dirty.append(self._object_rect(obj_id, bbox, selected))
+
+    def _add_changed_rects(self, dirty):
+        if self._rects == self._last_rects:
+            return
+        for rect, color, width in self._last_rects + self._rects:
+            rect = self._cam.rect_to_screen(rect)
+            # only the outline is drawn
+            dirty.extend([Rect(rect.left, rect.top, rect.width, width),
+                          Rect(rect.left, rect.bottom - width,
+                               rect.width, width),
+                          Rect(rect.left, rect.top, width, rect.height),
+                          Rect(rect.right - width, rect.top,
+                               width, rect.height)])
+
+    def _redraw(self, screen_rect):
+        """Draw everything recorded for this frame inside screen_rect."""
+        surface = self._surface
+        surface.set_clip(screen_rect)
+        surface.fill((0, 0, 0), screen_rect)
+        if self._map is not None:
+            self._map.draw(surface, self._cam.rect_to_map(screen_rect),
+                           self._cam.point_to_screen)
+        visible = [(obj.id, bbox, selected)
+                   for obj, bbox, selected in self._objs.values()
+                   if screen_rect.colliderect(
+                       self._object_rect(obj.id, bbox, selected))]
+        self._draw_batch([(obj_id, selected)
+                          for obj_id, _, selected in visible],
+                         np.array([bbox.topleft for _, bbox, _ in visible],
+                                  dtype=np.intp).reshape(-1, 2))
+        for rect, color, width in self._rects:
+            draw.rect(surface, color, self._cam.rect_to_screen(rect), width)
+        surface.set_clip(None)
+
 
 class TextureError(Exception):
     pass
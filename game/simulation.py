@@ -0,0 +1,139 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""simulation.py: map, objects and pathfinding without input or rendering"""
+
+import time
+
+from pygame import Rect
+
+from map import Map
+from pathqueue import PathQueue
+from gameobjects.management import ObjectManager
+from gameobjects.gameobjects import Unit
+
+
+class OrderError(Exception):
+    pass
+
+
+class Simulation(object):
+    """Advances map objects in fixed ticks of tick_time milliseconds.
+
+    path_budget is the time in milliseconds spent on path searches per
+    tick (unless tick is given a budget), unless deterministic is set: then
+    all queued searches finish in the tick they were queued in, so runs do
+    not depend on wall clock time.
+    With path_workers > 0 routes are searched by that many worker
+    processes. spatial_index names the spatial index of the objects, see
+    gameobjects.management.SPATIAL_INDEXES."""
+
+    UNIT_SIZE = (16, 16)
+
+    def __init__(self, map_name='default', tick_time=10, path_budget=4,
+                 path_workers=0, deterministic=False, path_mode=None,
+                 spatial_index='quadtree'):
+        self.tick_time = tick_time
+        self.deterministic = deterministic
+        self.time = 0
+        self.ticks = 0
+
+        self.map = Map(map_name, path_mode)
+        if path_workers > 0:
+            self.map.start_path_workers(path_workers)
+        self.path_queue = PathQueue(path_budget, self.map.path_workers)
+        self.objects = ObjectManager(self.map.size, self.map,
+                                     self.path_queue, spatial_index)
+
+    def tick(self, path_budget=None):
+        """Advance the simulation by one tick.
+
+        path_budget overrides the path_budget of the simulation for this
+        tick, so a frame running several ticks can share one budget.
+        Return the time spent on path searches in milliseconds."""
+        self.time += self.tick_time
+        path_start = time.time()
+        if self.deterministic:
+            self.path_queue.process_all()
+        else:
+            self.path_queue.process(path_budget)
+        path_time = (time.time() - path_start) * 1000
+        self.objects.update(self.time)
+        self.ticks += 1
+        return path_time
+
+    def spawn_unit(self, pos, size=None):
+        """Create a Unit with its top left corner at pos."""
+        return self.objects.create(Unit, Rect(pos, size or
+                                              Simulation.UNIT_SIZE))
+
+    def run(self, ticks, orders=()):
+        """Run ticks ticks as fast as possible and return the time taken
+        in seconds.
+
+        orders is a list of (tick, command, arguments) as returned by
+        load_orders, each is executed right before its tick."""
+        orders = sorted(orders, key=lambda order: order[0])
+        next_order = 0
+        start = time.time()
+        for _ in range(ticks):
+            while (next_order < len(orders) and
+                   orders[next_order][0] <= self.ticks):
+                self.execute(*orders[next_order][1:])
+                next_order += 1
+            self.tick()
+        return time.time() - start
+
+    def execute(self, command, args):
+        """Execute an order, see load_orders."""
+        if command == 'spawn':
+            x, y = args[:2]
+            count = args[2] if len(args) > 2 else 1
+            for i in range(count):
+                self.spawn_unit((x + (i % 16) * Simulation.UNIT_SIZE[0],
+                                 y + (i // 16) * Simulation.UNIT_SIZE[1]))
+        elif command == 'select':
+            if args:
+                self.objects.select_area(Rect(args))
+            else:
+                self.objects.select_objects(
+                    set(self.objects.query(self.map.size)))
+        elif command in ('move', 'queue'):
+            self.objects.send_selected(tuple(args[:2]), command == 'queue')
+        else:
+            raise OrderError("unknown order " + command)
+
+    def shutdown(self):
+        self.map.stop_path_workers()
+
+
+def load_orders(path):
+    """Read scripted orders from a file.
+
+    Every line is '<tick> <command> <numbers...>', empty lines and lines
+    starting with # are ignored. Commands:
+
+        spawn x y [count]   create count units (in rows of 16) at (x, y)
+        select [x y w h]    select the units in the area, or all units
+        move x y            send the selected units to (x, y)
+        queue x y           add (x, y) as waypoint of the selected units
+
+    Return a list of (tick, command, arguments)."""
+    orders = []
+    fh = open(path, 'r')
+    try:
+        for line_no, line in enumerate(fh, 1):
+            items = line.split()
+            if not items or items[0].startswith('#'):
+                continue
+            try:
+                tick = int(items[0])
+                command = items[1]
+                args = [int(item) for item in items[2:]]
+            except (IndexError, ValueError):
+                raise OrderError("invalid order in line " + str(line_no))
+            orders.append((tick, command, args))
+    finally:
+        fh.close()
+    return orders
\ No newline at end of file
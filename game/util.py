@@ -38,5 +38,52 @@ def vector_len(v):
     return sqrt(v[0] ** 2 + v[1] ** 2)
 
 
+def rect_point_dist_sq(rect, p):
+    """Get the squared distance of point p from the area of rect (0 if p
+    is in it)."""
+    if p[0] < rect.left:
+        dx = rect.left - p[0]
+    elif p[0] > rect.right:
+        dx = p[0] - rect.right
+    else:
+        dx = 0
+    if p[1] < rect.top:
+        dy = rect.top - p[1]
+    elif p[1] > rect.bottom:
+        dy = p[1] - rect.bottom
+    else:
+        dy = 0
+    return dx * dx + dy * dy
+
+
+def rect_difference(rect, other):
+    """Get up to four rects covering the part of rect outside of other."""
+    clip = rect.clip(other)
+    if clip.width == 0 or clip.height == 0:
+        return [rect]
+    result = []
+    if clip.top > rect.top:
+        result.append(Rect(rect.left, rect.top,
+                           rect.width, clip.top - rect.top))
+    if clip.bottom < rect.bottom:
+        result.append(Rect(rect.left, clip.bottom,
+                           rect.width, rect.bottom - clip.bottom))
+    if clip.left > rect.left:
+        result.append(Rect(rect.left, clip.top,
+                           clip.left - rect.left, clip.height))
+    if clip.right < rect.right:
+        result.append(Rect(clip.right, clip.top,
+                           rect.right - clip.right, clip.height))
+    return result
+
+
 def is_power2(n):
-    return ((n & (n - 1)) == 0) and n > 0
\ No newline at end of file
+    return ((n & (n - 1)) == 0) and n > 0
+
+
+def next_power2(n):
+    """Get the smallest power of two >= n."""
+    power = 1
+    while power < n:
+        power *= 2
+    return power
\ No newline at end of file
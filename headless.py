@@ -0,0 +1,49 @@
+#!/usr/bin/env python2
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""headless.py: run the simulation without display
+
+Runs scripted orders (see game.simulation.load_orders) for a number of
+ticks as fast as possible and reports the simulation speed."""
+
+import argparse
+
+from game.simulation import Simulation, load_orders
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('orders', help="file with scripted orders")
+    parser.add_argument('-n', '--ticks', type=int, default=1000,
+                        help="number of ticks to run (default 1000)")
+    parser.add_argument('-m', '--map', default='default',
+                        help="name of the map (default 'default')")
+    parser.add_argument('-t', '--tick-time', type=int, default=10,
+                        help="simulated milliseconds per tick (default 10)")
+    parser.add_argument('-p', '--path-mode', default=None,
+                        help="pathfinding mode (default depends on map size)")
+    parser.add_argument('-w', '--workers', type=int, default=0,
+                        help="number of path worker processes (default 0)")
+    parser.add_argument('-i', '--index', default='quadtree',
+                        help="spatial index of the objects "
+                             "(default 'quadtree')")
+    args = parser.parse_args()
+
+    sim = Simulation(args.map, args.tick_time, path_workers=args.workers,
+                     deterministic=True, path_mode=args.path_mode,
+                     spatial_index=args.index)
+    try:
+        elapsed = sim.run(args.ticks, load_orders(args.orders))
+    finally:
+        sim.shutdown()
+
+    print("%d ticks in %.3f s, %.1f ticks/s, %d objects"
+          % (sim.ticks, elapsed, sim.ticks / max(elapsed, 1e-9),
+             len(sim.objects.query(sim.map.size))))
+
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
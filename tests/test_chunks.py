@@ -0,0 +1,70 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""test_chunks.py: tests of the chunk cache of streamed maps"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from game import mapfile
+from game.chunks import ChunkCache
+from game.map import Map
+
+
+class ChunkCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        # 4 x 2 chunks of 32 x 32 tiles, the budget holds one of them
+        self.chunks = np.zeros((2, 4, 1, 32, 32), dtype=np.uint16)
+        self.cache = ChunkCache(self.chunks, 128, 64,
+                                self.chunks[0, 0].nbytes)
+
+    def test_changes_kept_beyond_budget(self):
+        changes = [(x, y, x + y + 1) for y in (1, 33)
+                   for x in (1, 40, 70, 100)]
+        for x, y, tile in changes:
+            self.cache.set_tile(x, y, tile)
+        for x, y, tile in changes:
+            self.assertEqual(self.cache.get_tile(x, y), tile)
+        # the file is not written to
+        self.assertFalse(self.chunks.any())
+
+    def test_unchanged_chunks_evicted(self):
+        self.cache.set_tile(1, 1, 5)
+        for x in (40, 70, 100):
+            self.cache.get_tile(x, 1)
+        self.assertEqual(len(self.cache), 2)
+        self.assertIn((0, 0), self.cache)
+        self.assertIn((3, 0), self.cache)
+
+
+class ChunkedMapTest(unittest.TestCase):
+
+    def setUp(self):
+        self.map_dir = tempfile.mkdtemp()
+        mapfile.write_map(os.path.join(self.map_dir, 'chunked' +
+                                       mapfile.EXTENSION),
+                          np.zeros((64, 128), dtype=np.uint16), 32)
+
+    def tearDown(self):
+        shutil.rmtree(self.map_dir)
+
+    def test_tiles_match_blocked(self):
+        game_map = Map(chunk_budget=32 * 32 * 2)
+        game_map.load('chunked', self.map_dir + os.sep)
+        for x, y in ((1, 1), (40, 1), (70, 40), (100, 63)):
+            game_map.set_tile(x, y, 1)
+        blocked = np.zeros((64, 128), dtype=bool)
+        for y in range(64):
+            for x in range(128):
+                blocked[y, x] = game_map.get_tile(x, y) in Map.BLOCKING_TILES
+        self.assertTrue((blocked == game_map.blocked.astype(bool)).all())
+
+
+if __name__ == '__main__':
+    unittest.main()
\ No newline at end of file
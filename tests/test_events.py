@@ -0,0 +1,81 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""test_events.py: tests of the internal event bus"""
+
+import unittest
+
+from game.events import EventManager
+
+
+class EventBusTest(unittest.TestCase):
+
+    def setUp(self):
+        self.events = EventManager()
+        # drop events left pending by other tests
+        self.events.dispatch()
+        self.received = []
+
+    def _subscribe(self, code):
+        self.events.subscribe(
+            code, lambda event: self.received.append(
+                (event.code, getattr(event, 'pos', None))))
+
+    def test_all_events_dispatched_in_order(self):
+        code = EventManager.new_event_code()
+        self._subscribe(code)
+        for x in range(3):
+            EventManager.post(code, pos=(x, 0))
+        self.assertEqual(self.received, [])
+
+        self.events.dispatch()
+        self.assertEqual(self.received,
+                         [(code, (0, 0)), (code, (1, 0)), (code, (2, 0))])
+
+    def test_coalesced_code_dispatches_last_event(self):
+        code = EventManager.new_event_code(coalesce=True)
+        other = EventManager.new_event_code()
+        self._subscribe(code)
+        self._subscribe(other)
+        EventManager.post(code, pos=(0, 0))
+        EventManager.post(other, pos=(1, 0))
+        EventManager.post(code, pos=(2, 0))
+        EventManager.post(code, pos=(3, 0))
+
+        self.events.dispatch()
+        self.assertEqual(self.received, [(other, (1, 0)), (code, (3, 0))])
+
+        # coalescing only spans events posted between two dispatches
+        EventManager.post(code, pos=(4, 0))
+        self.events.dispatch()
+        self.assertEqual(self.received[2:], [(code, (4, 0))])
+
+    def test_events_posted_by_subscribers_wait(self):
+        code = EventManager.new_event_code()
+        follow_up = EventManager.new_event_code()
+        self.events.subscribe(
+            code, lambda event: EventManager.post(follow_up, pos=event.pos))
+        self._subscribe(follow_up)
+        EventManager.post(code, pos=(5, 5))
+
+        self.events.dispatch()
+        self.assertEqual(self.received, [])
+        self.events.dispatch()
+        self.assertEqual(self.received, [(follow_up, (5, 5))])
+
+    def test_reused_events_are_cleared(self):
+        code = EventManager.new_event_code()
+        self._subscribe(code)
+        for _ in range(EventManager.EVENT_POOL_SIZE + 1):
+            EventManager.post(code, pos=(1, 1))
+        self.events.dispatch()
+        EventManager.post(code)
+
+        del self.received[:]
+        self.events.dispatch()
+        self.assertEqual(self.received, [(code, None)])
+
+
+if __name__ == '__main__':
+    unittest.main()
\ No newline at end of file
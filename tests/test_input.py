@@ -0,0 +1,78 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""test_input.py: tests of the mouse hot areas"""
+
+import unittest
+
+import pygame
+
+from game.events import EventManager
+from game.input import InputManager
+
+
+class HotAreaTest(unittest.TestCase):
+
+    def setUp(self):
+        self.input = InputManager(EventManager())
+        self.calls = []
+
+    def _set(self, name, area):
+        return self.input.set_hotarea(
+            area, self._call, {'name': name, 'what': 'enter'},
+            self._call, {'name': name, 'what': 'leave'})
+
+    def _call(self, name, what):
+        self.calls.append((what, name))
+
+    def _move(self, pos):
+        self.input._mouse_moved(pygame.event.Event(pygame.MOUSEMOTION,
+                                                   pos=pos))
+
+    def test_enter_and_leave(self):
+        # spans several index cells
+        self._set('a', (50, 50, 100, 100))
+        self._move((10, 10))
+        self.assertEqual(self.calls, [])
+
+        self._move((60, 60))
+        self._move((140, 140))
+        self.assertEqual(self.calls, [('enter', 'a')])
+
+        self._move((150, 60))
+        self._move((200, 200))
+        self.assertEqual(self.calls, [('enter', 'a'), ('leave', 'a')])
+
+    def test_overlapping_areas(self):
+        self._set('a', (0, 0, 100, 100))
+        self._set('b', (50, 0, 100, 100))
+        self._move((10, 10))
+        self._move((70, 10))
+        self._move((120, 10))
+        self.assertEqual(self.calls, [('enter', 'a'), ('enter', 'b'),
+                                      ('leave', 'a')])
+
+        del self.calls[:]
+        self._move((10, 10))
+        # leave callbacks before enter callbacks
+        self.assertEqual(self.calls, [('leave', 'b'), ('enter', 'a')])
+
+    def test_enter_without_leave_callback(self):
+        self.input.set_hotarea((0, 0, 10, 10), self._call,
+                               {'name': 'a', 'what': 'enter'})
+        self._move((5, 5))
+        self._move((20, 20))
+        self.assertEqual(self.calls, [('enter', 'a')])
+
+    def test_unset_area(self):
+        area_id = self._set('a', (0, 0, 100, 100))
+        self._move((10, 10))
+        self.input.unset_hotarea(area_id)
+        self._move((200, 200))
+        self._move((20, 20))
+        self.assertEqual(self.calls, [('enter', 'a')])
+
+
+if __name__ == '__main__':
+    unittest.main()
\ No newline at end of file
@@ -0,0 +1,93 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""test_management.py: tests of the spatial indexes"""
+
+import random
+import unittest
+
+import numpy as np
+from pygame import Rect
+
+from game.gameobjects.management import SPATIAL_INDEXES
+
+
+class _Object(object):
+    def __init__(self, bbox):
+        self.bbox = bbox
+
+
+def _locations(index):
+    """Get a copy of where index stores each object."""
+    if hasattr(index, '_cell_ranges'):
+        return dict(index._cell_ranges)
+    return dict(index._nodes)
+
+
+class MoveManyTest(unittest.TestCase):
+
+    def _move(self, index, objs, rng, distance):
+        positions = []
+        for obj in objs:
+            bbox = obj.bbox
+            positions.append(
+                (max(0, min(500 - bbox.width,
+                            bbox.x + rng.randint(-distance, distance))),
+                 max(0, min(500 - bbox.height,
+                            bbox.y + rng.randint(-distance, distance)))))
+        index.move_many(objs, np.array([obj.bbox.topleft for obj in objs]),
+                        np.array(positions),
+                        np.array([obj.bbox.size for obj in objs]))
+        for obj, position in zip(objs, positions):
+            self.assertEqual(obj.bbox.topleft, position)
+
+    def test_objects_where_they_belong(self):
+        rng = random.Random(1)
+        for name in sorted(SPATIAL_INDEXES):
+            index = SPATIAL_INDEXES[name](Rect(0, 0, 500, 500))
+            objs = []
+            for _ in range(300):
+                size = rng.choice((4, 16, 40))
+                obj = _Object(Rect(rng.randrange(500 - size),
+                                   rng.randrange(500 - size), size, size))
+                index.insert(obj)
+                objs.append(obj)
+            for distance in (1, 1, 3, 20, 200):
+                self._move(index, rng.sample(objs, 200), rng, distance)
+                # moving them one by one changes nothing
+                locations = _locations(index)
+                for obj in objs:
+                    index._moved(obj)
+                self.assertEqual(_locations(index), locations, name)
+
+                for _ in range(20):
+                    area = Rect(rng.randrange(450), rng.randrange(450),
+                                rng.randrange(1, 100), rng.randrange(1, 100))
+                    self.assertEqual(
+                        index.query_intersect(area),
+                        set(obj for obj in objs
+                            if obj.bbox.colliderect(area)), name)
+
+
+class BoundsTest(unittest.TestCase):
+
+    def test_objects_outside_refused(self):
+        # the quadtree root is padded to 128x64
+        bbox = Rect(0, 0, 100, 60)
+        for name in sorted(SPATIAL_INDEXES):
+            index = SPATIAL_INDEXES[name](bbox)
+            self.assertFalse(index.insert(_Object(Rect(98, 10, 4, 4))), name)
+            self.assertFalse(index.insert(_Object(Rect(10, 60, 4, 4))), name)
+            self.assertEqual(index.query(), set(), name)
+
+            obj = _Object(Rect(90, 50, 4, 4))
+            self.assertTrue(index.insert(obj), name)
+            self.assertFalse(index.move_to(obj, Rect(110, 50, 4, 4)), name)
+            self.assertEqual(obj.bbox, Rect(90, 50, 4, 4), name)
+            self.assertTrue(index.move_to(obj, Rect(96, 56, 4, 4)), name)
+            self.assertEqual(index.query_at((97, 57)), {obj}, name)
+
+
+if __name__ == '__main__':
+    unittest.main()
\ No newline at end of file
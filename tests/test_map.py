@@ -0,0 +1,222 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""test_map.py: tests of paths on maps that change"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+from pygame import Rect
+
+from game import mapfile
+from game.map import Map
+from game.gameobjects.gameobjects import Unit
+from game.gameobjects.management import ObjectManager
+from game.pathqueue import PathQueue
+
+
+class ChangingMapTest(unittest.TestCase):
+
+    def setUp(self):
+        self.map_dir = tempfile.mkdtemp()
+        mapfile.write_map(os.path.join(self.map_dir, 'open' +
+                                       mapfile.EXTENSION),
+                          np.zeros((64, 64), dtype=np.uint16))
+        self.map = Map(path_mode='hierarchical')
+        self.map.load('open', self.map_dir + os.sep)
+        self.objects = ObjectManager(self.map.size, self.map)
+
+    def tearDown(self):
+        shutil.rmtree(self.map_dir)
+
+    def _send_unit(self, destination):
+        """Send a unit from the top left to destination and let it move
+        for a while and return it."""
+        unit = self.objects.create(Unit, Rect(16, 16, 16, 16))
+        unit.send_to(destination)
+        route = self.map.path_cache.find_route(
+            self.map.pos_to_tile(unit.bbox.center),
+            self.map.pos_to_tile(destination))
+        # the last route segment lies in the cluster of the goal
+        self.assertEqual(route[-2], (48, 32))
+        for gametime in range(0, 500, 10):
+            self.objects.update(gametime)
+        self.assertTrue(unit.is_moving)
+        return unit
+
+    def _run(self, unit):
+        gametime = 500
+        while unit.is_active:
+            self.assertTrue(gametime < 100000)
+            self.objects.update(gametime)
+            gametime += 10
+
+    def test_route_blocked_ahead(self):
+        destination = (60 * 16 + 8, 40 * 16 + 8)
+        unit = self._send_unit(destination)
+        # a wall through the cluster of the goal cuts the last segment,
+        # which is not refined yet
+        for y in range(32, 48):
+            self.map.set_tile(55, y, 1)
+        self._run(unit)
+        self.assertEqual(unit.bbox.center, destination)
+
+    def test_goal_cut_off(self):
+        destination = (60 * 16 + 8, 40 * 16 + 8)
+        unit = self._send_unit(destination)
+        for x in range(57, 64):
+            self.map.set_tile(x, 37, 1)
+            self.map.set_tile(x, 43, 1)
+        for y in range(38, 43):
+            self.map.set_tile(57, y, 1)
+        self._run(unit)
+        self.assertNotEqual(unit.bbox.center, destination)
+        x, y = self.map.pos_to_tile(unit.bbox.center)
+        self.assertFalse(self.map.blocked[y, x])
+
+    def test_linear_route_blocked_ahead(self):
+        for mode in ('astar', 'jps', 'jps+'):
+            game_map = Map(path_mode=mode)
+            game_map.load('open', self.map_dir + os.sep)
+            destination = game_map.tile_center((60, 30))
+            waypoints = game_map.find_path(game_map.tile_center((2, 30)),
+                                           destination)
+            for y in range(8, 56):
+                game_map.set_tile(32, y, 1)
+            x, y = 2, 30
+            for waypoint in waypoints:
+                # waypoints are connected by straight or diagonal lines
+                to_x, to_y = game_map.pos_to_tile(waypoint)
+                while (x, y) != (to_x, to_y):
+                    x += (to_x > x) - (to_x < x)
+                    y += (to_y > y) - (to_y < y)
+                    self.assertFalse(game_map.blocked[y, x], mode)
+            self.assertEqual(waypoint, destination, mode)
+
+    def test_set_tile_clears_flow_fields(self):
+        destination = self.map.tile_center((60, 40))
+        field = self.map.flow_fields.get((60, 40))
+        self.assertIsNotNone(self.map.follow_flow_field((24, 24),
+                                                        destination))
+        self.assertIs(self.map.flow_fields.get((60, 40)), field)
+        self.map.set_tile(10, 10, 1)
+        self.assertIsNot(self.map.flow_fields.get((60, 40)), field)
+
+
+class MapFileTest(unittest.TestCase):
+
+    def setUp(self):
+        self.map_dir = tempfile.mkdtemp()
+        self.tiles = np.random.RandomState(1).randint(0, 4, (13, 21)) \
+            .astype(np.uint16)
+        self.text_path = os.path.join(self.map_dir, 'small.map')
+        fh = open(self.text_path, 'w')
+        try:
+            for row in self.tiles.tolist():
+                fh.write(' '.join(str(tile) for tile in row) + '\n')
+        finally:
+            fh.close()
+
+    def tearDown(self):
+        shutil.rmtree(self.map_dir)
+
+    def test_round_trip(self):
+        binary_path = mapfile.convert_text_map(self.text_path)
+        self.assertEqual(binary_path, os.path.join(
+            self.map_dir, 'small' + mapfile.EXTENSION))
+        self.assertEqual(mapfile.read_map_header(binary_path)[1:],
+                         (21, 13, 1, 0))
+        layers = mapfile.open_map(binary_path)
+        self.assertEqual(layers.shape, (1, 13, 21))
+        self.assertTrue((layers[0] == self.tiles).all())
+
+        game_map = Map()
+        game_map.load('small', self.map_dir + os.sep)
+        self.assertTrue((game_map.tiles == self.tiles).all())
+        # the tiles are read for pathfinding when it is first used
+        self.assertIsNone(game_map._pathfinder)
+        self.assertTrue((game_map.blocked == (self.tiles == 1)).all())
+
+    def test_chunked_round_trip(self):
+        binary_path = mapfile.convert_text_map(self.text_path, chunk_size=8)
+        chunks, tiles_x, tiles_y = mapfile.open_chunked_map(binary_path)
+        self.assertEqual((tiles_x, tiles_y), (21, 13))
+        self.assertEqual(chunks.shape, (2, 3, 1, 8, 8))
+
+        game_map = Map()
+        game_map.load('small', self.map_dir + os.sep)
+        self.assertIsNotNone(game_map.chunks)
+        self.assertTrue((game_map.tile_area(0, 0, 21, 13) ==
+                         self.tiles).all())
+        self.assertTrue((game_map.blocked == (self.tiles == 1)).all())
+
+
+class PathWorkersTest(unittest.TestCase):
+
+    def setUp(self):
+        self.map_dir = tempfile.mkdtemp()
+        tiles = np.zeros((32, 32), dtype=np.uint16)
+        tiles[:30, 16] = 1
+        for name, map_tiles in (('open', np.zeros_like(tiles)),
+                                ('wall', tiles)):
+            mapfile.write_map(os.path.join(self.map_dir, name +
+                                           mapfile.EXTENSION), map_tiles)
+        self.map = Map()
+        self.map.load('open', self.map_dir + os.sep)
+        self.map.start_path_workers(1)
+
+    def tearDown(self):
+        self.map.stop_path_workers()
+        shutil.rmtree(self.map_dir)
+
+    def _submit(self, queue, from_tile, to_tile):
+        return queue.submit(self.map.find_path_steps(
+            self.map.tile_center(from_tile), self.map.tile_center(to_tile)))
+
+    def _tiles(self, request):
+        return [self.map.pos_to_tile(waypoint)
+                for waypoint in request.waypoints]
+
+    def test_routes_after_edit(self):
+        queue = PathQueue(workers=self.map.path_workers)
+        request = self._submit(queue, (2, 2), (30, 2))
+        queue.process_all()
+        self.assertEqual(self._tiles(request), [(30, 2)])
+
+        # searched by the workers before the wall is built
+        request = self._submit(queue, (2, 12), (30, 12))
+        queue.process(float('inf'))
+        self.map.path_workers._batches[0][0].wait()
+        for y in range(30):
+            self.map.set_tile(16, y, 1)
+        later = self._submit(queue, (2, 2), (30, 2))
+        queue.process_all()
+        for tiles in (self._tiles(request), self._tiles(later)):
+            self.assertTrue(any(y >= 30 for x, y in tiles))
+
+    def test_load_keeps_workers(self):
+        workers = self.map.path_workers
+        queue = PathQueue(workers=workers)
+        self.map.load('wall', self.map_dir + os.sep)
+        self.assertIs(self.map.path_workers, workers)
+
+        # count the rounds, process_all does not poll the workers
+        rounds = []
+        process = queue.process
+        queue.process = lambda budget: rounds.append(process(budget))
+        request = queue.submit(self.map.find_path_steps(
+            self.map.tile_center((2, 2)), self.map.tile_center((30, 2))))
+        queue.process_all()
+        self.assertTrue(request.done)
+        self.assertTrue(len(rounds) <= 3)
+        # the route goes around the wall of the new map
+        self.assertTrue(any(self.map.pos_to_tile(waypoint)[1] >= 30
+                            for waypoint in list(request.waypoints)))
+
+
+if __name__ == '__main__':
+    unittest.main()
\ No newline at end of file
@@ -0,0 +1,91 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""test_pathcache.py: tests of the route cache"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from game import mapfile
+from game.map import Map
+from game.pathfinding import create_pathfinder, PathCache
+
+
+class PathCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.pathfinder = create_pathfinder(64, 64, 'astar')
+        for y in range(10, 50):
+            self.pathfinder.set_blocked(30, y)
+        self.cache = PathCache(self.pathfinder)
+
+    def _assert_walkable(self, route, from_coords, to_coords):
+        self.assertEqual(route[0], from_coords)
+        self.assertEqual(route[-1], to_coords)
+        for a, b in zip(route, route[1:]):
+            self.assertIsNotNone(self.pathfinder.refine(a, b))
+
+    def test_hit(self):
+        route = self.cache.find_route((2, 30), (60, 30))
+        self.assertEqual((self.cache.hits, self.cache.misses), (0, 1))
+        self.assertEqual(self.cache.find_route((2, 30), (60, 30)), route)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+        self.assertEqual(len(self.cache), 1)
+
+    def test_patched_hit(self):
+        self.cache.find_route((2, 30), (60, 30))
+        # other tiles in the start and goal regions of the cached route
+        route = self.cache.find_route((5, 26), (57, 31))
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+        self._assert_walkable(route, (5, 26), (57, 31))
+        self.assertEqual(len(self.cache), 1)
+
+    def test_miss_between_other_regions(self):
+        self.cache.find_route((2, 30), (60, 30))
+        route = self.cache.find_route((2, 2), (60, 30))
+        self.assertEqual((self.cache.hits, self.cache.misses), (0, 2))
+        self._assert_walkable(route, (2, 2), (60, 30))
+        self.assertEqual(len(self.cache), 2)
+
+
+class InvalidateTest(unittest.TestCase):
+
+    def setUp(self):
+        self.map_dir = tempfile.mkdtemp()
+        mapfile.write_map(os.path.join(self.map_dir, 'open' +
+                                       mapfile.EXTENSION),
+                          np.zeros((64, 64), dtype=np.uint16))
+        self.map = Map(path_mode='astar')
+        self.map.load('open', self.map_dir + os.sep)
+
+    def tearDown(self):
+        shutil.rmtree(self.map_dir)
+
+    def test_set_tile_drops_crossing_routes(self):
+        cache = self.map.path_cache
+        cache.find_route((2, 30), (60, 30))
+        cache.find_route((2, 2), (20, 2))
+        self.map.set_tile(32, 30, 1)
+        # only the route through the changed tile is dropped
+        self.assertEqual(len(cache), 1)
+        cache.find_route((2, 2), (20, 2))
+        self.assertEqual(cache.hits, 1)
+        route = cache.find_route((2, 30), (60, 30))
+        self.assertEqual(cache.hits, 1)
+        self.assertNotIn((32, 30), route)
+
+    def test_walkability_unchanged(self):
+        cache = self.map.path_cache
+        cache.find_route((2, 30), (60, 30))
+        self.map.set_tile(32, 30, 2)
+        cache.find_route((2, 30), (60, 30))
+        self.assertEqual(cache.hits, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
\ No newline at end of file
@@ -0,0 +1,154 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""test_pathfinding.py: tests of path searches"""
+
+import random
+import unittest
+
+from game.pathfinding import create_pathfinder, FlowField, FlowFieldCache, \
+    octile_dist, PathCache, PATH_MODES, SEARCHING
+
+
+def _route_cost(route):
+    return sum(octile_dist(a[0], a[1], b[0], b[1])
+               for a, b in zip(route, route[1:]))
+
+
+class JumpTableTest(unittest.TestCase):
+
+    def test_same_costs_as_astar(self):
+        rng = random.Random(1)
+        for corner_cutting in (False, True):
+            astar = create_pathfinder(40, 30, 'astar', corner_cutting)
+            jump = create_pathfinder(40, 30, 'jps+', corner_cutting)
+            blocked = bytearray(rng.random() < 0.25 for _ in range(1200))
+            astar.set_all_blocked(blocked)
+            jump.set_all_blocked(blocked)
+            for _ in range(50):
+                from_tile = (rng.randrange(40), rng.randrange(30))
+                to_tile = (rng.randrange(40), rng.randrange(30))
+                route = astar.find_route(from_tile, to_tile)
+                jump_route = jump.find_route(from_tile, to_tile)
+                if route is None:
+                    self.assertIsNone(jump_route)
+                else:
+                    self.assertEqual(_route_cost(jump_route),
+                                     _route_cost(route))
+            # the tables are rebuilt after a change
+            astar.set_all_blocked(bytearray(1200))
+            jump.set_all_blocked(bytearray(1200))
+            jump.find_route((0, 0), (39, 0))
+            for y in range(1, 30):
+                astar.set_blocked(20, y)
+                jump.set_blocked(20, y)
+            self.assertEqual(
+                _route_cost(jump.find_route((0, 29), (39, 29))),
+                _route_cost(astar.find_route((0, 29), (39, 29))))
+
+    def test_tables_built_in_steps(self):
+        pathfinder = create_pathfinder(64, 64, 'jps+')
+        pathfinder.find_route((0, 0), (63, 63))
+        pathfinder.set_blocked(10, 20)
+        steps = list(pathfinder.route_steps((0, 0), (63, 63), 100000))
+        # at least one pause for each direction
+        self.assertTrue(len(steps) > 8)
+        self.assertTrue(all(step is SEARCHING for step in steps[:-1]))
+        self.assertEqual(steps[-1], pathfinder.find_route((0, 0), (63, 63)))
+
+
+class ResumableSearchTest(unittest.TestCase):
+
+    def test_tiles_changed_while_paused(self):
+        for mode in sorted(PATH_MODES):
+            pathfinder = create_pathfinder(64, 64, mode)
+            for y in range(8, 56):
+                pathfinder.set_blocked(32, y)
+            steps = pathfinder.route_steps((2, 30), (60, 30), 1)
+            self.assertIs(next(steps), SEARCHING, mode)
+            pathfinder.set_blocked(20, 2)
+            for route in steps:
+                pass
+            self.assertEqual(route[0], (2, 30), mode)
+            self.assertEqual(route[-1], (60, 30), mode)
+
+    def test_route_avoids_tiles_blocked_while_paused(self):
+        for mode in sorted(PATH_MODES):
+            pathfinder = create_pathfinder(64, 64, mode)
+            cache = PathCache(pathfinder)
+            steps = cache.route_steps((2, 30), (60, 30), 1)
+            self.assertIs(next(steps), SEARCHING, mode)
+            # a wall next to the start and one across the map
+            for y in range(8, 56):
+                pathfinder.set_blocked(3, y)
+                pathfinder.set_blocked(32, y)
+            for route in steps:
+                pass
+            for a, b in zip(route, route[1:]):
+                segment = pathfinder.refine(a, b)
+                self.assertIsNotNone(segment, mode)
+                for x, y in segment:
+                    self.assertFalse(pathfinder.is_blocked(x, y), mode)
+            if pathfinder.LINEAR_SEGMENTS:
+                self.assertEqual(
+                    _route_cost(route),
+                    _route_cost(pathfinder.find_route((2, 30), (60, 30))),
+                    mode)
+            self.assertEqual(cache.find_route((2, 30), (60, 30)), route,
+                             mode)
+
+    def test_flow_field_steps(self):
+        pathfinder = create_pathfinder(64, 64)
+        field = FlowField(pathfinder, (60, 60))
+        steps = list(field.expand_steps((2, 2), 16))
+        self.assertTrue(len(steps) > 1)
+        self.assertTrue(all(step is SEARCHING for step in steps))
+        self.assertEqual(list(field.expand_steps((2, 2), 16)), [])
+        self.assertTrue(field.reachable((2, 2)))
+
+
+class FlowFieldTest(unittest.TestCase):
+
+    def test_follow_to_goal(self):
+        rng = random.Random(2)
+        for corner_cutting in (False, True):
+            pathfinder = create_pathfinder(40, 30, 'astar', corner_cutting)
+            pathfinder.set_all_blocked(
+                bytearray(rng.random() < 0.25 for _ in range(1200)))
+            goal = (20, 15)
+            pathfinder.set_blocked(*goal, blocked=False)
+            field = FlowField(pathfinder, goal)
+            for _ in range(40):
+                tile = (rng.randrange(40), rng.randrange(30))
+                route = pathfinder.find_route(tile, goal)
+                if route is None:
+                    self.assertFalse(field.reachable(tile))
+                    continue
+                self.assertTrue(field.reachable(tile))
+                path = [tile]
+                while tile != goal:
+                    dx, dy = field.direction(tile)
+                    tile = (tile[0] + dx, tile[1] + dy)
+                    # a step A* could take, too
+                    self.assertIsNotNone(pathfinder.refine(path[-1], tile))
+                    path.append(tile)
+                    self.assertTrue(len(path) <= 1200)
+                self.assertIsNone(field.direction(goal))
+                self.assertEqual(_route_cost(path), _route_cost(route))
+
+    def test_cache_evicts_least_recently_used(self):
+        cache = FlowFieldCache(create_pathfinder(16, 16), capacity=2)
+        first = cache.get((1, 1))
+        second = cache.get((2, 2))
+        self.assertIs(cache.get((1, 1)), first)
+        third = cache.get((3, 3))
+        self.assertIs(cache.get((1, 1)), first)
+        self.assertIs(cache.get((3, 3)), third)
+        self.assertIsNot(cache.get((2, 2)), second)
+        cache.clear()
+        self.assertIsNot(cache.get((1, 1)), first)
+
+
+if __name__ == '__main__':
+    unittest.main()
\ No newline at end of file